@@ -1,9 +1,14 @@
+import weakref
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from typing import Literal
 
 from loguru import logger
-from reader import Reader, TagNotFoundError
+from reader import Entry, Reader, TagNotFoundError
+from reader.types import EntryLike
+
+# How to attach videos: the MP4, a GIF, or the MP4 if it is small enough and a GIF otherwise
+MediaMode = Literal["auto", "mp4", "gif"]
 
 
 @dataclass
@@ -25,6 +30,12 @@ class Group:
     send_as_text: bool = False
     send_as_text_username: bool = True
 
+    # Put embeds for several tweets in the same message when they are sent at the same time
+    pack_embeds: bool = False
+
+    # How to attach videos and GIFs in embeds
+    media_mode: MediaMode = "auto"
+
     # Translate settings
     translate: bool = False
     translate_to: str = "en-GB"
@@ -50,15 +61,23 @@ class Group:
     created_at: str = field(default_factory=lambda: datetime.now(tz=timezone.utc).isoformat())
 
 
-@dataclass
+@dataclass(frozen=True)
 class ApplicationSettings:
-    """Settings for the application."""
+    """Settings for the application.
+
+    The settings are read for every tweet, so they are kept in memory and can't be changed. Save new settings with
+    set_app_settings() instead.
+    """
 
-    # TODO: Grab every instance from https://github.com/zedeus/nitter/wiki/Instances and use a different one each
-    #  time we check for new tweets.
     # The Nitter instance where we will get the RSS feed from
     nitter_instance: str = "https://nitter.lovinator.space"
 
+    # Other Nitter instances to spread the requests over, feeds are still stored with nitter_instance
+    nitter_instances: tuple[str, ...] = ()
+
+    # Also ask another Nitter instance when one is slow to answer
+    hedge_requests: bool = False
+
     # DeepL API key used for translating tweets
     deepl_auth_key: str = ""
 
@@ -68,30 +87,138 @@ class ApplicationSettings:
     # Teddit/Libreddit instance if the user wants to replace Reddit links
     teddit_instance: str = "https://teddit.net"
 
-    # Delay between checking for new tweets in minutes
+    # Delay between checking for new tweets in minutes. Feeds are checked less often if the account doesn't
+    # tweet much, but never less often than every max_delay minutes.
     delay: int = 10
+    max_delay: int = 6 * 60
+
+    # How much disk space downloaded videos and converted GIFs can use, in megabytes
+    media_cache_size: int = 500
+
+    # The biggest video or GIF we attach, in megabytes. Discord allows 25 MB unless the server is boosted.
+    upload_limit: int = 25
+
+    # Where videos are downloaded and converted, for example a tmpfs. Empty for the temporary directory.
+    media_workspace: str = ""
+
+    # How much disk space videos that are being converted can use, in megabytes
+    media_workspace_quota: int = 1024
+
+    # How much space translations from DeepL can use, in megabytes
+    translation_cache_size: int = 50
 
     def __post_init__(self: "ApplicationSettings") -> None:
         """Don't allow trailing slashes."""
-        self.nitter_instance = self.nitter_instance.rstrip("/")
-        self.piped_instance = self.piped_instance.rstrip("/")
-        self.teddit_instance = self.teddit_instance.rstrip("/")
+        instances: tuple[str, ...] = tuple(
+            instance.rstrip("/") for instance in self.nitter_instances if instance.strip()
+        )
+        object.__setattr__(self, "nitter_instance", self.nitter_instance.rstrip("/"))
+        object.__setattr__(self, "nitter_instances", instances)
+        object.__setattr__(self, "piped_instance", self.piped_instance.rstrip("/"))
+        object.__setattr__(self, "teddit_instance", self.teddit_instance.rstrip("/"))
+
+
+@dataclass
+class Watermark:
+    """Where we are in a feed: the oldest entry from before we followed it and the newest entry we have delivered."""
+
+    # When the newest entry we have delivered was published, as an ISO 8601 string
+    published: str = ""
+
+    # The ID of the newest entry we have delivered
+    entry_id: str = ""
+
+    # When the oldest entry in the feed was published the first time we checked it. Older entries are history from
+    # before we followed the account, and are never sent.
+    oldest: str = ""
+
+    def is_history(self: "Watermark", entry: Entry | EntryLike) -> bool:
+        """Check if the entry was published before the oldest entry we saw when we started following the feed."""
+        return entry_published(entry) < datetime.fromisoformat(self.oldest)
+
+    def is_newest(self: "Watermark", entry: Entry | EntryLike) -> bool:
+        """Check if the entry is the newest entry we have delivered."""
+        return entry.id == self.entry_id
+
+    def is_newer(self: "Watermark", entry: Entry | EntryLike) -> bool:
+        """Check if the entry was published after the newest entry we have delivered.
+
+        Retweets have the date of the tweet they retweet, and a Nitter instance can be behind the others, so entries
+        that are not newer are still sent.
+        """
+        return entry_published(entry) > datetime.fromisoformat(self.published)
+
+
+def entry_published(entry: Entry | EntryLike) -> datetime:
+    """Get when the entry was published, or when we first saw it if the feed doesn't say."""
+    published: datetime = entry.published or entry.updated or entry.added
+    return published if published.tzinfo else published.replace(tzinfo=timezone.utc)
+
+
+def get_watermark(reader: Reader, feed_url: str) -> Watermark | None:
+    """Get where we are in a feed.
+
+    Feeds from before watermarks existed get one from their read entries.
+
+    Returns:
+        The watermark, or None if we haven't delivered anything from the feed yet.
+    """
+    try:
+        watermark = Watermark(**reader.get_tag(feed_url, "watermark"))
+    except TagNotFoundError:
+        watermark = Watermark()
+
+    if watermark.published and watermark.oldest:
+        return watermark
+
+    # Only done once for every feed, the watermark is saved
+    read_entries: list[Entry] = sorted(reader.get_entries(feed=feed_url, read=True), key=entry_published)
+    if not read_entries:
+        return None
+
+    if not watermark.published:
+        watermark.published = entry_published(read_entries[-1]).isoformat()
+        watermark.entry_id = read_entries[-1].id
+    watermark.oldest = entry_published(read_entries[0]).isoformat()
+    set_watermark(reader, feed_url, watermark)
+    return watermark
+
+
+def set_watermark(reader: Reader, feed_url: str, watermark: Watermark) -> None:
+    """Set the newest entry we have delivered for a feed."""
+    reader.set_tag(feed_url, "watermark", watermark.__dict__)
+    logger.debug("Saved watermark for {}: {}", feed_url, watermark)
+
+
+# The application settings in memory for every reader, so we don't read them from the database for every tweet
+_app_settings: weakref.WeakKeyDictionary[Reader, ApplicationSettings] = weakref.WeakKeyDictionary()
 
 
 def get_app_settings(reader: Reader) -> ApplicationSettings:
-    """Get the application settings."""
+    """Get the application settings.
+
+    They are read from the database the first time and then kept in memory, set_app_settings() replaces them.
+    """
+    app_settings: ApplicationSettings | None = _app_settings.get(reader)
+    if app_settings is not None:
+        return app_settings
+
     try:
-        app_settings = reader.get_tag((), "app_settings")
+        app_settings = ApplicationSettings(**reader.get_tag((), "app_settings"))
     except TagNotFoundError:
         logger.info("Applying default application settings. You can change these in the Settings menu.")
-        set_app_settings(reader, ApplicationSettings())
-        return ApplicationSettings()
-    return ApplicationSettings(**app_settings)
+        app_settings = ApplicationSettings()
+        set_app_settings(reader, app_settings)
+        return app_settings
+
+    _app_settings[reader] = app_settings
+    return app_settings
 
 
 def set_app_settings(reader: Reader, app_settings: ApplicationSettings) -> None:
     """Set the application settings."""
     reader.set_tag((), "app_settings", app_settings.__dict__)
+    _app_settings[reader] = app_settings
     logger.debug("Saved application settings: {}", app_settings)
 
 
@@ -109,6 +236,8 @@ def get_group(reader: Reader, uuid: str) -> Group:
             send_replies=group.get("send_replies", Group.send_replies),
             only_send_if_media=group.get("only_send_if_media", Group.only_send_if_media),
             send_as_embed=group.get("send_as_embed", Group.send_as_embed),
+            pack_embeds=group.get("pack_embeds", Group.pack_embeds),
+            media_mode=group.get("media_mode", Group.media_mode),
             send_as_link=group.get("send_as_link", Group.send_as_link),
             send_as_text=group.get("send_as_text", Group.send_as_text),
             send_as_text_username=group.get("send_as_text_username", Group.send_as_text_username),
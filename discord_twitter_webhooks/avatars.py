@@ -0,0 +1,151 @@
+import functools
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+from reader import FeedNotFoundError, Reader, TagNotFoundError
+
+from discord_twitter_webhooks.nitter_pool import replace_content
+
+if TYPE_CHECKING:
+    import requests
+
+# Used when we don't know the avatar of the account
+DEFAULT_AVATAR: str = "https://pbs.twimg.com/profile_images/1354479643882004483/Btnfm47p_400x400.jpg"
+
+# How long an avatar is used before we get it again. Stale avatars are still used while we get the new one.
+AVATAR_TTL: timedelta = timedelta(hours=24)
+
+# The avatar is the image of the channel, which comes before the first item in the feed
+_AVATAR_PATTERN: re.Pattern[bytes] = re.compile(rb"<image>.*?<url>\s*(.*?)\s*</url>", re.DOTALL)
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="avatar")
+_refreshing: set[str] = set()
+_refreshing_lock = threading.Lock()
+
+
+@dataclass
+class Avatar:
+    """The avatar of the account a feed is for."""
+
+    url: str = ""
+
+    # When we last saw the avatar in the feed, as an ISO 8601 string
+    fetched_at: str = ""
+
+    def stale(self: "Avatar", now: datetime) -> bool:
+        """Check if we should get the avatar again."""
+        return now - datetime.fromisoformat(self.fetched_at) > AVATAR_TTL
+
+
+def find_avatar(content: bytes) -> str | None:
+    """Find the avatar in an RSS feed from Nitter."""
+    first_item: int = content.find(b"<item>")
+    found: re.Match[bytes] | None = _AVATAR_PATTERN.search(content, 0, first_item if first_item != -1 else len(content))
+    return found.group(1).decode("utf-8", errors="replace") if found else None
+
+
+def get_stored_avatar(reader: Reader, feed_url: str) -> Avatar | None:
+    """Get the avatar we have stored for a feed."""
+    try:
+        return Avatar(**reader.get_tag(feed_url, "avatar"))
+    except TagNotFoundError:
+        return None
+
+
+def set_stored_avatar(reader: Reader, feed_url: str, avatar_url: str) -> None:
+    """Store the avatar for a feed, unless we already have it and it isn't getting old."""
+    now: datetime = datetime.now(tz=timezone.utc)
+    stored: Avatar | None = get_stored_avatar(reader, feed_url)
+    if stored and stored.url == avatar_url and now - datetime.fromisoformat(stored.fetched_at) < AVATAR_TTL / 2:
+        return
+
+    reader.set_tag(feed_url, "avatar", Avatar(url=avatar_url, fetched_at=now.isoformat()).__dict__)
+    logger.debug("Saved avatar for {}: {}", feed_url, avatar_url)
+
+
+def _capture_avatar(
+    reader: Reader,
+    session: "requests.Session",  # noqa: ARG001
+    response: "requests.Response",
+    request: "requests.Request",
+    **kwargs: Any,  # noqa: ANN401, ARG001
+) -> None:
+    """Store the avatar from a feed reader just fetched, so we don't have to get the feed again for it."""
+    if response.status_code != 200:  # noqa: PLR2004
+        return
+
+    # Read the whole feed and give reader a copy, it reads the response after us.
+    content: bytes = response.content
+    replace_content(response, content)
+
+    avatar_url: str | None = find_avatar(content)
+    if not avatar_url:
+        return
+
+    try:
+        set_stored_avatar(reader, request.url, avatar_url)
+    except FeedNotFoundError:
+        # Not a feed, for example when refreshing an avatar for a feed that was removed
+        return
+
+
+def avatar_plugin(reader: Reader) -> None:
+    """Reader plugin that stores the avatar from every feed we fetch."""
+    reader._parser.session_factory.response_hooks.append(functools.partial(_capture_avatar, reader))  # noqa: SLF001
+
+
+def refresh_avatar(reader: Reader, feed_url: str) -> None:
+    """Fetch the feed so the avatar plugin stores its avatar.
+
+    The feed is only fetched, not updated, so new tweets are still found by the next update.
+    """
+    try:
+        with reader._parser.session_factory.transient() as session:  # noqa: SLF001
+            session.get(feed_url, stream=True).close()
+    except Exception as e:  # noqa: BLE001
+        logger.error("Failed to get the avatar for {}: {}", feed_url, e)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(feed_url)
+
+
+def refresh_avatar_in_background(reader: Reader, feed_url: str) -> None:
+    """Refresh the avatar without waiting for it, unless we are already doing it."""
+    with _refreshing_lock:
+        if feed_url in _refreshing:
+            return
+        _refreshing.add(feed_url)
+    _refresh_executor.submit(refresh_avatar, reader, feed_url)
+
+
+def get_avatar(reader: Reader, feed_url: str) -> str:
+    """Get the avatar of the account a feed is for.
+
+    The avatar is stored when reader fetches the feed. If it is old we still use it, and get the feed again in
+    the background.
+
+    Args:
+        reader: The reader which contains the feed.
+        feed_url: The URL of the feed.
+
+    Returns:
+        The URL of the avatar.
+    """
+    avatar: Avatar | None = get_stored_avatar(reader, feed_url)
+    if avatar is None:
+        # We have never seen the avatar, so we have to wait for it
+        with _refreshing_lock:
+            _refreshing.add(feed_url)
+        refresh_avatar(reader, feed_url)
+        avatar = get_stored_avatar(reader, feed_url)
+        return avatar.url if avatar else DEFAULT_AVATAR
+
+    if avatar.stale(datetime.now(tz=timezone.utc)):
+        refresh_avatar_in_background(reader, feed_url)
+
+    return avatar.url
@@ -0,0 +1,112 @@
+import statistics
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any
+
+from loguru import logger
+
+# How many feeds we fetch at the same time when we start, and the limits for it
+INITIAL_CONCURRENCY: int = 4
+MIN_CONCURRENCY: int = 1
+MAX_CONCURRENCY: int = 32
+
+# Back off if more than this many of the requests in a window were rate limited or failed on the server
+MAX_ERROR_RATE: float = 0.05
+
+# Back off if the median latency in a window is this many times the normal latency
+MAX_LATENCY_INCREASE: float = 2.0
+
+# How much the normal latency moves towards the latency of a healthy window
+BASELINE_WEIGHT: float = 0.1
+
+
+@dataclass
+class Window:
+    """The requests that finished since we last changed the concurrency."""
+
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+
+class ConcurrencyController:
+    """Choose how many feeds to fetch at the same time.
+
+    This is additive increase, multiplicative decrease like TCP congestion control. After every window of requests
+    we fetch one more feed at the same time if the latency and error rate stayed the same. If Nitter starts rate
+    limiting us or failing, we halve the concurrency, and if it gets slower we reduce it by a quarter.
+    """
+
+    def __init__(
+        self: "ConcurrencyController",
+        level: int = INITIAL_CONCURRENCY,
+        min_level: int = MIN_CONCURRENCY,
+        max_level: int = MAX_CONCURRENCY,
+    ) -> None:
+        """Create the controller.
+
+        Args:
+            level: How many feeds to fetch at the same time to start with.
+            min_level: The lowest concurrency.
+            max_level: The highest concurrency.
+        """
+        self.lock = threading.Lock()
+        self.level: int = level
+        self.min_level: int = min_level
+        self.max_level: int = max_level
+        self.reason: str = "Starting value"
+
+        # Median latency of healthy windows, in seconds
+        self.baseline: float | None = None
+        self.window = Window()
+
+    def record(self: "ConcurrencyController", latency: float, *, overloaded: bool) -> None:
+        """Record a finished feed update and change the concurrency if a window is complete.
+
+        Args:
+            latency: How long the update took, in seconds.
+            overloaded: If Nitter rate limited us, failed on the server or didn't answer.
+        """
+        with self.lock:
+            self.window.latencies.append(latency)
+            self.window.errors += overloaded
+            if len(self.window.latencies) >= self.level:
+                self._adjust()
+
+    def _adjust(self: "ConcurrencyController") -> None:
+        """Change the concurrency from the window that just finished."""
+        error_rate: float = self.window.errors / len(self.window.latencies)
+        latency: float = statistics.median(self.window.latencies)
+        self.window = Window()
+        old_level: int = self.level
+
+        if error_rate > MAX_ERROR_RATE:
+            self.level = max(self.level // 2, self.min_level)
+            self.reason = f"{error_rate:.0%} of requests were rate limited or failed"
+        elif self.baseline is not None and latency > self.baseline * MAX_LATENCY_INCREASE:
+            self.level = max(self.level * 3 // 4, self.min_level)
+            self.reason = f"Median latency went up from {self.baseline:.2f} to {latency:.2f} seconds"
+        else:
+            self.baseline = (
+                latency if self.baseline is None else (1 - BASELINE_WEIGHT) * self.baseline + BASELINE_WEIGHT * latency
+            )
+            self.level = min(self.level + 1, self.max_level)
+            self.reason = f"Healthy, median latency {latency:.2f} seconds"
+
+        if self.level != old_level:
+            logger.debug("Fetching {} feeds at the same time: {}", self.level, self.reason)
+
+    def stats(self: "ConcurrencyController") -> dict[str, Any]:
+        """Get the current concurrency and why we chose it."""
+        with self.lock:
+            return {
+                "level": self.level,
+                "reason": self.reason,
+                "baseline_latency": round(self.baseline, 3) if self.baseline is not None else None,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_concurrency_controller() -> ConcurrencyController:
+    """Get the controller for feed updates, it keeps what it learned between checks."""
+    return ConcurrencyController()
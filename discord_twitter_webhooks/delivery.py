@@ -0,0 +1,177 @@
+import asyncio
+import json
+import threading
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Any
+
+import httpx
+from loguru import logger
+
+from discord_twitter_webhooks.ratelimit import RateLimiter
+
+# How many requests to Discord we can have in flight at the same time
+MAX_CONCURRENT_REQUESTS: int = 10
+
+# How many times we send a message again if Discord rate limits us
+MAX_RATE_LIMIT_RETRIES: int = 5
+
+# HTTP/2 needs the h2 package, install httpx[http2] to get it.
+HTTP2_AVAILABLE: bool = find_spec("h2") is not None
+
+
+class DeliveryEngine:
+    """Send webhooks to Discord from a background event loop.
+
+    Every request goes through the same HTTP client, so connections to Discord are kept alive and reused instead
+    of doing a new TLS handshake for every webhook.
+    """
+
+    def __init__(
+        self: "DeliveryEngine",
+        max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        """Start the event loop in a background thread and create the HTTP client.
+
+        Args:
+            max_concurrent_requests: How many requests we can have in flight at the same time.
+            transport: How the HTTP client sends requests, None for the network.
+        """
+        self.loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="delivery", daemon=True)
+        self.thread.start()
+
+        self.max_concurrent_requests: int = max_concurrent_requests
+        self.client: httpx.AsyncClient = self.run(self._create_client(transport))
+        self.semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self.rate_limiter = RateLimiter()
+
+        logger.debug("Started delivery engine (HTTP/2: {})", HTTP2_AVAILABLE)
+
+    async def _create_client(self: "DeliveryEngine", transport: httpx.AsyncBaseTransport | None) -> httpx.AsyncClient:
+        """Create the HTTP client inside the event loop."""
+        return httpx.AsyncClient(
+            transport=transport,
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(30, connect=10),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrent_requests,
+                max_keepalive_connections=self.max_concurrent_requests,
+            ),
+        )
+
+    def run(self: "DeliveryEngine", coroutine: Any) -> Any:  # noqa: ANN401
+        """Run a coroutine on the event loop and wait for the result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def post(
+        self: "DeliveryEngine",
+        url: str,
+        payload: dict[str, Any],
+        files: dict[str, tuple[str | None, bytes | str]],
+    ) -> httpx.Response:
+        """Send a message to a webhook.
+
+        We wait for the rate limit before sending, and if Discord still rate limits us we retry a few times.
+
+        Args:
+            url: The webhook URL.
+            payload: The JSON data of the message.
+            files: Files to attach, in the same format as DiscordWebhook.files.
+
+        Returns:
+            The response from Discord.
+        """
+        for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+            await self.rate_limiter.acquire(url)
+            try:
+                response: httpx.Response = await self._send(url, payload, files)
+            except httpx.HTTPError:
+                self.rate_limiter.update(url, None, {})
+                raise
+
+            body: dict[str, Any] | None = None
+            if response.status_code == 429 and "json" in response.headers.get("Content-Type", ""):  # noqa: PLR2004
+                body = response.json()
+            self.rate_limiter.update(url, response.status_code, response.headers, body)
+
+            if response.status_code != 429:  # noqa: PLR2004
+                break
+
+        return response
+
+    async def _send(
+        self: "DeliveryEngine",
+        url: str,
+        payload: dict[str, Any],
+        files: dict[str, tuple[str | None, bytes | str]],
+    ) -> httpx.Response:
+        """Send the request to Discord."""
+        async with self.semaphore:
+            if not files:
+                return await self.client.post(url, json=payload, params={"wait": True})
+
+            return await self.client.post(
+                url,
+                data={"payload_json": json.dumps(payload)},
+                files={name: (filename, content) for name, (filename, content) in files.items()},
+            )
+
+    async def post_many(
+        self: "DeliveryEngine",
+        requests: list[tuple[str, dict[str, Any], dict[str, tuple[str | None, bytes | str]]]],
+    ) -> list[httpx.Response | Exception]:
+        """Send the messages to different webhooks at the same time, and to the same webhook one after another.
+
+        Messages to the same webhook are sent in the order they are given, so they show up in that order in Discord
+        even if the rate limit would allow sending them at the same time.
+        """
+        responses: list[httpx.Response | Exception] = [httpx.TransportError("Not sent")] * len(requests)
+        webhooks: dict[str, list[int]] = {}
+        for index, (url, _, _) in enumerate(requests):
+            webhooks.setdefault(url, []).append(index)
+
+        async def post_in_order(indexes: list[int]) -> None:
+            for index in indexes:
+                url, payload, files = requests[index]
+                try:
+                    responses[index] = await self.post(url, payload, files)
+                except Exception as e:  # noqa: BLE001
+                    responses[index] = e
+
+        await asyncio.gather(*(post_in_order(indexes) for indexes in webhooks.values()))
+        return responses
+
+    def post_batch(
+        self: "DeliveryEngine",
+        requests: list[tuple[str, dict[str, Any], dict[str, tuple[str | None, bytes | str]]]],
+    ) -> list[httpx.Response | Exception]:
+        """Send the messages to their webhooks.
+
+        Args:
+            requests: The webhook URL, the JSON data and the files for every message.
+
+        Returns:
+            The response, or the exception we got, for each message.
+        """
+        return self.run(self.post_many(requests))
+
+    def close(self: "DeliveryEngine") -> None:
+        """Close the HTTP client and stop the event loop."""
+        self.run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+@lru_cache(maxsize=1)
+def get_delivery_engine() -> DeliveryEngine:
+    """Get the delivery engine, it is created the first time we send something."""
+    return DeliveryEngine()
+
+
+def close_delivery_engine() -> None:
+    """Close the delivery engine if it has been started."""
+    if get_delivery_engine.cache_info().currsize:
+        get_delivery_engine().close()
+        get_delivery_engine.cache_clear()
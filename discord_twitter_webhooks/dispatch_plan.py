@@ -0,0 +1,39 @@
+from functools import lru_cache
+
+from loguru import logger
+from reader import Reader
+
+from discord_twitter_webhooks._dataclasses import Group, get_group
+
+
+@lru_cache(maxsize=1)
+def get_dispatch_plan(reader: Reader) -> dict[str, list[Group]]:
+    """Get what groups every RSS feed should be sent to.
+
+    The groups are decoded from the tags once and then kept in memory until invalidate_dispatch_plan() is called,
+    this is done when a group or the application settings are changed.
+
+    Args:
+        reader: The reader which contains the groups.
+
+    Returns:
+        A dict with the RSS feed URL as key and the groups that subscribe to it as value.
+    """
+    dispatch_plan: dict[str, list[Group]] = {}
+    for _group in reader.get_tag((), "groups", []):
+        group = get_group(reader, str(_group))
+        if not group:
+            logger.error("Group {} not found", _group)
+            continue
+
+        # dict.fromkeys() removes duplicates while keeping the order
+        for rss_feed in dict.fromkeys(group.rss_feeds):
+            dispatch_plan.setdefault(rss_feed, []).append(group)
+
+    logger.debug("Built dispatch plan for {} feeds", len(dispatch_plan))
+    return dispatch_plan
+
+
+def invalidate_dispatch_plan() -> None:
+    """Throw away the dispatch plan so it is rebuilt the next time we send to Discord."""
+    get_dispatch_plan.cache_clear()
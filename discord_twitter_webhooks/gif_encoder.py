@@ -0,0 +1,160 @@
+import math
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+# The most frames per second and the widest GIF we make, more than this only makes the GIF bigger
+MAX_GIF_FPS: float = 15
+MAX_GIF_WIDTH: int = 480
+
+# We don't go below this to make the GIF fit, it would be unwatchable
+MIN_GIF_FPS: float = 6
+MIN_GIF_WIDTH: int = 160
+
+# Palette sizes we try, fewer colors compress better
+GIF_COLORS: tuple[int, ...] = (256, 128, 64, 32)
+
+# How many bytes a pixel in a frame takes with a 256 color palette, before we have measured a GIF of the video
+ESTIMATED_BYTES_PER_PIXEL: float = 0.3
+
+# Aim a bit below the limit, the estimate is not exact
+BUDGET_MARGIN: float = 0.9
+
+# How many times we encode a video before giving up
+MAX_ENCODE_ATTEMPTS: int = 3
+
+
+@dataclass(frozen=True)
+class GifPlan:
+    """How to encode a GIF."""
+
+    fps: float
+    width: int
+    height: int
+    colors: int
+
+    def estimate(self: "GifPlan", duration: float, bytes_per_pixel: float) -> float:
+        """Estimate how big the GIF will be, in bytes.
+
+        Args:
+            duration: How long the video is, in seconds.
+            bytes_per_pixel: How many bytes a pixel takes with 256 colors.
+
+        Returns:
+            The estimated size.
+        """
+        pixels: float = duration * self.fps * self.width * self.height
+        return pixels * bytes_per_pixel * math.log2(self.colors) / 8
+
+
+def plan_gif(  # noqa: PLR0913
+    duration: float,
+    width: int,
+    height: int,
+    source_fps: float,
+    *,
+    max_bytes: int,
+    bytes_per_pixel: float = ESTIMATED_BYTES_PER_PIXEL,
+) -> GifPlan:
+    """Choose the frame rate, size and palette that make the GIF fit in max_bytes.
+
+    We lower the frame rate first, then the size, then the number of colors, since that is the order people notice
+    the least.
+
+    Args:
+        duration: How long the video is, in seconds.
+        width: The width of the video.
+        height: The height of the video.
+        source_fps: The frame rate of the video.
+        max_bytes: The biggest the GIF can be.
+        bytes_per_pixel: How many bytes a pixel takes with 256 colors.
+
+    Returns:
+        The plan, which can still be too big if the video is very long.
+    """
+    target: float = max_bytes * BUDGET_MARGIN
+    fps: float = min(source_fps or MAX_GIF_FPS, MAX_GIF_FPS)
+    scale: float = min(1.0, MAX_GIF_WIDTH / width)
+
+    def make_plan(colors: int = GIF_COLORS[0]) -> GifPlan:
+        # Even sizes, some encoders need them and it doesn't change the size much
+        new_width: int = max(2, round(width * scale / 2) * 2)
+        new_height: int = max(2, round(height * scale / 2) * 2)
+        return GifPlan(fps=round(fps, 2), width=new_width, height=new_height, colors=colors)
+
+    ratio: float = target / make_plan().estimate(duration, bytes_per_pixel)
+    if ratio < 1:
+        fps = max(min(fps, MIN_GIF_FPS), fps * ratio)
+        ratio = target / make_plan().estimate(duration, bytes_per_pixel)
+
+    if ratio < 1:
+        min_scale: float = min(scale, MIN_GIF_WIDTH / width)
+        scale = max(min_scale, scale * math.sqrt(ratio))
+
+    for colors in GIF_COLORS:
+        plan: GifPlan = make_plan(colors)
+        if plan.estimate(duration, bytes_per_pixel) <= target:
+            return plan
+    return plan
+
+
+def encode_gif(video_file: Path, gif_file: Path, max_bytes: int) -> bool:
+    """Convert a video to a GIF that is at most max_bytes.
+
+    The GIF is made with ffmpeg using a palette made for the video. If it is too big we learn how well the video
+    compresses from it and try again with a smaller plan, at most MAX_ENCODE_ATTEMPTS times.
+
+    Args:
+        video_file: The video to convert.
+        gif_file: Where to save the GIF.
+        max_bytes: The biggest the GIF can be.
+
+    Returns:
+        True if the GIF fits, otherwise the GIF is removed.
+    """
+    from moviepy.config import FFMPEG_BINARY  # noqa: PLC0415
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos  # noqa: PLC0415
+
+    infos = ffmpeg_parse_infos(str(video_file))
+    duration: float = infos.get("video_duration") or infos.get("duration") or 1.0
+    width, height = infos["video_size"]
+    source_fps: float = infos.get("video_fps") or MAX_GIF_FPS
+
+    bytes_per_pixel: float = ESTIMATED_BYTES_PER_PIXEL
+    previous_plan: GifPlan | None = None
+    for attempt in range(1, MAX_ENCODE_ATTEMPTS + 1):
+        plan: GifPlan = plan_gif(
+            duration,
+            width,
+            height,
+            source_fps,
+            max_bytes=max_bytes,
+            bytes_per_pixel=bytes_per_pixel,
+        )
+        if plan == previous_plan:
+            # We can't make it any smaller
+            break
+        previous_plan = plan
+
+        filters: str = (
+            f"fps={plan.fps},scale={plan.width}:{plan.height}:flags=lanczos,split[a][b];"
+            f"[a]palettegen=max_colors={plan.colors}:stats_mode=diff[p];"
+            "[b][p]paletteuse=dither=bayer:bayer_scale=5:diff_mode=rectangle"
+        )
+        subprocess.run(  # noqa: S603
+            [FFMPEG_BINARY, "-v", "error", "-y", "-i", str(video_file), "-filter_complex", filters, str(gif_file)],
+            check=True,
+        )
+
+        size: int = gif_file.stat().st_size
+        logger.debug("Attempt {}: {} made a GIF of {} bytes, the limit is {}", attempt, plan, size, max_bytes)
+        if size <= max_bytes:
+            return True
+
+        # Use how well this video actually compresses for the next plan
+        bytes_per_pixel = bytes_per_pixel * size / plan.estimate(duration, bytes_per_pixel)
+
+    gif_file.unlink(missing_ok=True)
+    return False
@@ -0,0 +1,129 @@
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from discord_twitter_webhooks._dataclasses import ApplicationSettings, Group, get_app_settings
+from discord_twitter_webhooks.reader_settings import get_reader
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable
+
+
+@dataclass(frozen=True)
+class LinkRewriter:
+    """Rewrites the links in tweets the way a group wants them.
+
+    All the replacements are put in one regex, so the text is only scanned once and text we have replaced is not
+    replaced again.
+    """
+
+    # The text to find and what to replace it with, and a regex that finds all of them
+    replacements: dict[str, str]
+    pattern: re.Pattern[str] | None
+
+    # The Nitter instance to replace with Twitter in links to the tweet, None to keep the Nitter link
+    nitter_instance: str | None
+
+    def rewrite_text(self: "LinkRewriter", text: str) -> str:
+        """Replace Reddit, Teddit, YouTube and Piped links and remove copyright symbols.
+
+        Args:
+            text: The tweet text, in markdown.
+
+        Returns:
+            The text with the links replaced.
+        """
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(lambda match: self.replacements[match.group()], text)
+
+    def rewrite_entry_link(self: "LinkRewriter", link: str) -> str:
+        """Replace Nitter with Twitter in the link to the tweet, if the group wants Twitter links.
+
+        Args:
+            link: The link to the tweet.
+
+        Returns:
+            The link to use.
+        """
+        if self.nitter_instance is None:
+            return link
+        return link.replace(self.nitter_instance, "https://twitter.com").rstrip("#m")
+
+
+def compile_link_rewriter(app_settings: ApplicationSettings, group: Group) -> LinkRewriter:
+    """Create the link rewriter for a group.
+
+    Args:
+        app_settings: The settings with the Nitter, Teddit and Piped instances.
+        group: The group with the settings for what to replace.
+
+    Returns:
+        The link rewriter.
+    """
+    replacements: dict[str, str] = {}
+
+    # Teddit/Libreddit
+    if group.replace_reddit:
+        replacements["https://reddit.com"] = app_settings.teddit_instance
+        replacements["https://teddit.net"] = app_settings.teddit_instance
+    else:
+        replacements["https://teddit.net"] = "https://reddit.com"
+        replacements["[teddit.net"] = "[reddit.com"
+
+    # Piped/Invidious
+    if group.replace_youtube:
+        replacements["https://youtube.com"] = app_settings.piped_instance
+        replacements["https://piped.video"] = app_settings.piped_instance
+    else:
+        replacements["https://piped.video"] = "https://youtube.com"
+        replacements["[piped.video"] = "[youtube.com"
+
+    # Copyright symbols are bloat and adds nothing.
+    if group.remove_copyright:
+        replacements.update({"©": "", "®": "", "™": ""})
+
+    replacements = {old: new for old, new in replacements.items() if old != new}
+
+    # The longest first, so a shorter text can't match the start of a longer one
+    pattern: re.Pattern[str] | None = None
+    if replacements:
+        pattern = re.compile("|".join(re.escape(old) for old in sorted(replacements, key=len, reverse=True)))
+
+    return LinkRewriter(
+        replacements=replacements,
+        pattern=pattern,
+        nitter_instance=app_settings.nitter_instance if group.link_destination == "Twitter" else None,
+    )
+
+
+# The link rewriters, with the group settings they depend on as key
+_link_rewriters: dict["Hashable", LinkRewriter] = {}
+
+
+def get_link_rewriter(group: Group) -> LinkRewriter:
+    """Get the link rewriter for a group.
+
+    Groups with the same settings share a link rewriter. They are compiled the first time and then cached until
+    invalidate_link_rewriters() is called, this is done when the application settings are changed.
+
+    Args:
+        group: The group to get the link rewriter for.
+
+    Returns:
+        The link rewriter.
+    """
+    key: Hashable = (group.replace_reddit, group.replace_youtube, group.remove_copyright, group.link_destination)
+    link_rewriter: LinkRewriter | None = _link_rewriters.get(key)
+    if link_rewriter is None:
+        logger.debug("Compiling link rewriter for {}", key)
+        link_rewriter = compile_link_rewriter(get_app_settings(get_reader()), group)
+        _link_rewriters[key] = link_rewriter
+    return link_rewriter
+
+
+def invalidate_link_rewriters() -> None:
+    """Remove the link rewriters, so they are compiled again with the new Nitter, Teddit and Piped instances."""
+    _link_rewriters.clear()
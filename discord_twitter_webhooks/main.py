@@ -2,7 +2,7 @@ import functools
 import sys
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import TYPE_CHECKING, Annotated, Literal
+from typing import TYPE_CHECKING, Annotated, Any, Literal
 from uuid import uuid4
 
 import uvicorn
@@ -22,17 +22,35 @@ from discord_twitter_webhooks._dataclasses import (
     get_group,
     set_app_settings,
 )
+from discord_twitter_webhooks.concurrency import get_concurrency_controller
+from discord_twitter_webhooks.delivery import close_delivery_engine
+from discord_twitter_webhooks.dispatch_plan import invalidate_dispatch_plan
+from discord_twitter_webhooks.link_rewriter import invalidate_link_rewriters
+from discord_twitter_webhooks.media_cache import configure_media_cache, get_media_cache
+from discord_twitter_webhooks.media_workspace import configure_media_workspace, get_media_workspace
+from discord_twitter_webhooks.nitter_pool import configure_nitter_pool, get_nitter_pool
+from discord_twitter_webhooks.outbox import (
+    DELIVERY_INTERVAL_SECONDS,
+    PURGE_INTERVAL_SECONDS,
+    deliver_outbox,
+    get_outbox,
+)
+from discord_twitter_webhooks.parsed_entry import ParsedEntry, parse_entry
 from discord_twitter_webhooks.reader_settings import get_reader
 from discord_twitter_webhooks.send_to_discord import (
+    ReadStateBatch,
     blacklisted,
-    has_media,
+    invalidate_render_cache,
     send_embed,
     send_link,
     send_text,
     send_to_discord,
     whitelisted,
 )
+from discord_twitter_webhooks.transcode import configure_transcoder, resume_transcoding
 from discord_twitter_webhooks.translate import languages_from, languages_to
+from discord_twitter_webhooks.translation_cache import configure_translation_cache, get_translation_cache
+from discord_twitter_webhooks.whitelist import invalidate_group_matchers
 
 if TYPE_CHECKING:
     from reader.types import Entry, EntryLike, FeedLike
@@ -124,6 +142,8 @@ async def feed(  # noqa: PLR0913, ANN201
     send_as_text: Annotated[bool, Form(title="Send Text?")] = False,
     send_as_text_username: Annotated[bool, Form(title="Append username before text?")] = False,
     send_as_embed: Annotated[bool, Form(title="Send Embed?")] = False,
+    pack_embeds: Annotated[bool, Form(title="Pack embeds together?")] = False,
+    media_mode: Annotated[Literal["auto", "mp4", "gif"], Form(title="How to attach videos")] = "auto",
     send_as_link: Annotated[bool, Form(title="Send Only Link?")] = False,
     unescape_html: Annotated[bool, Form(title="Unescape HTML?")] = False,
     remove_copyright: Annotated[bool, Form(title="Remove Copyright?")] = False,
@@ -164,6 +184,8 @@ async def feed(  # noqa: PLR0913, ANN201
         send_as_text=send_as_text,
         send_as_text_username=send_as_text_username,
         send_as_embed=send_as_embed,
+        pack_embeds=pack_embeds,
+        media_mode=media_mode,
         send_as_link=send_as_link,
         unescape_html=unescape_html,
         remove_copyright=remove_copyright,
@@ -199,7 +221,7 @@ async def feed(  # noqa: PLR0913, ANN201
             continue
 
         # Update the feed
-        reader.update_feeds(feed=name_url, workers=4)
+        reader.update_feeds(feed=name_url)
 
         # Mark every entry as read
         _entry: Entry | EntryLike
@@ -223,6 +245,10 @@ async def feed(  # noqa: PLR0913, ANN201
     logger.info(f"Added group {group.uuid} to groups list")
     logger.info(f"Group list is now {set(groups)}")
 
+    # The group was added or changed, so the dispatch plan and the whitelist/blacklist have to be rebuilt
+    invalidate_dispatch_plan()
+    invalidate_group_matchers(uuid)
+
     # Redirect to the index page.
     return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -257,6 +283,9 @@ async def remove_group_post(uuid: Annotated[str, Form()]) -> RedirectResponse:
             reader.delete_feed(_feed)
             logger.info(f"Removed feed {_feed} due to no groups using it")
 
+    invalidate_dispatch_plan()
+    invalidate_group_matchers(uuid)
+
     # Redirect to the index page.
     return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -284,7 +313,7 @@ async def mark_as_unread(uuid: str):  # noqa: ANN201, C901
     logger.info(f"Feed is {_feed}")
 
     # Update the feed
-    reader.update_feeds(feed=_feed, workers=4)
+    reader.update_feeds(feed=_feed)
 
     # Get the entries
     entries = reader.get_entries(feed=_feed)
@@ -294,46 +323,47 @@ async def mark_as_unread(uuid: str):  # noqa: ANN201, C901
         # TODO: Return a proper error page
         return HTMLResponse(f"Failed to mark feed {uuid} as unread. No entries found.")
 
-    # Mark the entry as unread
+    # Send the entries again, and mark the ones we haven't seen before as read
+    read_state = ReadStateBatch(reader)
     entry: EntryLike | Entry
-    for entry in entries:
-        reader.mark_entry_as_unread(entry)
-
     for entry in entries:
         if group.whitelist_enabled and not whitelisted(group, entry):
             logger.info(f"Skipping entry {entry} as it is not whitelisted")
-            reader.mark_entry_as_read(entry)
+            read_state.mark_as_read(entry)
             continue
 
         if group.blacklist_enabled and blacklisted(group, entry):
             logger.info(f"Skipping entry {entry} as it is blacklisted")
-            reader.mark_entry_as_read(entry)
+            read_state.mark_as_read(entry)
             continue
 
-        if not group.send_retweets and entry.title.startswith("RT by "):
+        parsed: ParsedEntry = parse_entry(entry)
+        if not group.send_retweets and parsed.is_retweet:
             logger.info(f"Skipping entry {entry} as it is a retweet")
-            reader.mark_entry_as_read(entry)
+            read_state.mark_as_read(entry)
             continue
 
-        if not group.send_replies and entry.title.startswith("R to "):
+        if not group.send_replies and parsed.is_reply:
             logger.info(f"Skipping entry {entry} as it is a reply")
-            reader.mark_entry_as_read(entry)
+            read_state.mark_as_read(entry)
             continue
 
-        if group.only_send_if_media and not has_media(entry):
+        if group.only_send_if_media and not parsed.has_media:
             logger.info(f"Skipping entry {entry} as it has no media attached")
-            reader.mark_entry_as_read(entry)
+            read_state.mark_as_read(entry)
             continue
 
         if group.send_as_link:
-            send_link(entry=entry, group=group)
+            send_link(entry=entry, group=group, resend=True)
         if group.send_as_text:
-            send_text(entry=entry, group=group)
+            send_text(entry=entry, group=group, resend=True)
         if group.send_as_embed:
-            send_embed(entry=entry, group=group)
+            send_embed(entry=entry, group=group, resend=True)
 
         # Mark the entry as read
-        reader.mark_entry_as_read(entry)
+        read_state.mark_as_read(entry)
+
+    read_state.flush()
 
     # Redirect to the index page.
     return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
@@ -353,6 +383,23 @@ async def settings(request: Request) -> Response:
     return templates.TemplateResponse("settings.html", {"request": request, "settings": application_settings})
 
 
+@app.get("/stats")
+async def stats() -> dict[str, Any]:
+    """Get numbers for monitoring the bot.
+
+    Returns:
+        How many messages are waiting to be sent, how the Nitter instances are doing, how many feeds we fetch at
+        the same time and how well the media and translation caches work.
+    """
+    return {
+        "outbox": get_outbox().stats(),
+        "nitter": get_nitter_pool().stats(),
+        "update_concurrency": get_concurrency_controller().stats(),
+        "media_cache": get_media_cache().stats(),
+        "translation_cache": get_translation_cache().stats(),
+    }
+
+
 @functools.lru_cache(maxsize=1)
 @app.get("/favicon.svg")
 async def favicon():  # noqa: ANN201
@@ -373,31 +420,63 @@ async def favicon():  # noqa: ANN201
 async def settings_post(  # noqa: PLR0913
     request: Request,
     nitter_instance: Annotated[str, Form(title="Nitter instance")] = "",
+    nitter_instances: Annotated[str, Form(title="Other Nitter instances")] = "",
+    hedge_requests: Annotated[bool, Form(title="Ask another instance when one is slow?")] = False,
     deepl_auth_key: Annotated[str, Form(title="DeepL auth key")] = "",
     piped_instance: Annotated[str, Form(title="Piped instance")] = "",
     teddit_instance: Annotated[str, Form(title="Teddit instance")] = "",
     delay: Annotated[int, Form(title="Delay between checking for new tweets")] = 15,
+    max_delay: Annotated[int, Form(title="Maximum delay between checking for new tweets")] = 6 * 60,
+    media_cache_size: Annotated[int, Form(title="Media cache size")] = 500,
+    upload_limit: Annotated[int, Form(title="Upload limit")] = 25,
+    media_workspace: Annotated[str, Form(title="Media workspace")] = "",
+    media_workspace_quota: Annotated[int, Form(title="Media workspace quota")] = 1024,
+    translation_cache_size: Annotated[int, Form(title="Translation cache size")] = 50,
 ) -> Response:
     """Save the settings.
 
     Args:
         request: The request object.
         nitter_instance: The Nitter instance to use.
+        nitter_instances: Other Nitter instances to use, one per line.
+        hedge_requests: Also ask another Nitter instance when one is slow to answer.
         deepl_auth_key: The DeepL auth key to use.
         piped_instance: The Piped instance to use.
         teddit_instance: The Teddit instance to use.
         delay: The delay between checking for new tweets.
+        max_delay: The longest delay between checking a feed for new tweets.
+        media_cache_size: How much disk space downloaded videos and GIFs can use, in megabytes.
+        upload_limit: The biggest video or GIF we attach, in megabytes.
+        media_workspace: The directory where videos are downloaded and converted.
+        media_workspace_quota: How much disk space videos that are being converted can use, in megabytes.
+        translation_cache_size: How much space translations from DeepL can use, in megabytes.
     """
     # TODO: Run reader.change_feed_url() on all feeds if the Nitter instance has changed.
     app_settings = ApplicationSettings(
         nitter_instance=nitter_instance,
+        nitter_instances=tuple(instance.strip() for instance in nitter_instances.splitlines()),
+        hedge_requests=hedge_requests,
         deepl_auth_key=deepl_auth_key,
         piped_instance=piped_instance,
         teddit_instance=teddit_instance,
         delay=delay,
+        max_delay=max_delay,
+        media_cache_size=media_cache_size,
+        upload_limit=upload_limit,
+        media_workspace=media_workspace.strip(),
+        media_workspace_quota=media_workspace_quota,
+        translation_cache_size=translation_cache_size,
     )
 
     set_app_settings(reader, app_settings)
+    configure_nitter_pool(app_settings)
+    configure_media_cache(app_settings)
+    configure_transcoder(app_settings)
+    configure_media_workspace(app_settings)
+    configure_translation_cache(app_settings)
+    invalidate_dispatch_plan()
+    invalidate_link_rewriters()
+    invalidate_render_cache()
     return templates.TemplateResponse(
         "settings.html",
         {
@@ -428,15 +507,37 @@ def startup() -> None:
     # Get the delay from the settings
     delay = get_app_settings(reader).delay or 10
 
+    configure_nitter_pool(get_app_settings(reader))
+    configure_media_cache(get_app_settings(reader))
+    configure_transcoder(get_app_settings(reader))
+    configure_media_workspace(get_app_settings(reader))
+    configure_translation_cache(get_app_settings(reader))
+
     logger.info("I will check for new tweets every {} minutes", delay)
 
     scheduler: BackgroundScheduler = BackgroundScheduler()
 
     # Check for new entries every x minutes. They will be sent to Discord if they are new.
     scheduler.add_job(sched_func, "interval", minutes=delay, next_run_time=datetime.now(tz=timezone.utc))
+
+    # Send the messages in the outbox, this is done separately so checking for new tweets doesn't have to wait.
+    get_outbox().recover()
+    get_media_workspace().sweep()
+    resume_transcoding()
+    scheduler.add_job(deliver_outbox, "interval", seconds=DELIVERY_INTERVAL_SECONDS, coalesce=True)
+    scheduler.add_job(get_outbox().purge, "interval", seconds=PURGE_INTERVAL_SECONDS, coalesce=True)
     scheduler.start()
 
 
+@app.on_event("shutdown")
+def shutdown() -> None:
+    """This is called when the server stops.
+
+    It closes the connections to Discord.
+    """
+    close_delivery_engine()
+
+
 def sched_func() -> None:
     """The scheduler can't call a function with arguments, so we need to wrap it."""
     send_to_discord(reader)
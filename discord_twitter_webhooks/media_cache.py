@@ -0,0 +1,261 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import lru_cache
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any
+
+from loguru import logger
+
+from discord_twitter_webhooks.reader_settings import get_data_location
+
+if TYPE_CHECKING:
+    from discord_twitter_webhooks._dataclasses import ApplicationSettings
+
+# How much disk space the cache uses before we remove the files we haven't used for the longest, in megabytes
+DEFAULT_MEDIA_CACHE_MEGABYTES: int = 500
+
+
+def cache_key(source_url: str, parameters: str) -> str:
+    """Get the name of the file for a video or a GIF converted from it.
+
+    Args:
+        source_url: The URL of the original media.
+        parameters: What we did to it, for example "source" for the download and "gif" for the GIF.
+
+    Returns:
+        The SHA-256 of the URL and parameters.
+    """
+    return hashlib.sha256(f"{source_url}\0{parameters}".encode()).hexdigest()
+
+
+def _touch(path: Path) -> None:
+    """Mark a file as just used. The file system clock can be too coarse for files used right after each other."""
+    now: int = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+class MediaCache:
+    """Downloaded media and converted GIFs stored on disk, so the same video is only converted once.
+
+    The files are named after the SHA-256 of the URL and parameters. When the files use more than max_bytes, the
+    files we haven't used for the longest are removed. Using a file updates its modification time, so the order
+    survives a restart.
+    """
+
+    def __init__(self: "MediaCache", directory: Path, max_bytes: int) -> None:
+        """Open the cache and find the files that are already in it.
+
+        Args:
+            directory: Where to store the files.
+            max_bytes: How much disk space the files can use.
+        """
+        self.directory: Path = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes: int = max_bytes
+        self.lock = threading.Lock()
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+        # The size of every file, the one we used the longest ago first
+        self.files: OrderedDict[str, int] = OrderedDict()
+        self.size: int = 0
+        found: list[tuple[int, str, int]] = []
+        for path in self.directory.glob("*/*"):
+            if path.name.startswith("."):
+                # Left over from a write that didn't finish
+                path.unlink(missing_ok=True)
+                continue
+            stat: os.stat_result = path.stat()
+            found.append((stat.st_mtime_ns, path.name, stat.st_size))
+        for _, key, size in sorted(found):
+            self.files[key] = size
+            self.size += size
+
+        with self.lock:
+            self._evict()
+
+    def _path(self: "MediaCache", key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _read(self: "MediaCache", source_url: str, parameters: str, read: Callable[[Path], bytes | None]) -> bool:
+        """Read a file from the cache and count the hit or miss.
+
+        Args:
+            source_url: The URL of the original media.
+            parameters: What we did to it.
+            read: Called with the path of the file.
+
+        Returns:
+            True if the file was cached.
+        """
+        key: str = cache_key(source_url, parameters)
+        with self.lock:
+            if key not in self.files:
+                self.misses += 1
+                return False
+            self.files.move_to_end(key)
+            self.hits += 1
+
+        path: Path = self._path(key)
+        try:
+            read(path)
+            _touch(path)
+        except FileNotFoundError:
+            # Removed by someone else, we will have to make it again
+            with self.lock:
+                self.size -= self.files.pop(key, 0)
+                self.hits -= 1
+                self.misses += 1
+            return False
+        return True
+
+    def get(self: "MediaCache", source_url: str, parameters: str) -> bytes | None:
+        """Get a file from the cache.
+
+        Args:
+            source_url: The URL of the original media.
+            parameters: What we did to it.
+
+        Returns:
+            The file, or None if it isn't cached.
+        """
+        content: list[bytes] = []
+        if not self._read(source_url, parameters, lambda path: content.append(path.read_bytes())):
+            return None
+        return content[0]
+
+    def file_size(self: "MediaCache", source_url: str, parameters: str) -> int | None:
+        """Get the size of a file in the cache without reading it, this doesn't count as using it.
+
+        Args:
+            source_url: The URL of the original media.
+            parameters: What we did to it.
+
+        Returns:
+            The size in bytes, or None if it isn't cached.
+        """
+        key: str = cache_key(source_url, parameters)
+        with self.lock:
+            if key not in self.files:
+                return None
+        try:
+            return self._path(key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def copy_to(self: "MediaCache", source_url: str, parameters: str, destination: Path) -> bool:
+        """Copy a file from the cache without reading all of it into memory.
+
+        Args:
+            source_url: The URL of the original media.
+            parameters: What we did to it.
+            destination: Where to copy the file.
+
+        Returns:
+            True if the file was cached and copied.
+        """
+        return self._read(source_url, parameters, lambda path: shutil.copyfile(path, destination))
+
+    def _write(
+        self: "MediaCache",
+        source_url: str,
+        parameters: str,
+        size: int,
+        write: Callable[[IO[bytes]], None],
+    ) -> None:
+        """Store a file in the cache, and remove old files if the cache is full.
+
+        Args:
+            source_url: The URL of the original media.
+            parameters: What we did to it.
+            size: The size of the file.
+            write: Called with the file to write to.
+        """
+        if size > self.max_bytes:
+            return
+
+        key: str = cache_key(source_url, parameters)
+        path: Path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+
+        # Write to a temporary file first so we never read half a file
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=".", delete=False) as temporary_file:
+            write(temporary_file)
+        Path(temporary_file.name).replace(path)
+        _touch(path)
+
+        with self.lock:
+            self.size += size - self.files.pop(key, 0)
+            self.files[key] = size
+            self._evict()
+
+    def put(self: "MediaCache", source_url: str, parameters: str, content: bytes) -> None:
+        """Store a file in the cache.
+
+        Args:
+            source_url: The URL of the original media.
+            parameters: What we did to it.
+            content: The file.
+        """
+        self._write(source_url, parameters, len(content), lambda file: file.write(content))
+
+    def put_file(self: "MediaCache", source_url: str, parameters: str, source: Path) -> None:
+        """Copy a file into the cache without reading all of it into memory.
+
+        Args:
+            source_url: The URL of the original media.
+            parameters: What we did to it.
+            source: The file to copy.
+        """
+
+        def copy(file: IO[bytes]) -> None:
+            with source.open("rb") as source_file:
+                shutil.copyfileobj(source_file, file)
+
+        self._write(source_url, parameters, source.stat().st_size, copy)
+
+    def resize(self: "MediaCache", max_bytes: int) -> None:
+        """Change how much disk space the cache can use."""
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self: "MediaCache") -> None:
+        """Remove the files we haven't used for the longest until the cache fits."""
+        while self.size > self.max_bytes and self.files:
+            key, size = self.files.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            self._path(key).unlink(missing_ok=True)
+            logger.debug("Removed {} from the media cache", key)
+
+    def stats(self: "MediaCache") -> dict[str, Any]:
+        """Get how full the cache is and how often it was used."""
+        with self.lock:
+            return {
+                "files": len(self.files),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_media_cache() -> MediaCache:
+    """Get the media cache, it is stored next to the reader database."""
+    return MediaCache(get_data_location() / "media", DEFAULT_MEDIA_CACHE_MEGABYTES * 1024 * 1024)
+
+
+def configure_media_cache(app_settings: "ApplicationSettings") -> None:
+    """Use the size of the media cache from the settings."""
+    get_media_cache().resize(app_settings.media_cache_size * 1024 * 1024)
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import requests
+from loguru import logger
+
+# Videos bigger than this are not downloaded
+MAX_MEDIA_BYTES: int = 100 * 1024 * 1024
+
+# How much of the video we read into memory at a time
+CHUNK_SIZE: int = 64 * 1024
+
+# How long to wait for the server to answer and between chunks, in seconds
+DOWNLOAD_TIMEOUT: tuple[float, float] = (3.05, 30)
+
+
+def probe_size(url: str) -> int | None:
+    """Ask the server how big a file is without downloading it.
+
+    We try a HEAD request first, and a request for the first byte if the server doesn't say the size in the HEAD.
+
+    Args:
+        url: The URL of the file.
+
+    Returns:
+        The size in bytes, or None if the server didn't tell us.
+    """
+    try:
+        response: requests.Response = requests.head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+        content_length: str = response.headers.get("Content-Length", "")
+        if response.ok and content_length.isdigit():
+            return int(content_length)
+
+        # The total size is after the slash in "bytes 0-0/12345"
+        with requests.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            total: str = response.headers.get("Content-Range", "").rpartition("/")[2]
+            if response.status_code == 206 and total.isdigit():  # noqa: PLR2004
+                return int(total)
+    except requests.RequestException as e:
+        logger.debug("Failed to get the size of {}: {}", url, e)
+    return None
+
+
+def download_to_file(url: str, destination: Path, max_bytes: int = MAX_MEDIA_BYTES) -> bool:
+    """Download a file straight to disk, a chunk at a time.
+
+    The download is stopped as soon as we know the file is bigger than max_bytes, from the Content-Length header or
+    while downloading if the header is missing or wrong.
+
+    Args:
+        url: The URL of the file.
+        destination: Where to save the file. It is removed if the download fails.
+        max_bytes: The biggest file we download.
+
+    Returns:
+        True if the whole file was downloaded.
+    """
+    try:
+        if _stream_to_file(url, destination, max_bytes):
+            return True
+    except (requests.RequestException, OSError) as e:
+        logger.error("Failed to download {}: {}", url, e)
+
+    destination.unlink(missing_ok=True)
+    return False
+
+
+def _stream_to_file(url: str, destination: Path, max_bytes: int) -> bool:
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if not response.ok:
+            logger.error("Got {} when downloading {}", response.status_code, url)
+            return False
+
+        content_length: str = response.headers.get("Content-Length", "")
+        if content_length.isdigit() and int(content_length) > max_bytes:
+            logger.error("Not downloading {}, it is {} bytes and the limit is {}", url, content_length, max_bytes)
+            return False
+
+        written: int = 0
+        with destination.open("wb") as file:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    logger.error("Stopped downloading {}, it is bigger than {} bytes", url, max_bytes)
+                    return False
+                file.write(chunk)
+    return True
@@ -0,0 +1,113 @@
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from discord_twitter_webhooks._dataclasses import ApplicationSettings
+
+# Where videos are downloaded and converted if no directory is set in the settings
+DEFAULT_WORKSPACE: Path = Path(tempfile.gettempdir()) / "discord_twitter_webhooks"
+
+# How much disk space the jobs can use together, in megabytes
+DEFAULT_WORKSPACE_QUOTA_MEGABYTES: int = 1024
+
+# How long a job waits for space before giving up
+WORKSPACE_WAIT_SECONDS: int = 60
+
+# Every job gets a directory starting with this, so we know what we can remove
+JOB_PREFIX: str = "job-"
+
+
+class WorkspaceFullError(Exception):
+    """There was no space for a job in the workspace."""
+
+
+class MediaWorkspace:
+    """The directory where videos are downloaded and converted.
+
+    Every job gets its own directory that is removed when the job is done, even if it fails. Jobs say how much
+    space they need up front, and wait if the jobs that are running already use the quota. Directories left by a
+    crash are removed by sweep() when the bot starts.
+    """
+
+    def __init__(self: "MediaWorkspace", root: Path, quota_bytes: int) -> None:
+        """Create the workspace.
+
+        Args:
+            root: The directory, for example on a tmpfs.
+            quota_bytes: How much disk space the jobs can use together.
+        """
+        self.root: Path = root
+        self.quota_bytes: int = quota_bytes
+        self.reserved_bytes: int = 0
+        self.space_freed = threading.Condition()
+
+    def configure(self: "MediaWorkspace", root: Path, quota_bytes: int) -> None:
+        """Change the directory and quota. Jobs that are running keep their directory."""
+        with self.space_freed:
+            self.root = root
+            self.quota_bytes = quota_bytes
+            self.space_freed.notify_all()
+
+    def sweep(self: "MediaWorkspace") -> None:
+        """Remove the directories of jobs that didn't finish, this should only be done when no jobs are running."""
+        if not self.root.is_dir():
+            return
+
+        for path in self.root.glob(f"{JOB_PREFIX}*"):
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info("Removed {}, it was left by a job that didn't finish", path)
+
+    @contextmanager
+    def job(self: "MediaWorkspace", reserve_bytes: int) -> Iterator[Path]:
+        """Get a directory for a job, which is removed afterwards.
+
+        Args:
+            reserve_bytes: The most disk space the job will use.
+
+        Raises:
+            WorkspaceFullError: If there wasn't space for the job within WORKSPACE_WAIT_SECONDS.
+
+        Yields:
+            The directory.
+        """
+        deadline: float = time.monotonic() + WORKSPACE_WAIT_SECONDS
+        with self.space_freed:
+            while self.reserved_bytes and self.reserved_bytes + reserve_bytes > self.quota_bytes:
+                remaining: float = deadline - time.monotonic()
+                if remaining <= 0:
+                    msg: str = f"Waited {WORKSPACE_WAIT_SECONDS} seconds for {reserve_bytes} bytes in {self.root}"
+                    raise WorkspaceFullError(msg)
+                self.space_freed.wait(remaining)
+            self.reserved_bytes += reserve_bytes
+            job_dir: Path = self.root / f"{JOB_PREFIX}{uuid.uuid4().hex}"
+
+        try:
+            job_dir.mkdir(parents=True)
+            yield job_dir
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            with self.space_freed:
+                self.reserved_bytes -= reserve_bytes
+                self.space_freed.notify_all()
+
+
+@lru_cache(maxsize=1)
+def get_media_workspace() -> MediaWorkspace:
+    """Get the media workspace, the settings are applied by configure_media_workspace()."""
+    return MediaWorkspace(DEFAULT_WORKSPACE, DEFAULT_WORKSPACE_QUOTA_MEGABYTES * 1024 * 1024)
+
+
+def configure_media_workspace(app_settings: "ApplicationSettings") -> None:
+    """Use the directory and quota from the settings."""
+    root: Path = Path(app_settings.media_workspace) if app_settings.media_workspace else DEFAULT_WORKSPACE
+    get_media_workspace().configure(root, app_settings.media_workspace_quota * 1024 * 1024)
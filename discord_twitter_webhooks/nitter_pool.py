@@ -0,0 +1,483 @@
+import io
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlsplit
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+from discord_twitter_webhooks.concurrency import MAX_CONCURRENCY
+
+if TYPE_CHECKING:
+    from reader import Reader
+
+    from discord_twitter_webhooks._dataclasses import ApplicationSettings
+
+# How many instances we try before giving up on a feed update
+MAX_INSTANCE_ATTEMPTS: int = 3
+
+# Same default timeout reader uses, (connect, read) in seconds
+DEFAULT_TIMEOUT: tuple[float, float] = (3.05, 60)
+
+# How much a new measurement counts in the moving averages
+EWMA_WEIGHT: float = 0.3
+
+# How long to stop using an instance after it fails, doubled for every failure in a row
+FAILURE_COOLDOWN_SECONDS: float = 30
+MAX_FAILURE_COOLDOWN_SECONDS: float = 10 * 60
+
+# How long to stop using an instance after a 429 without a Retry-After header
+RATE_LIMIT_COOLDOWN_SECONDS: float = 60
+
+# A request that is slower than this percentile of recent requests is also sent to another instance
+HEDGE_PERCENTILE: float = 0.95
+
+# How many requests we need to have seen before we know what slow is
+HEDGE_MIN_SAMPLES: int = 20
+LATENCY_SAMPLES: int = 200
+
+# Never hedge requests that are faster than this, in seconds
+MIN_HEDGE_DELAY_SECONDS: float = 0.25
+
+# Hedging can add at most this many extra requests per request, and save up at most HEDGE_BUDGET_MAX of them
+HEDGE_BUDGET_RATIO: float = 0.1
+HEDGE_BUDGET_MAX: float = 5
+
+# Every feed update can have a request and a hedge running, so they never wait for a thread
+HEDGE_WORKERS: int = 2 * MAX_CONCURRENCY
+
+
+@dataclass
+class InstanceHealth:
+    """What we have seen from a Nitter instance."""
+
+    url: str
+
+    # Moving average of how long the instance takes to answer, in seconds
+    latency: float = 0.0
+
+    # Moving average of how many requests fail, from 0 to 1
+    error_rate: float = 0.0
+
+    # Failures in a row, used for the cooldown
+    failures: int = 0
+
+    # Don't use the instance before this, in time.monotonic() seconds
+    cooldown_until: float = 0.0
+
+    requests: int = 0
+
+    @property
+    def score(self: "InstanceHealth") -> float:
+        """Lower is better. Slow instances and instances that fail a lot get a higher score."""
+        return (self.latency + 0.5) * (1 + 4 * self.error_rate)
+
+    def available(self: "InstanceHealth", now: float) -> bool:
+        """Check if the instance is not cooling down."""
+        return now >= self.cooldown_until
+
+
+class NitterPool:
+    """Nitter instances that feeds are fetched from.
+
+    Feeds are stored with the URL of the main Nitter instance, the pool decides which instance is used for every
+    request. Every instance gets a score from how fast it answers and how often it fails, instances that fail or
+    rate limit us are not used for a while.
+    """
+
+    def __init__(self: "NitterPool", instances: list[str] | None = None) -> None:
+        """Create the pool.
+
+        Args:
+            instances: The Nitter instances, the first one is the one the feeds are stored with.
+        """
+        self.lock = threading.Lock()
+        self.instances: dict[str, InstanceHealth] = {}
+        self.set_instances(instances or [])
+
+        # Send slow requests to a second instance as well, and use the answer we get first
+        self.hedging: bool = False
+        self.latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.hedge_budget: float = HEDGE_BUDGET_MAX
+        self.hedged_requests: int = 0
+        self.hedge_wins: int = 0
+        self.executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="nitter")
+
+    def set_instances(self: "NitterPool", instances: list[str]) -> None:
+        """Change the instances in the pool, keeping what we know about the ones that were already in it."""
+        with self.lock:
+            self.instances = {
+                url: self.instances.get(url, InstanceHealth(url=url))
+                for url in dict.fromkeys(instance.rstrip("/") for instance in instances if instance)
+            }
+        logger.debug("Nitter instances: {}", list(self.instances))
+
+    def owns(self: "NitterPool", url: str) -> str | None:
+        """Get the instance the URL belongs to, or None if it isn't for an instance in the pool."""
+        for instance in self.instances:
+            if url.startswith(f"{instance}/"):
+                return instance
+        return None
+
+    def choose(self: "NitterPool", exclude: set[str]) -> str | None:
+        """Choose the instance for the next request.
+
+        We pick two random instances and use the one with the best score. This spreads the requests over the
+        healthy instances while still sending most of them to the fastest ones.
+
+        Args:
+            exclude: Instances we already tried for this request.
+
+        Returns:
+            The instance, or None if we have tried all of them.
+        """
+        now: float = time.monotonic()
+        with self.lock:
+            candidates: list[InstanceHealth] = [
+                health for url, health in self.instances.items() if url not in exclude and health.available(now)
+            ]
+            if not candidates:
+                # Everything is cooling down, try the one that will be back first instead of failing the update.
+                waiting: list[InstanceHealth] = [health for url, health in self.instances.items() if url not in exclude]
+                if not waiting:
+                    return None
+                return min(waiting, key=lambda health: health.cooldown_until).url
+
+            sample: list[InstanceHealth] = random.sample(candidates, min(2, len(candidates)))
+            return min(sample, key=lambda health: health.score).url
+
+    def record_success(self: "NitterPool", instance: str, latency: float) -> None:
+        """Remember that the instance answered in latency seconds."""
+        with self.lock:
+            health: InstanceHealth | None = self.instances.get(instance)
+            if health is None:
+                return
+            health.requests += 1
+            health.latency = (
+                latency if not health.latency else (1 - EWMA_WEIGHT) * health.latency + EWMA_WEIGHT * latency
+            )
+            health.error_rate *= 1 - EWMA_WEIGHT
+            health.failures = 0
+            self.latencies.append(latency)
+
+    def record_failure(self: "NitterPool", instance: str, retry_after: float | None = None) -> None:
+        """Remember that the instance failed, and stop using it for a while.
+
+        Args:
+            instance: The instance that failed.
+            retry_after: How long the instance told us to wait, if it rate limited us.
+        """
+        with self.lock:
+            health: InstanceHealth | None = self.instances.get(instance)
+            if health is None:
+                return
+            health.requests += 1
+            health.error_rate = (1 - EWMA_WEIGHT) * health.error_rate + EWMA_WEIGHT
+            health.failures += 1
+            if retry_after is None:
+                retry_after = min(
+                    FAILURE_COOLDOWN_SECONDS * 2 ** (health.failures - 1),
+                    MAX_FAILURE_COOLDOWN_SECONDS,
+                )
+            health.cooldown_until = max(health.cooldown_until, time.monotonic() + retry_after)
+        logger.warning("Not using Nitter instance {} for {:.0f} seconds", instance, retry_after)
+
+    def hedge_delay(self: "NitterPool") -> float | None:
+        """Get how long to wait for an answer before sending the request to another instance as well.
+
+        Returns:
+            The delay in seconds, or None if we should not hedge the request.
+        """
+        with self.lock:
+            self.hedge_budget = min(self.hedge_budget + HEDGE_BUDGET_RATIO, HEDGE_BUDGET_MAX)
+            if not self.hedging or len(self.instances) < 2 or len(self.latencies) < HEDGE_MIN_SAMPLES:  # noqa: PLR2004
+                return None
+
+            latencies: list[float] = sorted(self.latencies)
+            return max(latencies[int(HEDGE_PERCENTILE * (len(latencies) - 1))], MIN_HEDGE_DELAY_SECONDS)
+
+    def take_hedge(self: "NitterPool") -> bool:
+        """Check if we are allowed to send an extra request, and count it if we are."""
+        with self.lock:
+            if self.hedge_budget < 1:
+                return False
+            self.hedge_budget -= 1
+            self.hedged_requests += 1
+            return True
+
+    def stats(self: "NitterPool") -> dict[str, Any]:
+        """Get the health of every instance and how often we hedged requests."""
+        now: float = time.monotonic()
+        with self.lock:
+            return {
+                "instances": {
+                    url: {
+                        "latency": round(health.latency, 3),
+                        "error_rate": round(health.error_rate, 3),
+                        "requests": health.requests,
+                        "cooldown": round(max(health.cooldown_until - now, 0), 1),
+                    }
+                    for url, health in self.instances.items()
+                },
+                "hedged_requests": self.hedged_requests,
+                "hedge_wins": self.hedge_wins,
+            }
+
+
+def retry_after_seconds(response: requests.Response) -> float:
+    """Get how long a rate limited instance wants us to wait."""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return RATE_LIMIT_COOLDOWN_SECONDS
+
+
+class NitterPoolAdapter(HTTPAdapter):
+    """Send requests for feeds to the instance the pool chooses, and try another one if it fails."""
+
+    def __init__(self: "NitterPoolAdapter", pool: NitterPool, *args: Any, **kwargs: Any) -> None:  # noqa: ANN401
+        self.pool: NitterPool = pool
+        super().__init__(*args, **kwargs)
+
+    def send(
+        self: "NitterPoolAdapter",
+        request: requests.PreparedRequest,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> requests.Response:
+        """Send the request to one of the instances in the pool.
+
+        Args:
+            request: The request for the feed, with the URL the feed is stored with.
+            **kwargs: Passed to HTTPAdapter.send().
+
+        Returns:
+            The response, with links to the instance that answered replaced with links to the stored instance.
+        """
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = DEFAULT_TIMEOUT
+
+        stored_instance: str | None = self.pool.owns(request.url or "")
+        if stored_instance is None:
+            return super().send(request, **kwargs)
+
+        path: str = request.url.removeprefix(stored_instance)  # type: ignore  # noqa: PGH003
+        tried: set[str] = set()
+        response: requests.Response | None = None
+        error: requests.RequestException | None = None
+        for _ in range(MAX_INSTANCE_ATTEMPTS):
+            instance: str | None = self.pool.choose(tried)
+            if instance is None:
+                break
+            tried.add(instance)
+
+            try:
+                instance, new_response = self.send_hedged(request, path, instance, tried, kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                continue
+
+            # Keep the last answer open until we have a new one, it is returned if no instance does better
+            if response is not None:
+                response.close()
+            response = new_response
+
+            if not usable(response):
+                continue
+
+            if instance != stored_instance:
+                rewrite_instance(response, instance, stored_instance)
+            return response
+
+        if response is None:
+            raise error or requests.ConnectionError(f"No Nitter instance available for {path}")
+        return response
+
+    def send_hedged(
+        self: "NitterPoolAdapter",
+        request: requests.PreparedRequest,
+        path: str,
+        instance: str,
+        tried: set[str],
+        kwargs: dict[str, Any],
+    ) -> tuple[str, requests.Response]:
+        """Send the request to the instance, and to a second instance too if the first one is slow.
+
+        Args:
+            request: The request for the feed.
+            path: The path of the feed on the instance.
+            instance: The instance to send the request to.
+            tried: The instances we have used for this request, the second instance is added to it.
+            kwargs: Passed to HTTPAdapter.send().
+
+        Returns:
+            The instance that answered first, and its response.
+        """
+        delay: float | None = self.pool.hedge_delay()
+        if delay is None:
+            return instance, self.send_to(request, path, instance, kwargs)
+
+        # The delay starts when the request is sent, not when it is waiting for a thread
+        started = threading.Event()
+        future: Future[requests.Response] = self.pool.executor.submit(
+            self.send_to,
+            request,
+            path,
+            instance,
+            kwargs,
+            started,
+        )
+        started.wait()
+        if wait([future], timeout=delay).done:
+            return instance, future.result()
+
+        hedge_instance: str | None = self.pool.choose(tried)
+        if hedge_instance is None or not self.pool.take_hedge():
+            return instance, future.result()
+
+        logger.debug("{} is slow to answer for {}, also asking {}", instance, path, hedge_instance)
+        tried.add(hedge_instance)
+        futures: dict[Future[requests.Response], str] = {
+            future: instance,
+            self.pool.executor.submit(self.send_to, request, path, hedge_instance, kwargs): hedge_instance,
+        }
+
+        # Use the first answer we can use, and close the other one when it arrives
+        pending: set[Future[requests.Response]] = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for finished in done:
+                if finished.exception() is None and usable(finished.result()):
+                    for other in futures.keys() - {finished}:
+                        other.add_done_callback(close_response)
+                    if futures[finished] == hedge_instance:
+                        with self.pool.lock:
+                            self.pool.hedge_wins += 1
+                    return futures[finished], finished.result()
+
+        # Neither answer can be used, return the first one so it can be retried or reported
+        for other in list(futures)[1:]:
+            close_response(other)
+        return instance, future.result()
+
+    def send_to(
+        self: "NitterPoolAdapter",
+        request: requests.PreparedRequest,
+        path: str,
+        instance: str,
+        kwargs: dict[str, Any],
+        started: threading.Event | None = None,
+    ) -> requests.Response:
+        """Send the request to an instance and remember how it went.
+
+        Args:
+            request: The request for the feed.
+            path: The path of the feed on the instance.
+            instance: The instance to send the request to.
+            kwargs: Passed to HTTPAdapter.send().
+            started: Set when the request is sent.
+
+        Returns:
+            The response from the instance.
+        """
+        instance_request: requests.PreparedRequest = request.copy()
+        instance_request.prepare_url(f"{instance}{path}", None)
+        start: float = time.monotonic()
+        if started is not None:
+            started.set()
+        try:
+            response: requests.Response = super().send(instance_request, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.warning("Failed to get {} from {}: {}", path, instance, e)
+            self.pool.record_failure(instance)
+            raise
+
+        if response.status_code == 429:  # noqa: PLR2004
+            self.pool.record_failure(instance, retry_after_seconds(response))
+        elif response.status_code >= 500:  # noqa: PLR2004
+            self.pool.record_failure(instance)
+        else:
+            self.pool.record_success(instance, time.monotonic() - start)
+        return response
+
+
+def usable(response: requests.Response) -> bool:
+    """Check if the response is an answer, and not something another instance might do better."""
+    return response.status_code != 429 and response.status_code < 500  # noqa: PLR2004
+
+
+def close_response(future: "Future[requests.Response]") -> None:
+    """Close the response we didn't use."""
+    if future.done() and future.exception() is None:
+        future.result().close()
+
+
+def rewrite_instance(response: requests.Response, instance: str, stored_instance: str) -> None:
+    """Replace links to the instance that answered with links to the instance the feed is stored with.
+
+    Nitter uses links as the IDs of the tweets, so without this the same tweet would get a different ID for every
+    instance and be sent again.
+
+    Args:
+        response: The response from the instance.
+        instance: The instance that answered.
+        stored_instance: The instance the feed is stored with.
+    """
+    if response.status_code != 200:  # noqa: PLR2004
+        return
+
+    host: str = urlsplit(instance).netloc
+    content: bytes = response.content
+    for scheme in ("https", "http"):
+        content = content.replace(f"{scheme}://{host}".encode(), stored_instance.encode())
+    replace_content(response, content)
+
+
+def replace_content(response: requests.Response, content: bytes) -> None:
+    """Replace the body of a response we have already read, so it can be read again.
+
+    reader reads the feed from response.raw, and response.content is used by anything that reads it before reader.
+    """
+    response._content = content  # noqa: SLF001
+    response.raw = io.BytesIO(content)
+
+    # The content has already been decompressed
+    response.headers.pop("Content-Encoding", None)
+
+
+@lru_cache(maxsize=1)
+def get_nitter_pool() -> NitterPool:
+    """Get the Nitter instance pool, the instances are set from the settings."""
+    return NitterPool()
+
+
+def configure_nitter_pool(app_settings: "ApplicationSettings") -> None:
+    """Use the Nitter instances from the settings, the main instance first."""
+    pool: NitterPool = get_nitter_pool()
+    pool.set_instances([app_settings.nitter_instance, *app_settings.nitter_instances])
+    pool.hedging = app_settings.hedge_requests
+
+
+def _mount_nitter_pool(
+    session: requests.Session,
+    request: requests.Request,
+    **kwargs: Any,  # noqa: ANN401, ARG001
+) -> None:
+    """Send requests for feeds from Nitter instances in the pool through the pool."""
+    pool: NitterPool = get_nitter_pool()
+    stored_instance: str | None = pool.owns(request.url)
+    if stored_instance is None or isinstance(session.adapters.get(f"{stored_instance}/"), NitterPoolAdapter):
+        return
+
+    session.mount(f"{stored_instance}/", NitterPoolAdapter(pool))
+
+
+def nitter_pool_plugin(reader: "Reader") -> None:
+    """Reader plugin that fetches Nitter feeds from the instance pool."""
+    reader._parser.session_factory.request_hooks.append(_mount_nitter_pool)  # noqa: SLF001
@@ -0,0 +1,515 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+
+from discord_twitter_webhooks.delivery import get_delivery_engine
+from discord_twitter_webhooks.reader_settings import get_data_location
+
+if TYPE_CHECKING:
+    import httpx
+    from discord_webhook import DiscordWebhook
+
+# How many times we try to send a message before giving up
+MAX_ATTEMPTS: int = 10
+
+# How long to wait before the first retry, this is doubled for every failed attempt
+RETRY_DELAY_SECONDS: int = 30
+MAX_RETRY_DELAY_SECONDS: int = 60 * 60
+
+# How long we keep delivered messages around, so we can see what was sent
+KEEP_DELIVERED_SECONDS: int = 7 * 24 * 60 * 60
+
+# How often the delivery worker checks the outbox
+DELIVERY_INTERVAL_SECONDS: int = 5
+
+# How often delivered messages older than KEEP_DELIVERED_SECONDS are removed
+PURGE_INTERVAL_SECONDS: int = 60 * 60
+
+# How many messages the delivery worker sends at the same time
+DELIVERY_BATCH_SIZE: int = 50
+
+# Discord limits for a single message, used when packing embeds from several messages together
+MAX_EMBEDS_PER_MESSAGE: int = 10
+MAX_EMBED_CHARACTERS_PER_MESSAGE: int = 6000
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_link TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    packable INTEGER NOT NULL DEFAULT 0,
+    media_url TEXT,
+    media_mode TEXT NOT NULL DEFAULT 'gif',
+    dedupe_key TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    message_id INTEGER NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    filename TEXT,
+    content BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id INTEGER NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    webhook_url TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    delivered_at REAL
+);
+CREATE TABLE IF NOT EXISTS media (
+    message_id INTEGER PRIMARY KEY REFERENCES messages(id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_by_message ON files(message_id);
+CREATE INDEX IF NOT EXISTS deliveries_by_state ON deliveries(state, next_attempt_at);
+CREATE INDEX IF NOT EXISTS deliveries_by_message ON deliveries(message_id);
+"""
+
+# Columns added to the messages table after it was created, and their definitions
+_ADDED_COLUMNS: dict[str, str] = {
+    "packable": "INTEGER NOT NULL DEFAULT 0",
+    "media_url": "TEXT",
+    "media_mode": "TEXT NOT NULL DEFAULT 'gif'",
+    "dedupe_key": "TEXT",
+}
+
+
+@dataclass
+class Delivery:
+    """A message that should be sent to a webhook."""
+
+    id: int
+    message_id: int
+    webhook_url: str
+    entry_link: str
+    attempts: int
+    payload: dict[str, Any]
+    files: dict[str, tuple[str | None, bytes]] = field(default_factory=dict)
+
+    # If the embeds can be sent in the same message as the embeds from other deliveries
+    packable: bool = False
+
+
+class Outbox:
+    """Messages waiting to be sent to Discord, stored in SQLite so they survive a crash or restart.
+
+    Every message is stored once, with one delivery for each webhook it should be sent to. A delivery is pending
+    until it is sent, or failed if we gave up on it. Deliveries for a message with a video are waiting until the
+    video has been converted to a GIF. Videos are stored once per message as a file next to the database.
+    """
+
+    def __init__(self: "Outbox", db_file: Path) -> None:
+        """Open the database and create the tables if they don't exist.
+
+        Args:
+            db_file: Where to store the database.
+        """
+        self.lock = threading.Lock()
+        self.db: sqlite3.Connection = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(_SCHEMA)
+        self.media_dir: Path = db_file.parent / f"{db_file.stem}_media"
+        self.media_dir.mkdir(parents=True, exist_ok=True)
+
+        # Older databases don't have the columns we added later
+        columns: list[str] = [row[1] for row in self.db.execute("PRAGMA table_info(messages)")]
+        for column, definition in _ADDED_COLUMNS.items():
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE messages ADD COLUMN {column} {definition}")
+
+        # Created after the columns, older databases don't have dedupe_key until now. Messages without a key are
+        # never the same as another message, SQLite doesn't compare NULLs.
+        self.db.execute("CREATE UNIQUE INDEX IF NOT EXISTS messages_by_dedupe_key ON messages(dedupe_key)")
+
+    def enqueue(  # noqa: PLR0913
+        self: "Outbox",
+        webhook: "DiscordWebhook",
+        webhook_urls: list[str],
+        entry_link: str,
+        *,
+        packable: bool = False,
+        media_url: str | None = None,
+        media_mode: str = "gif",
+        dedupe_key: str | None = None,
+    ) -> int | None:
+        """Store a message so the delivery worker sends it to every webhook URL.
+
+        Args:
+            webhook: The message to send. webhook.url is ignored.
+            webhook_urls: The webhook URLs to send the message to.
+            entry_link: The link to the tweet, used for logging.
+            packable: If the embeds can be sent in the same message as the embeds from other messages.
+            media_url: A video that should be attached, the message is not sent until attach_media() or
+                release_media() is called.
+            media_mode: How the video should be attached, "mp4", "gif" or "auto".
+            dedupe_key: What the message is, a message with the same key is only stored once. This is used so an
+                entry isn't sent again if we crashed before it was marked as read.
+
+        Returns:
+            The ID of the stored message, or None if a message with the same dedupe_key was already stored.
+        """
+        payload: str = json.dumps(webhook.json)
+        now: float = time.time()
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            cursor = self.db.execute(
+                """
+                INSERT OR IGNORE INTO messages (entry_link, payload, packable, media_url, media_mode, dedupe_key,
+                    created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (entry_link, payload, packable, media_url, media_mode, dedupe_key, now),
+            )
+            if cursor.rowcount == 0:
+                logger.debug("{} is already in the outbox, not storing it again", dedupe_key)
+                return None
+
+            message_id: int = cursor.lastrowid  # type: ignore  # noqa: PGH003
+            self.db.executemany(
+                "INSERT INTO files (message_id, name, filename, content) VALUES (?, ?, ?, ?)",
+                [(message_id, name, filename, content) for name, (filename, content) in webhook.files.items()],
+            )
+            self.db.executemany(
+                "INSERT INTO deliveries (message_id, webhook_url, state, next_attempt_at) VALUES (?, ?, ?, ?)",
+                [
+                    (message_id, webhook_url, "waiting" if media_url else "pending", now)
+                    for webhook_url in dict.fromkeys(webhook_urls)
+                ],
+            )
+        return message_id
+
+    def attach_media(self: "Outbox", message_id: int, filename: str, content: bytes) -> None:
+        """Attach the video to a message and send the message. GIFs are shown in the first embed.
+
+        Discord can't play videos in embeds, so MP4s are shown above the embed with the thumbnail still in it.
+
+        Args:
+            message_id: The message waiting for the video.
+            filename: The name of the file in Discord.
+            content: The file.
+        """
+        path: Path = self.media_dir / f"{message_id}_{filename}"
+        path.write_bytes(content)
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            row = self.db.execute("SELECT payload FROM messages WHERE id = ?", (message_id,)).fetchone()
+            if row is None:
+                path.unlink(missing_ok=True)
+                return
+
+            payload: dict[str, Any] = json.loads(row[0])
+            if payload.get("embeds") and filename.endswith(".gif"):
+                payload["embeds"][0]["image"] = {"url": f"attachment://{filename}"}
+            self.db.execute(
+                "UPDATE messages SET payload = ?, media_url = NULL WHERE id = ?",
+                (json.dumps(payload), message_id),
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO media (message_id, filename, path) VALUES (?, ?, ?)",
+                (message_id, filename, str(path)),
+            )
+            self._release(message_id)
+
+    def release_media(self: "Outbox", message_id: int) -> None:
+        """Send a message that was waiting for a video without it."""
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            self.db.execute("UPDATE messages SET media_url = NULL WHERE id = ?", (message_id,))
+            self._release(message_id)
+
+    def _release(self: "Outbox", message_id: int) -> None:
+        """Make the deliveries that were waiting for a video pending, this has to be done in a transaction."""
+        self.db.execute(
+            "UPDATE deliveries SET state = 'pending', next_attempt_at = ? WHERE message_id = ? AND state = 'waiting'",
+            (time.time(), message_id),
+        )
+
+    def waiting_for_media(self: "Outbox") -> list[tuple[int, str, str]]:
+        """Get the messages that are waiting for a video, the URLs of the videos and how to attach them."""
+        with self.lock:
+            return self.db.execute(
+                """
+                SELECT DISTINCT messages.id, messages.media_url, messages.media_mode
+                FROM messages JOIN deliveries ON deliveries.message_id = messages.id
+                WHERE deliveries.state = 'waiting' AND messages.media_url IS NOT NULL
+                """,
+            ).fetchall()
+
+    def claim(self: "Outbox", limit: int = DELIVERY_BATCH_SIZE) -> list[Delivery]:
+        """Get the deliveries that should be sent now and mark them as being sent.
+
+        Args:
+            limit: How many deliveries to get.
+
+        Returns:
+            The deliveries, oldest first.
+        """
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            rows = self.db.execute(
+                """
+                SELECT deliveries.id, deliveries.message_id, deliveries.webhook_url, messages.entry_link,
+                       deliveries.attempts, messages.payload, messages.packable
+                FROM deliveries JOIN messages ON messages.id = deliveries.message_id
+                WHERE deliveries.state = 'pending' AND deliveries.next_attempt_at <= ?
+                ORDER BY messages.created_at, deliveries.id
+                LIMIT ?
+                """,
+                (time.time(), limit),
+            ).fetchall()
+            deliveries: list[Delivery] = [
+                Delivery(
+                    id=row[0],
+                    message_id=row[1],
+                    webhook_url=row[2],
+                    entry_link=row[3],
+                    attempts=row[4],
+                    payload=json.loads(row[5]),
+                    packable=bool(row[6]),
+                )
+                for row in rows
+            ]
+            self.db.executemany(
+                "UPDATE deliveries SET state = 'sending' WHERE id = ?",
+                [(delivery.id,) for delivery in deliveries],
+            )
+
+            # Files are read once for every message, deliveries of the same message share them
+            files: dict[int, dict[str, tuple[str | None, bytes]]] = {
+                message_id: self._files(message_id) for message_id in {delivery.message_id for delivery in deliveries}
+            }
+
+        for delivery in deliveries:
+            delivery.files = dict(files[delivery.message_id])
+        return deliveries
+
+    def _files(self: "Outbox", message_id: int) -> dict[str, tuple[str | None, bytes]]:
+        """Get the files attached to a message, and the video from the media directory."""
+        files: dict[str, tuple[str | None, bytes]] = {
+            name: (filename, content)
+            for name, filename, content in self.db.execute(
+                "SELECT name, filename, content FROM files WHERE message_id = ?",
+                (message_id,),
+            )
+        }
+        for filename, path in self.db.execute("SELECT filename, path FROM media WHERE message_id = ?", (message_id,)):
+            try:
+                files[f"_{filename}"] = (filename, Path(path).read_bytes())
+            except OSError as e:
+                logger.error("Failed to read {} for message {}: {}", path, message_id, e)
+        return files
+
+    def delivered(self: "Outbox", delivery: Delivery) -> None:
+        """Mark the delivery as sent."""
+        with self.lock:
+            self.db.execute(
+                "UPDATE deliveries SET state = 'delivered', attempts = attempts + 1, delivered_at = ? WHERE id = ?",
+                (time.time(), delivery.id),
+            )
+
+    def retry(self: "Outbox", delivery: Delivery, error: str) -> None:
+        """Try the delivery again later, or give up if we have tried too many times.
+
+        Args:
+            delivery: The delivery that failed.
+            error: Why it failed.
+        """
+        attempts: int = delivery.attempts + 1
+        if attempts >= MAX_ATTEMPTS:
+            logger.error(
+                "Giving up on sending {} to {} after {} attempts: {}",
+                delivery.entry_link,
+                delivery.webhook_url,
+                attempts,
+                error,
+            )
+            self.fail(delivery, error)
+            return
+
+        delay: int = min(RETRY_DELAY_SECONDS * 2 ** (attempts - 1), MAX_RETRY_DELAY_SECONDS)
+        logger.warning("Failed to send {}, retrying in {} seconds: {}", delivery.entry_link, delay, error)
+        with self.lock:
+            self.db.execute(
+                "UPDATE deliveries SET state = 'pending', attempts = ?, next_attempt_at = ?, last_error = ?"
+                " WHERE id = ?",
+                (attempts, time.time() + delay, error, delivery.id),
+            )
+
+    def fail(self: "Outbox", delivery: Delivery, error: str) -> None:
+        """Give up on the delivery.
+
+        Args:
+            delivery: The delivery that failed.
+            error: Why it failed.
+        """
+        with self.lock:
+            self.db.execute(
+                "UPDATE deliveries SET state = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                (error, delivery.id),
+            )
+
+    def recover(self: "Outbox") -> None:
+        """Send the deliveries again that we were sending when the bot stopped."""
+        with self.lock:
+            cursor = self.db.execute("UPDATE deliveries SET state = 'pending' WHERE state = 'sending'")
+        if cursor.rowcount:
+            logger.info("Recovered {} unsent messages from the outbox", cursor.rowcount)
+
+    def purge(self: "Outbox", keep_delivered_seconds: int = KEEP_DELIVERED_SECONDS) -> None:
+        """Remove old delivered deliveries, and messages that have nothing left to deliver."""
+        with self.lock, self.db:
+            self.db.execute("BEGIN")
+            self.db.execute(
+                "DELETE FROM deliveries WHERE state = 'delivered' AND delivered_at < ?",
+                (time.time() - keep_delivered_seconds,),
+            )
+            paths: list[str] = [
+                row[0]
+                for row in self.db.execute(
+                    "SELECT path FROM media WHERE NOT EXISTS"
+                    " (SELECT 1 FROM deliveries WHERE deliveries.message_id = media.message_id)",
+                )
+            ]
+            self.db.execute(
+                "DELETE FROM messages WHERE NOT EXISTS"
+                " (SELECT 1 FROM deliveries WHERE deliveries.message_id = messages.id)",
+            )
+
+        for path in paths:
+            Path(path).unlink(missing_ok=True)
+
+    def stats(self: "Outbox") -> dict[str, int]:
+        """Count the deliveries in each state."""
+        with self.lock:
+            return dict(self.db.execute("SELECT state, COUNT(*) FROM deliveries GROUP BY state").fetchall())
+
+
+@lru_cache(maxsize=1)
+def get_outbox(db_location: Path | None = None) -> Outbox:
+    """Get the outbox, it is stored next to the reader database.
+
+    Args:
+        db_location: Where to store the database.
+
+    Returns:
+        The outbox.
+    """
+    db_location = get_data_location() if db_location is None else db_location
+    return Outbox(db_location / "outbox.db")
+
+
+def embed_characters(embed: dict[str, Any]) -> int:
+    """Count the characters in an embed the way Discord does for the 6000 character limit."""
+    characters: int = len(embed.get("title") or "") + len(embed.get("description") or "")
+    characters += len((embed.get("author") or {}).get("name") or "")
+    characters += len((embed.get("footer") or {}).get("text") or "")
+    for embed_field in embed.get("fields") or []:
+        characters += len(embed_field.get("name") or "") + len(embed_field.get("value") or "")
+    return characters
+
+
+def pack_deliveries(deliveries: list[Delivery]) -> list[list[Delivery]]:
+    """Put deliveries to the same webhook together so their embeds are sent in one message.
+
+    Only packable deliveries that follow each other for a webhook are put together, so the tweets are still sent in
+    the order they were posted. A message never gets more than 10 embeds or 6000 characters.
+
+    Args:
+        deliveries: The deliveries, oldest first.
+
+    Returns:
+        The deliveries that should be sent together, in the same order.
+    """
+    packs: list[list[Delivery]] = []
+
+    # The pack we are adding to for each webhook, and how many embeds and characters it has
+    open_packs: dict[str, tuple[list[Delivery], int, int]] = {}
+
+    for delivery in deliveries:
+        if not delivery.packable:
+            open_packs.pop(delivery.webhook_url, None)
+            packs.append([delivery])
+            continue
+
+        embeds: list[dict[str, Any]] = delivery.payload.get("embeds", [])
+        characters: int = sum(embed_characters(embed) for embed in embeds)
+        if delivery.webhook_url in open_packs:
+            pack, pack_embeds, pack_characters = open_packs[delivery.webhook_url]
+            if (
+                pack_embeds + len(embeds) <= MAX_EMBEDS_PER_MESSAGE
+                and pack_characters + characters <= MAX_EMBED_CHARACTERS_PER_MESSAGE
+            ):
+                pack.append(delivery)
+                open_packs[delivery.webhook_url] = (pack, pack_embeds + len(embeds), pack_characters + characters)
+                continue
+
+        packs.append([delivery])
+        open_packs[delivery.webhook_url] = (packs[-1], len(embeds), characters)
+
+    return packs
+
+
+def pack_payload(pack: list[Delivery]) -> dict[str, Any]:
+    """Get the JSON data for a message with the embeds from all the deliveries."""
+    if len(pack) == 1:
+        return pack[0].payload
+
+    payload: dict[str, Any] = dict(pack[0].payload)
+    payload["embeds"] = [embed for delivery in pack for embed in delivery.payload.get("embeds", [])]
+    return payload
+
+
+def deliver_outbox(outbox: Outbox | None = None) -> None:
+    """Send everything in the outbox that is due.
+
+    This is called by the scheduler every few seconds, separately from checking for new tweets. Old messages are
+    removed by Outbox.purge(), which the scheduler calls every PURGE_INTERVAL_SECONDS.
+
+    Args:
+        outbox: The outbox to send from.
+    """
+    outbox = get_outbox() if outbox is None else outbox
+    while deliveries := outbox.claim():
+        packs: list[list[Delivery]] = pack_deliveries(deliveries)
+        if len(packs) < len(deliveries):
+            logger.debug("Packed {} messages into {} requests", len(deliveries), len(packs))
+
+        try:
+            responses: list[httpx.Response | Exception] = get_delivery_engine().post_batch(
+                [(pack[0].webhook_url, pack_payload(pack), pack[0].files) for pack in packs],
+            )
+        except Exception as e:  # noqa: BLE001
+            # Don't leave the deliveries as being sent until the next restart
+            logger.exception("Failed to send {} messages", len(deliveries))
+            for delivery in deliveries:
+                outbox.retry(delivery, repr(e))
+            continue
+
+        # Every delivery in a pack gets the response for the message they were sent in
+        delivery_responses: list[tuple[Delivery, httpx.Response | Exception]] = [
+            (delivery, response) for pack, response in zip(packs, responses, strict=True) for delivery in pack
+        ]
+        for delivery, response in delivery_responses:
+            if isinstance(response, Exception):
+                outbox.retry(delivery, repr(response))
+            elif response.is_success:
+                logger.info("Webhook posted for {}", delivery.entry_link)
+                outbox.delivered(delivery)
+            elif response.status_code == 429 or response.is_server_error:  # noqa: PLR2004
+                outbox.retry(delivery, f"Got {response.status_code}: {response.text}")
+            else:
+                # Discord will not accept this message, or the webhook was deleted. Sending it again won't help.
+                logger.error(f"Got {response.status_code} from {delivery.webhook_url}. Response: {response.text}")
+                outbox.fail(delivery, f"Got {response.status_code}: {response.text}")
@@ -0,0 +1,146 @@
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import dataclass, field
+from typing import Literal
+
+import lxml.etree
+import lxml.html
+from reader import Entry
+from reader.types import EntryLike
+
+# How many parsed entries we keep, an entry is used by every group that follows the account
+PARSED_ENTRY_CACHE_SIZE: int = 1024
+
+_parsed_entries: OrderedDict[tuple[Hashable, ...], "ParsedEntry"] = OrderedDict()
+_parsed_entries_lock = threading.Lock()
+
+_REPLIED_TO_PATTERN: re.Pattern[str] = re.compile(r"R to @(\w+)")
+
+
+@dataclass(frozen=True)
+class ParsedEntry:
+    """What we need from an entry, found by parsing its HTML once.
+
+    The same entry is checked and rendered for every group that follows the account, so it is parsed once and
+    shared. Don't change the tree.
+    """
+
+    # The text of the tweet without HTML
+    text: str = ""
+
+    # The images in the tweet, thumbnails of videos are not included
+    images: tuple[str, ...] = ()
+
+    # The MP4s of videos and GIFs, and the thumbnail of the first one
+    videos: tuple[str, ...] = ()
+    poster: str | None = None
+
+    # Where the links in the tweet go
+    links: tuple[str, ...] = ()
+
+    kind: Literal["tweet", "retweet", "reply"] = "tweet"
+
+    # The username of the account that was replied to
+    replied_to: str | None = None
+
+    # The parsed HTML of the tweet, None if the entry has no HTML
+    tree: lxml.html.HtmlElement | None = field(default=None, compare=False, repr=False)
+
+    @property
+    def has_media(self: "ParsedEntry") -> bool:
+        """Check if the tweet has images, videos or GIFs."""
+        return bool(self.images or self.videos)
+
+    @property
+    def is_retweet(self: "ParsedEntry") -> bool:
+        """Check if the entry is a retweet."""
+        return self.kind == "retweet"
+
+    @property
+    def is_reply(self: "ParsedEntry") -> bool:
+        """Check if the entry is a reply."""
+        return self.kind == "reply"
+
+
+def parse_html(html: str) -> lxml.html.HtmlElement | None:
+    """Parse the HTML of a tweet.
+
+    The tweet is parsed as a whole document, like BeautifulSoup does, so text before the first tag and tags like
+    <textarea> that aren't closed end up in the same place.
+
+    Args:
+        html: The HTML to parse.
+
+    Returns:
+        The <html> element, or None if there is no HTML.
+    """
+    try:
+        return lxml.html.document_fromstring(html)
+    except lxml.etree.ParserError:
+        return None
+
+
+def _parse(entry: Entry | EntryLike) -> ParsedEntry:
+    title: str = entry.title or ""
+    kind: Literal["tweet", "retweet", "reply"] = "tweet"
+    replied_to: str | None = None
+    if title.startswith("RT by "):
+        kind = "retweet"
+    elif title.startswith("R to "):
+        kind = "reply"
+        if found := _REPLIED_TO_PATTERN.search(title):
+            replied_to = found.group(1)
+
+    tree: lxml.html.HtmlElement | None = parse_html(entry.summary or "")
+    if tree is None:
+        return ParsedEntry(text=title, kind=kind, replied_to=replied_to)
+
+    images: list[str] = []
+    videos: list[str] = []
+    links: list[str] = []
+    poster: str | None = None
+    for element in tree.iter("img", "source", "video", "a"):
+        if element.tag == "img" and element.get("src"):
+            images.append(element.get("src"))
+        elif element.tag == "source" and element.get("type") == "video/mp4" and element.get("src"):
+            videos.append(element.get("src"))
+        elif element.tag == "video" and poster is None:
+            poster = element.get("poster")
+        elif element.tag == "a" and element.get("href"):
+            links.append(element.get("href"))
+
+    return ParsedEntry(
+        text=tree.text_content().strip(),
+        images=tuple(images),
+        videos=tuple(videos),
+        poster=poster,
+        links=tuple(links),
+        kind=kind,
+        replied_to=replied_to,
+        tree=tree,
+    )
+
+
+def parse_entry(entry: Entry | EntryLike) -> ParsedEntry:
+    """Parse an entry, or get it from the cache if it was already parsed.
+
+    Args:
+        entry: The entry to parse.
+
+    Returns:
+        The parsed entry. It is shared, so don't change it.
+    """
+    key: tuple[Hashable, ...] = (entry.feed_url, entry.id, entry.updated)
+    with _parsed_entries_lock:
+        if key in _parsed_entries:
+            _parsed_entries.move_to_end(key)
+            return _parsed_entries[key]
+
+    parsed: ParsedEntry = _parse(entry)
+    with _parsed_entries_lock:
+        _parsed_entries[key] = parsed
+        if len(_parsed_entries) > PARSED_ENTRY_CACHE_SIZE:
+            _parsed_entries.popitem(last=False)
+    return parsed
@@ -0,0 +1,214 @@
+import itertools
+import statistics
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import requests
+from loguru import logger
+from reader import FeedNotFoundError, ParseError, Reader, UpdatedFeed
+
+from discord_twitter_webhooks._dataclasses import ApplicationSettings, entry_published, get_app_settings
+from discord_twitter_webhooks.concurrency import MAX_CONCURRENCY, ConcurrencyController, get_concurrency_controller
+
+# How many of the newest entries we look at to find out how often an account posts
+POSTING_RATE_SAMPLE_SIZE: int = 10
+
+# Feeds that are due this close to the current check are checked now instead of waiting for the next one
+SCHEDULING_SLACK: timedelta = timedelta(seconds=30)
+
+
+def posting_interval(reader: Reader, feed_url: str) -> timedelta | None:
+    """Get how long an account usually waits between tweets.
+
+    Args:
+        reader: The reader which contains the feed.
+        feed_url: The URL of the feed.
+
+    Returns:
+        The median time between the newest entries, or None if the feed has fewer than two entries.
+    """
+    entries = reader.get_entries(feed=feed_url, sort="recent", limit=POSTING_RATE_SAMPLE_SIZE)
+    published: list[datetime] = sorted((entry_published(entry) for entry in entries), reverse=True)
+    if len(published) < 2:  # noqa: PLR2004
+        return None
+
+    return statistics.median(newer - older for newer, older in itertools.pairwise(published))
+
+
+def polling_interval(reader: Reader, feed_url: str, app_settings: ApplicationSettings, *, got_new: bool) -> timedelta:
+    """Get how long to wait before checking the feed again.
+
+    We check twice as often as the account usually posts, but never more often than every `delay` minutes and
+    never less often than every `max_delay` minutes. If we just got new tweets we check again soon, accounts
+    often post several tweets in a row.
+
+    Args:
+        reader: The reader which contains the feed.
+        feed_url: The URL of the feed.
+        app_settings: The settings with the bounds.
+        got_new: If the last update found new tweets.
+
+    Returns:
+        How long to wait.
+    """
+    min_interval = timedelta(minutes=app_settings.delay)
+    max_interval = timedelta(minutes=max(app_settings.max_delay, app_settings.delay))
+    if got_new:
+        return min_interval
+
+    interval: timedelta | None = posting_interval(reader, feed_url)
+    if interval is None:
+        return max_interval
+
+    return min(max(interval / 2, min_interval), max_interval)
+
+
+def get_schedule(reader: Reader) -> dict[str, datetime]:
+    """Get when each feed should be checked again.
+
+    The whole schedule is kept in one global tag, so checking which feeds are due is one query instead of one per
+    feed. Feeds that are not in the schedule should be checked now.
+
+    Args:
+        reader: The reader which contains the feeds.
+
+    Returns:
+        When to check each feed again, keyed by feed URL.
+    """
+    schedule: dict[str, str] = reader.get_tag((), "next_update", {})  # type: ignore  # noqa: PGH003
+    return {feed_url: datetime.fromisoformat(next_update) for feed_url, next_update in schedule.items()}
+
+
+def set_schedule(reader: Reader, schedule: dict[str, datetime]) -> None:
+    """Set when each feed should be checked again."""
+    reader.set_tag((), "next_update", {feed_url: next_update.isoformat() for feed_url, next_update in schedule.items()})
+
+
+def get_due_feeds(reader: Reader, now: datetime) -> list[str]:
+    """Get the feeds that should be checked now.
+
+    Args:
+        reader: The reader which contains the feeds.
+        now: The current time.
+
+    Returns:
+        The URLs of the feeds, the one that has waited the longest first.
+    """
+    schedule: dict[str, datetime] = get_schedule(reader)
+    next_updates: dict[str, datetime | None] = {
+        feed.url: schedule.get(feed.url) for feed in reader.get_feeds(updates_enabled=True)
+    }
+    due: list[str] = [
+        url for url, next_update in next_updates.items() if next_update is None or next_update <= now + SCHEDULING_SLACK
+    ]
+    return sorted(due, key=lambda url: next_updates[url] or datetime.min.replace(tzinfo=timezone.utc))
+
+
+@dataclass
+class FeedUpdate:
+    """How checking a feed went."""
+
+    got_new: bool = False
+
+    # How long it took, in seconds
+    latency: float = 0.0
+
+    # If Nitter rate limited us, failed on the server or didn't answer
+    overloaded: bool = False
+
+
+def is_overloaded(error: ParseError) -> bool:
+    """Check if the feed update failed because Nitter can't keep up, and not because of the feed itself."""
+    cause: BaseException | None = error.__cause__
+    if isinstance(cause, requests.ConnectionError | requests.Timeout):
+        return True
+    if isinstance(cause, requests.HTTPError) and cause.response is not None:
+        return cause.response.status_code == 429 or cause.response.status_code >= 500  # noqa: PLR2004
+    return False
+
+
+def update_feed(reader: Reader, feed_url: str) -> FeedUpdate:
+    """Check the feed for new tweets.
+
+    Args:
+        reader: The reader which contains the feed.
+        feed_url: The URL of the feed.
+
+    Returns:
+        If we got new tweets and how long it took.
+    """
+    start: float = time.monotonic()
+    try:
+        updated_feed: UpdatedFeed | None = reader.update_feed(feed_url)
+    except ParseError as e:
+        logger.error("Failed to update {}: {}", feed_url, e.__cause__ or e)
+        return FeedUpdate(latency=time.monotonic() - start, overloaded=is_overloaded(e))
+    except FeedNotFoundError:
+        logger.info("Feed {} was removed while we were checking it", feed_url)
+        return FeedUpdate(latency=time.monotonic() - start)
+
+    return FeedUpdate(got_new=bool(updated_feed and updated_feed.new), latency=time.monotonic() - start)
+
+
+def update_feeds(reader: Reader, feed_urls: list[str]) -> dict[str, FeedUpdate]:
+    """Check the feeds for new tweets, fetching as many at the same time as the concurrency controller allows.
+
+    Args:
+        reader: The reader which contains the feeds.
+        feed_urls: The URLs of the feeds to check.
+
+    Returns:
+        How checking each feed went.
+    """
+    controller: ConcurrencyController = get_concurrency_controller()
+    queue: deque[str] = deque(feed_urls)
+    running: dict[Future[FeedUpdate], str] = {}
+    updates: dict[str, FeedUpdate] = {}
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="update") as executor:
+        while queue or running:
+            while queue and len(running) < controller.level:
+                feed_url: str = queue.popleft()
+                running[executor.submit(update_feed, reader, feed_url)] = feed_url
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                feed_update: FeedUpdate = future.result()
+                updates[running.pop(future)] = feed_update
+                controller.record(feed_update.latency, overloaded=feed_update.overloaded)
+
+    return updates
+
+
+def update_due_feeds(reader: Reader) -> None:
+    """Check the feeds that are due and schedule when to check them again.
+
+    This replaces reader.update_feeds(), which checks every feed every time.
+
+    Args:
+        reader: The reader which contains the feeds.
+    """
+    app_settings: ApplicationSettings = get_app_settings(reader)
+    now: datetime = datetime.now(tz=timezone.utc)
+    due_feeds: list[str] = get_due_feeds(reader, now)
+    if not due_feeds:
+        return
+
+    logger.debug("Checking {} feeds for new tweets", len(due_feeds))
+    updates: dict[str, FeedUpdate] = update_feeds(reader, due_feeds)
+
+    # Read the schedule again, the feeds can have been added or removed while we were checking them
+    feed_urls: set[str] = {feed.url for feed in reader.get_feeds()}
+    schedule: dict[str, datetime] = {
+        feed_url: next_update for feed_url, next_update in get_schedule(reader).items() if feed_url in feed_urls
+    }
+    for feed_url, feed_update in updates.items():
+        if feed_url not in feed_urls:
+            continue
+        interval: timedelta = polling_interval(reader, feed_url, app_settings, got_new=feed_update.got_new)
+        schedule[feed_url] = now + interval
+        logger.debug("Checking {} again in {}", feed_url, interval)
+
+    set_schedule(reader, schedule)
@@ -0,0 +1,164 @@
+import asyncio
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+# Discord allows 50 requests per second globally, we stay a bit below that.
+GLOBAL_REQUESTS_PER_SECOND: int = 45
+
+
+@dataclass
+class Bucket:
+    """Discord rate limit bucket for a webhook.
+
+    We don't know the limit until Discord has told us, so we only let one request through until then.
+    """
+
+    # Bucket hash from the X-RateLimit-Bucket header, only used for logging
+    name: str = ""
+
+    # How many requests we can send before the bucket resets
+    limit: int = 1
+    remaining: int = 1
+
+    # When the bucket resets, in time.monotonic() seconds
+    reset_at: float = 0.0
+
+    # How many requests we have sent that Discord hasn't answered yet
+    in_flight: int = 0
+
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class RateLimiter:
+    """Keep track of Discord's rate limits so we wait before sending instead of getting 429s.
+
+    Every webhook has its own bucket that is updated from the X-RateLimit-* headers Discord sends back. There is
+    also a global token bucket for all requests, and a global pause when Discord tells us we hit the global limit.
+    """
+
+    def __init__(self: "RateLimiter", global_requests_per_second: int = GLOBAL_REQUESTS_PER_SECOND) -> None:
+        """Create the rate limiter.
+
+        Args:
+            global_requests_per_second: How many requests we can send per second to all webhooks together.
+        """
+        self.buckets: dict[str, Bucket] = {}
+
+        self.global_requests_per_second: int = global_requests_per_second
+        self.global_tokens: float = global_requests_per_second
+        self.global_updated_at: float = time.monotonic()
+        self.global_lock = asyncio.Lock()
+
+        # When the global rate limit from a 429 is over, in time.monotonic() seconds
+        self.global_reset_at: float = 0.0
+
+    def get_bucket(self: "RateLimiter", url: str) -> Bucket:
+        """Get the bucket for a webhook URL."""
+        if url not in self.buckets:
+            self.buckets[url] = Bucket()
+        return self.buckets[url]
+
+    async def acquire(self: "RateLimiter", url: str) -> None:
+        """Wait until we can send a request to the webhook without being rate limited.
+
+        Every call must be followed by a call to update() when the request is done.
+
+        Args:
+            url: The webhook URL.
+        """
+        bucket: Bucket = self.get_bucket(url)
+        async with bucket.lock:
+            while True:
+                now: float = time.monotonic()
+                # Wait for the answers from the last window before we start the next one, they can still update it.
+                if now >= bucket.reset_at and not bucket.in_flight:
+                    bucket.remaining = bucket.limit
+
+                if bucket.remaining > 0:
+                    break
+
+                delay: float = bucket.reset_at - now if bucket.reset_at > now else 0.05
+                logger.debug("Waiting {:.2f} seconds for rate limit bucket {} to reset", delay, bucket.name or url)
+                await asyncio.sleep(delay)
+
+            bucket.remaining -= 1
+            bucket.in_flight += 1
+
+        await self.acquire_global()
+
+    async def acquire_global(self: "RateLimiter") -> None:
+        """Wait until we are below the global rate limit."""
+        async with self.global_lock:
+            while True:
+                now: float = time.monotonic()
+                if now < self.global_reset_at:
+                    await asyncio.sleep(self.global_reset_at - now)
+                    continue
+
+                elapsed: float = now - self.global_updated_at
+                self.global_updated_at = now
+                self.global_tokens = min(
+                    self.global_tokens + elapsed * self.global_requests_per_second,
+                    self.global_requests_per_second,
+                )
+                if self.global_tokens >= 1:
+                    self.global_tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.global_tokens) / self.global_requests_per_second)
+
+    def update(
+        self: "RateLimiter",
+        url: str,
+        status_code: int | None,
+        headers: Mapping[str, str],
+        body: Mapping[str, object] | None = None,
+    ) -> float:
+        """Update the bucket from the response Discord sent us.
+
+        Args:
+            url: The webhook URL.
+            status_code: The status code, or None if the request failed.
+            headers: The response headers.
+            body: The JSON in the response, used for retry_after if the headers don't have it.
+
+        Returns:
+            How many seconds we have to wait before retrying if we were rate limited, otherwise 0.
+        """
+        bucket: Bucket = self.get_bucket(url)
+        bucket.in_flight = max(bucket.in_flight - 1, 0)
+        if status_code is None:
+            # The request never reached Discord, so give back the request we took.
+            bucket.remaining = min(bucket.remaining + 1, bucket.limit)
+            return 0.0
+
+        now: float = time.monotonic()
+        bucket.name = headers.get("X-RateLimit-Bucket", bucket.name)
+        limit_changed: bool = False
+        if "X-RateLimit-Limit" in headers and int(headers["X-RateLimit-Limit"]) != bucket.limit:
+            bucket.limit = int(headers["X-RateLimit-Limit"])
+            limit_changed = True
+        if "X-RateLimit-Remaining" in headers:
+            remaining: int = max(int(headers["X-RateLimit-Remaining"]) - bucket.in_flight, 0)
+            # Answers can come back in any order, so an older answer can't give us back requests we have used.
+            bucket.remaining = remaining if limit_changed else min(bucket.remaining, remaining)
+        if "X-RateLimit-Reset-After" in headers:
+            bucket.reset_at = now + float(headers["X-RateLimit-Reset-After"])
+
+        if status_code != 429:  # noqa: PLR2004
+            return 0.0
+
+        body = body or {}
+        retry_after = float(headers.get("Retry-After") or body.get("retry_after") or 1)
+        if headers.get("X-RateLimit-Global") == "true" or body.get("global"):
+            logger.warning("Hit the global rate limit, pausing all webhooks for {:.2f} seconds", retry_after)
+            self.global_reset_at = max(self.global_reset_at, now + retry_after)
+        else:
+            logger.warning("Rate limited by {}, retrying in {:.2f} seconds", bucket.name or url, retry_after)
+            bucket.remaining = 0
+            bucket.reset_at = max(bucket.reset_at, now + retry_after)
+
+        return retry_after
@@ -4,6 +4,10 @@ from pathlib import Path
 
 from loguru import logger
 from reader import Reader, make_reader
+from reader.plugins import DEFAULT_PLUGINS
+
+from discord_twitter_webhooks.avatars import avatar_plugin
+from discord_twitter_webhooks.nitter_pool import nitter_pool_plugin
 
 
 def get_data_location() -> Path:
@@ -71,7 +75,7 @@ def get_reader(db_location: Path | None = None) -> Reader:
             gid=Path.group(db_location),
         )
 
-    reader: Reader = make_reader(url=str(db_file))
+    reader: Reader = make_reader(url=str(db_file), plugins=[*DEFAULT_PLUGINS, nitter_pool_plugin, avatar_plugin])
     if reader is None:
         msg = f"Failed to create reader\ndb_location: {db_location}\ndb_file: {db_file}"
         raise RuntimeError(msg)
@@ -1,55 +1,85 @@
-import re
-import tempfile
-from functools import lru_cache
-from pathlib import Path
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from datetime import datetime, timezone
 from typing import TYPE_CHECKING
 
-import requests
-from bs4 import BeautifulSoup
-from defusedxml import ElementTree
 from discord_webhook import DiscordEmbed, DiscordWebhook
 from loguru import logger
-from moviepy.editor import VideoFileClip
 from reader import Entry, Reader
 from reader.types import EntryLike
-from requests import request
 
-from discord_twitter_webhooks._dataclasses import Group, get_app_settings, get_group
+from discord_twitter_webhooks._dataclasses import (
+    Group,
+    Watermark,
+    entry_published,
+    get_watermark,
+)
+from discord_twitter_webhooks.avatars import get_avatar
+from discord_twitter_webhooks.dispatch_plan import get_dispatch_plan
+from discord_twitter_webhooks.link_rewriter import get_link_rewriter
+from discord_twitter_webhooks.outbox import get_outbox
+from discord_twitter_webhooks.parsed_entry import ParsedEntry, parse_entry
+from discord_twitter_webhooks.polling import update_due_feeds
 from discord_twitter_webhooks.reader_settings import get_reader
+from discord_twitter_webhooks.transcode import attach_video
 from discord_twitter_webhooks.tweet_text import get_tweet_text
-from discord_twitter_webhooks.whitelist import check_word_in_string_regex
+from discord_twitter_webhooks.whitelist import get_group_matchers
 
 if TYPE_CHECKING:
-    from xml.etree.ElementTree import Element
+    import sqlite3
 
-    from requests import Response
 
-
-def send_webhook(webhook: DiscordWebhook, entry: Entry | EntryLike, group: Group) -> None:
+def send_webhook(
+    webhook: DiscordWebhook,
+    entry: Entry | EntryLike,
+    group: Group,
+    video_url: str | None = None,
+    dedupe_key: str | None = None,
+) -> None:
     """Send a webhook to Discord.
 
+    The message is stored in the outbox and sent to all the webhooks in the group by the delivery worker.
+
     Args:
         webhook: The webhook to send.
         entry: The entry to send.
         group: The settings to use.
+        video_url: A video to attach the way the group wants, the message is sent when it is ready.
+        dedupe_key: What the message is, it is not sent if a message with the same key is already in the outbox.
     """
-    for _webhook in group.webhooks:
-        logger.debug("Webhook URL: {}", _webhook)
-        webhook.url = _webhook
-        response: Response = webhook.execute()
+    # Only messages with nothing but embeds can be put together with other messages
+    packable: bool = (
+        group.pack_embeds and bool(webhook.embeds) and not webhook.content and not webhook.files and video_url is None
+    )
+    message_id: int | None = get_outbox().enqueue(
+        webhook,
+        group.webhooks,
+        entry.link,
+        packable=packable,
+        media_url=video_url,
+        media_mode=group.media_mode,
+        dedupe_key=dedupe_key,
+    )
+    if message_id is None:
+        logger.info("Not sending {} again, it is already in the outbox", entry.link)
+        return
 
-        if response.ok:
-            logger.info("Webhook posted for {}", entry.link)
-        else:
-            logger.error(f"Got {response.status_code} from {webhook}. Response: {response.text}")
+    if video_url:
+        attach_video(message_id, video_url, group.media_mode)
+    logger.debug("Queued webhook for {}", entry.link)
 
 
-def send_text(entry: Entry | EntryLike, group: Group) -> None:
-    """Send text to Discord.
+def render_text(entry: Entry | EntryLike, group: Group) -> DiscordWebhook:
+    """Create the message for sending the tweet as text.
 
     Args:
         entry: The entry to send.
         group: The settings to use.
+
+    Returns:
+        The message to send.
     """
     # TODO: Append images to the end of the text
     webhook = DiscordWebhook(url="")
@@ -58,78 +88,37 @@ def send_text(entry: Entry | EntryLike, group: Group) -> None:
         logger.debug("No text for {}", entry.link)
         tweet_text = "*Tweet has no text.*"
 
-    entry_link = entry.link
-    if group.link_destination == "Twitter":
-        entry_link = entry_link.replace(get_app_settings(get_reader()).nitter_instance, "https://twitter.com")
-        entry_link = entry_link.rstrip("#m")
+    entry_link: str = get_link_rewriter(group).rewrite_entry_link(entry.link)
 
+    parsed: ParsedEntry = parse_entry(entry)
     action = "tweeted"
-    if entry.title.startswith("RT by "):
+    if parsed.is_retweet:
         action = "retweeted"
-    elif entry.title.startswith("R to "):
-        # TODO: Add the username of the person they replied to
-        replied_to = re.search(r"R to @(\w+)", entry.title)
-        action = f"replied to {replied_to.group(1)}"
+    elif parsed.is_reply:
+        action = f"replied to {parsed.replied_to}"
 
     if group.send_as_text_username:
         tweet_text = f"[{entry.author}](<{entry_link}>) {action}:\n{tweet_text}"
 
-    # Send the tweet text to Discord
     webhook.content = tweet_text
-
-    send_webhook(webhook, entry, group)
-
-
-@lru_cache(maxsize=128)
-def get_avatar(rss_feed: str) -> str:
-    """Get the avatar of the embed.
-
-    Returns:
-        The avatar of the embed as an int.
-    """
-    default_avatar: str = "https://pbs.twimg.com/profile_images/1354479643882004483/Btnfm47p_400x400.jpg"
-    # Go to the RSS feed and get the avatar
-    try:
-        response: Response = request("GET", rss_feed, timeout=5)
-    except requests.exceptions.ReadTimeout as e:
-        logger.error("Read timeout for {} - {}", rss_feed, e)
-        return default_avatar
-
-    if not response.ok:
-        logger.error(f"Got {response.status_code} from {rss_feed}. Response: {response.text}")
-        return default_avatar
-
-    # Parse XML and get the avatar
-    xml_data: str = response.content.decode("utf-8")
-
-    try:
-        root: Element = ElementTree.fromstring(xml_data)
-        found: Element | None = root.find("channel/image/url")
-    except ElementTree.ParseError:
-        logger.error("Unable to parse XML from {}", rss_feed)
-        return default_avatar
-
-    return found.text or default_avatar if found is not None else default_avatar
+    return webhook
 
 
-def create_image_embeds(entry_summary: str, entry_link: str) -> list[DiscordEmbed]:
-    """Get the images from the entry and create embeds from them.
+def create_image_embeds(images: tuple[str, ...], entry_link: str) -> list[DiscordEmbed]:
+    """Create embeds from the images in the entry.
 
     We can unofficially have up to 4 images in an embed.
     https://github.com/lovvskillz/python-discord-webhook/issues/126
 
     Args:
-        entry_summary: The tweet text from the RSS feed. This is HTML.
+        images: The URLs of the images in the tweet, from parse_entry().
         entry_link: The link to the entry.
 
     Returns:
         A list of embeds.
     """
-    if not entry_summary:
-        return []
-
     embeds: list[DiscordEmbed] = []
-    urls = re.findall('src="(https?://[^"]+)"', entry_summary)
+    urls: list[str] = [url for url in images if url.startswith(("http://", "https://"))]
 
     if not urls:
         return embeds
@@ -142,90 +131,218 @@ def create_image_embeds(entry_summary: str, entry_link: str) -> list[DiscordEmbe
     return embeds
 
 
-def send_embed(entry: Entry | EntryLike, group: Group) -> None:
-    """Send an embed to Discord.
+def render_embed(entry: Entry | EntryLike, group: Group) -> DiscordWebhook:
+    """Create the message for sending the tweet as an embed.
 
     Args:
         entry: The entry to send.
         group: The settings to use.
+
+    Returns:
+        The message to send.
     """
     # Replace Nitter links with Twitter links
-    entry_link = entry.link
-    if group.link_destination == "Twitter":
-        entry_link = entry_link.replace(get_app_settings(get_reader()).nitter_instance, "https://twitter.com")
-        entry_link = entry_link.rstrip("#m")
+    entry_link: str = get_link_rewriter(group).rewrite_entry_link(entry.link)
 
     tweet_text: str = get_tweet_text(entry, group)
     embed = DiscordEmbed(description=tweet_text, url=entry_link)
     name_username = entry.feed.title.split(" / @")
 
     entry_author = f"{name_username[0]} (@{name_username[1]})"
-    author_avatar = get_avatar(entry.feed_url)
+    author_avatar = get_avatar(get_reader(), entry.feed_url)
 
     embed.set_author(name=entry_author, url=entry_link, icon_url=author_avatar)
     embed.set_timestamp(timestamp=entry.published.timestamp())
     embed.set_color("1DA1F2")
     embed.set_footer(text="Twitter", icon_url="https://abs.twimg.com/icons/apple-touch-icon-192x192.png")
 
-    if embeds := create_image_embeds(entry.summary, entry_link):
+    parsed: ParsedEntry = parse_entry(entry)
+    if embeds := create_image_embeds(parsed.images, entry_link):
         # Only do this if more than one image is found
         if len(embeds) > 1:
             embeds.insert(0, embed)
-            webhook = DiscordWebhook(url=entry_link, embeds=embeds, rate_limit_retry=True)  # type: ignore  # noqa: PGH003, E501
+            webhook = DiscordWebhook(url=entry_link, embeds=embeds)  # type: ignore  # noqa: PGH003, E501
         else:
             if embeds[0].image:
                 image = embeds[0].image
                 embed.set_image(image["url"])
-            webhook = DiscordWebhook(url=entry_link, rate_limit_retry=True)
+            webhook = DiscordWebhook(url=entry_link)
             webhook.add_embed(embed)
     else:
-        webhook = DiscordWebhook(url=entry_link, rate_limit_retry=True)
+        webhook = DiscordWebhook(url=entry_link)
         webhook.add_embed(embed)
 
-    # Send a link to the mp4 if it's a video or gif
-    soup: BeautifulSoup = BeautifulSoup(entry.summary, features="lxml")
-    source = soup.find("source", attrs={"type": "video/mp4"})
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-    if source:
-        # Download the mp4
-        response: Response = request("GET", source["src"], timeout=5)
-        if response.ok:
-            with Path.open(Path(temp_file.name), "wb") as f:
-                f.write(response.content)
+    # Show the thumbnail of the video until the GIF is ready, and if converting it fails
+    if parsed.poster and not embed.image:
+        embed.set_image(url=parsed.poster)
 
-                # Convert the mp4 to a gif
-                VideoFileClip(temp_file.name).write_gif(temp_file.name.replace(".mp4", ".gif"))
+    return webhook
 
-                # Add the gif to the webhook
-                with Path.open(Path(temp_file.name.replace(".mp4", ".gif")), "rb") as g:
-                    webhook.add_file(file=g.read(), filename="video.gif")
-                embed.set_image(url="attachment://video.gif")
 
-    send_webhook(webhook, entry, group)
+def get_video_url(entry: Entry | EntryLike) -> str | None:
+    """Get the URL of the mp4 if the tweet has a video or gif.
 
-    # Remove our temporary files
-    if Path.exists(Path(temp_file.name)):
-        temp_file.close()
-        Path.unlink(Path(temp_file.name))
+    Args:
+        entry: The entry to check.
 
+    Returns:
+        The URL of the mp4, or None if the tweet doesn't have one.
+    """
+    videos: tuple[str, ...] = parse_entry(entry).videos
+    return videos[0] if videos else None
 
-def send_link(entry: Entry | EntryLike, group: Group) -> None:
-    """Send a link to Discord.
+
+def render_link(entry: Entry | EntryLike, group: Group) -> DiscordWebhook:
+    """Create the message for sending a link to the tweet.
 
     Args:
         entry: The entry to send.
         group: The settings to use.
+
+    Returns:
+        The message to send.
     """
     # TODO: Change webhook username to the tweeter so we can see who posted it?
     # TODO: Append username and action (tweeted, retweeted, liked) to the webhook username or content?
 
     # Replace Nitter links with Twitter links
-    entry_link = entry.link
-    if group.link_destination == "Twitter":
-        entry_link = entry_link.replace(get_app_settings(get_reader()).nitter_instance, "https://twitter.com")
-        entry_link = entry_link.rstrip("#m")
+    entry_link: str = get_link_rewriter(group).rewrite_entry_link(entry.link)
+
+    return DiscordWebhook(url="", content=f"{entry_link}")
+
+
+# How we render each output mode
+_renderers: dict[str, Callable[[Entry | EntryLike, Group], DiscordWebhook]] = {
+    "text": render_text,
+    "embed": render_embed,
+    "link": render_link,
+}
 
-    send_webhook(DiscordWebhook(url="", content=f"{entry_link}"), entry, group)
+# How many rendered messages we keep in memory
+RENDER_CACHE_SIZE: int = 512
+
+# Rendered messages, see get_rendered_webhook()
+_render_cache: OrderedDict[tuple[Hashable, ...], DiscordWebhook] = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+
+def render_fingerprint(group: Group, mode: str) -> tuple[Hashable, ...]:
+    """Get the settings of the group that change how a tweet is rendered.
+
+    Groups with the same fingerprint get the same message, so we only have to render it once for all of them.
+
+    Args:
+        group: The group to get the fingerprint for.
+        mode: The output mode, "text", "embed" or "link".
+
+    Returns:
+        The fingerprint.
+    """
+    if mode == "link":
+        return (mode, group.link_destination)
+
+    fingerprint: tuple[Hashable, ...] = (
+        mode,
+        group.link_destination,
+        group.replace_youtube,
+        group.replace_reddit,
+        group.unescape_html,
+        group.remove_copyright,
+        group.translate,
+    )
+    if group.translate:
+        fingerprint += (group.translate_from, group.translate_to)
+    if mode == "text":
+        fingerprint += (group.send_as_text_username,)
+    return fingerprint
+
+
+def get_rendered_webhook(entry: Entry | EntryLike, group: Group, mode: str) -> DiscordWebhook:
+    """Render the message for the entry, or get it from the cache if another group already rendered it.
+
+    Args:
+        entry: The entry to send.
+        group: The settings to use.
+        mode: The output mode, "text", "embed" or "link".
+
+    Returns:
+        The message to send. It is shared between groups, so don't change it.
+    """
+    key: tuple[Hashable, ...] = (entry.feed_url, entry.id, entry.updated, render_fingerprint(group, mode))
+    with _render_cache_lock:
+        if key in _render_cache:
+            _render_cache.move_to_end(key)
+            logger.debug("Using already rendered {} for {}", mode, entry.link)
+            return _render_cache[key]
+
+    webhook: DiscordWebhook = _renderers[mode](entry, group)
+    with _render_cache_lock:
+        _render_cache[key] = webhook
+        if len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return webhook
+
+
+def invalidate_render_cache() -> None:
+    """Forget every rendered message, this is done when the application settings are changed."""
+    with _render_cache_lock:
+        _render_cache.clear()
+
+
+def dedupe_key(entry: Entry | EntryLike, group: Group, mode: str) -> str:
+    """Get what a message is, so the same entry isn't sent to a group twice in the same way.
+
+    Args:
+        entry: The entry to send.
+        group: The group it is sent to.
+        mode: How it is sent, "text", "embed" or "link".
+
+    Returns:
+        The key for the outbox.
+    """
+    return json.dumps([entry.feed_url, entry.id, group.uuid, mode])
+
+
+def send_text(entry: Entry | EntryLike, group: Group, *, resend: bool = False) -> None:
+    """Send text to Discord.
+
+    Args:
+        entry: The entry to send.
+        group: The settings to use.
+        resend: Send the entry even if it is already in the outbox.
+    """
+    key: str | None = None if resend else dedupe_key(entry, group, "text")
+    send_webhook(get_rendered_webhook(entry, group, "text"), entry, group, dedupe_key=key)
+
+
+def send_embed(entry: Entry | EntryLike, group: Group, *, resend: bool = False) -> None:
+    """Send an embed to Discord.
+
+    Args:
+        entry: The entry to send.
+        group: The settings to use.
+        resend: Send the entry even if it is already in the outbox.
+    """
+    key: str | None = None if resend else dedupe_key(entry, group, "embed")
+    send_webhook(
+        get_rendered_webhook(entry, group, "embed"),
+        entry,
+        group,
+        video_url=get_video_url(entry),
+        dedupe_key=key,
+    )
+
+
+def send_link(entry: Entry | EntryLike, group: Group, *, resend: bool = False) -> None:
+    """Send a link to Discord.
+
+    Args:
+        entry: The entry to send.
+        group: The settings to use.
+        resend: Send the entry even if it is already in the outbox.
+    """
+    key: str | None = None if resend else dedupe_key(entry, group, "link")
+    send_webhook(get_rendered_webhook(entry, group, "link"), entry, group, dedupe_key=key)
 
 
 def has_media(entry: Entry | EntryLike) -> bool:
@@ -237,10 +354,7 @@ def has_media(entry: Entry | EntryLike) -> bool:
     Returns:
         True if the entry has media, False otherwise.
     """
-    soup: BeautifulSoup = BeautifulSoup(entry.summary, features="lxml")
-    video_files = bool(soup.find("source", attrs={"type": "video/mp4"}))
-    images = bool(soup.find("img"))
-    return video_files or images
+    return parse_entry(entry).has_media
 
 
 def whitelisted(group: Group, entry: Entry | EntryLike) -> bool:
@@ -253,11 +367,7 @@ def whitelisted(group: Group, entry: Entry | EntryLike) -> bool:
     Returns:
         True if the entry is whitelisted, False otherwise.
     """
-    for word in group.whitelist:
-        if word.lower() in entry.title.lower():
-            return True
-
-    return any(check_word_in_string_regex(entry.title, regex_pattern) for regex_pattern in group.whitelist_regex)
+    return get_group_matchers(group).whitelist.matches(entry.title)
 
 
 def blacklisted(group: Group, entry: Entry | EntryLike) -> bool:
@@ -270,91 +380,217 @@ def blacklisted(group: Group, entry: Entry | EntryLike) -> bool:
     Returns:
         True if the entry is blacklisted, False otherwise.
     """
-    for word in group.blacklist:
-        if word.lower() in entry.title.lower():
-            return True
+    return get_group_matchers(group).blacklist.matches(entry.title)
+
+
+# How many entries we handle before writing their read state to the database
+READ_STATE_FLUSH_SIZE: int = 100
+
+
+class ReadStateBatch:
+    """Entries to mark as read and feed watermarks to save, written to the database together.
+
+    An entry is only written once even if it is marked as read several times, and entries that are already read
+    are not written at all.
+    """
+
+    def __init__(self: "ReadStateBatch", reader: Reader) -> None:
+        self.reader: Reader = reader
+        self.entries: dict[tuple[str, str], Entry | EntryLike] = {}
+        self.watermarks: dict[str, Watermark] = {}
+
+    def mark_as_read(self: "ReadStateBatch", entry: Entry | EntryLike) -> None:
+        """Mark the entry as read when the batch is flushed."""
+        self.entries[entry.feed_url, entry.id] = entry
 
-    return any(check_word_in_string_regex(entry.title, regex_pattern) for regex_pattern in group.blacklist_regex)
+    def set_watermark(self: "ReadStateBatch", feed_url: str, watermark: Watermark) -> None:
+        """Save the watermark for the feed when the batch is flushed."""
+        self.watermarks[feed_url] = watermark
 
+    def __len__(self: "ReadStateBatch") -> int:
+        return len(self.entries)
 
-def send_to_discord(reader: Reader) -> None:  # noqa: C901, PLR0912
+    def flush(self: "ReadStateBatch") -> None:
+        """Write the read state and watermarks to the database in one transaction.
+
+        reader commits every entry it marks as read on its own, which holds the database lock the website is waiting
+        for thousands of times when we catch up. So we write to reader's database ourselves, with the same values
+        reader would write.
+        """
+        if not self.entries and not self.watermarks:
+            return
+
+        unread_entries: list[Entry | EntryLike] = [entry for entry in self.entries.values() if not entry.read]
+
+        # reader stores naive UTC datetimes
+        modified: datetime = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+        db: sqlite3.Connection = self.reader._storage.get_db()  # noqa: SLF001
+        with db:
+            db.executemany(
+                "UPDATE entries SET read = 1, read_modified = ? WHERE feed = ? AND id = ?",
+                [(modified, entry.feed_url, entry.id) for entry in unread_entries],
+            )
+
+            # Feeds that were removed while we were sending don't get a watermark
+            db.executemany(
+                "INSERT OR REPLACE INTO feed_tags (feed, key, value) SELECT url, 'watermark', ? FROM feeds WHERE"
+                " url = ?",
+                [(json.dumps(watermark.__dict__), feed_url) for feed_url, watermark in self.watermarks.items()],
+            )
+
+        logger.debug("Marked {} entries as read and saved {} watermarks", len(unread_entries), len(self.watermarks))
+        self.entries.clear()
+        self.watermarks.clear()
+
+
+def send_to_discord(reader: Reader) -> None:
     """Send all new entries to Discord.
 
-    This is called by the scheduler every 15 minutes. It will check for new entries and send them to Discord.
+    This is called by the scheduler every 15 minutes. It will check the feeds that are due for new entries and
+    send them to Discord.
 
     Args:
         reader: The reader which contains the entries.
     """
-    reader.update_feeds(workers=4)
+    update_due_feeds(reader)
 
-    # Loop through the unread (unsent) entries.
-    entries = list(reader.get_entries(read=False))
+    # Loop through the unread (unsent) entries, oldest first so the watermarks only move forward.
+    entries = sorted(reader.get_entries(read=False), key=entry_published)
 
     if not entries:
         return
 
-    entry: Entry | EntryLike
-    for entry in entries:
-        # Don't send tweets that are older than the oldest tweet we have
-        the_oldest_tweet = reader.get_entries(read=True)
+    read_state = ReadStateBatch(reader)
+    try:
+        _send_entries(reader, entries, read_state)
+    finally:
+        read_state.flush()
+
+
+def _get_watermarks(
+    reader: Reader,
+    entries: list[Entry | EntryLike],
+    read_state: ReadStateBatch,
+) -> dict[str, Watermark]:
+    """Get the watermarks for the feeds of the entries.
 
-        if not the_oldest_tweet:
+    Feeds we have never sent anything from are marked as read and get a watermark instead.
+
+    Args:
+        reader: The reader which contains the feeds.
+        entries: The unread entries, oldest first.
+        read_state: Where to put the entries that should be marked as read.
+
+    Returns:
+        The watermarks, with the feed URL as key.
+    """
+    watermarks: dict[str, Watermark] = {}
+    for feed_url in {entry.feed_url for entry in entries}:
+        watermark: Watermark | None = get_watermark(reader, feed_url)
+        if watermark is None:
             # Related: https://github.com/TheLovinator1/discord-twitter-webhooks/issues/132
-            # Get and mark every entry as read
+            # We have never sent anything from this feed, so mark every entry in it as read
+            feed_entries = [_entry for _entry in entries if _entry.feed_url == feed_url]
             _entry: Entry | EntryLike
-            for _entry in reader.get_entries(read=False):
-                reader.mark_entry_as_read(_entry)
+            for _entry in feed_entries:
+                read_state.mark_as_read(_entry)
+
+            newest_entry = feed_entries[-1]
+            read_state.set_watermark(
+                feed_url,
+                Watermark(
+                    published=entry_published(newest_entry).isoformat(),
+                    entry_id=newest_entry.id,
+                    oldest=entry_published(feed_entries[0]).isoformat(),
+                ),
+            )
             continue
 
-        # Sort the tweets by date
-        the_oldest_tweet = sorted(the_oldest_tweet, key=lambda x: x.published)
+        watermarks[feed_url] = watermark
+    return watermarks
+
+
+def _send_entries(  # noqa: C901, PLR0912
+    reader: Reader,
+    entries: list[Entry | EntryLike],
+    read_state: ReadStateBatch,
+) -> None:
+    """Send the entries to the groups that subscribe to their feed.
+
+    Args:
+        reader: The reader which contains the groups.
+        entries: The unread entries, oldest first.
+        read_state: Where to put the entries that should be marked as read.
+    """
+    watermarks: dict[str, Watermark] = _get_watermarks(reader, entries, read_state)
 
-        # Check if the entry is older than the oldest tweet we have
-        if entry.published < the_oldest_tweet[0].published:
+    entry: Entry | EntryLike
+    for entry in entries:
+        if len(read_state) >= READ_STATE_FLUSH_SIZE:
+            read_state.flush()
+
+        watermark = watermarks.get(entry.feed_url)
+        if watermark is None:
+            # The feed was marked as read above
+            continue
+
+        # Don't send tweets that are older than the oldest tweet we have
+        if watermark.is_history(entry):
             # Related: https://github.com/TheLovinator1/discord-twitter-webhooks/issues/129#issuecomment-1646086754
             logger.info("Skipping entry {} as it is older than the oldest tweet we have", entry)
-            reader.mark_entry_as_read(entry)
+            read_state.mark_as_read(entry)
             continue
 
-        for _group in reader.get_tag((), "groups", []):
-            group = get_group(reader, str(_group))
-            if not group:
-                logger.error("Group {} not found", _group)
+        if watermark.is_newest(entry):
+            logger.info("Skipping entry {} as it has already been sent", entry)
+            read_state.mark_as_read(entry)
+            continue
+
+        if not watermark.is_newer(entry):
+            logger.info("Sending entry {} which is older than the newest tweet we have sent", entry)
+
+        groups: list[Group] = get_dispatch_plan(reader).get(entry.feed_url, [])
+        if not groups:
+            logger.info("Skipping entry {} as no group is using its feed", entry)
+
+        for group in groups:
+            if group.whitelist_enabled and not whitelisted(group, entry):
+                logger.info(f"Skipping entry {entry} as it is not whitelisted")
+                continue
+
+            if group.blacklist_enabled and blacklisted(group, entry):
+                logger.info(f"Skipping entry {entry} as it is blacklisted")
+                continue
+
+            parsed: ParsedEntry = parse_entry(entry)
+            if not group.send_retweets and parsed.is_retweet:
+                logger.info(f"Skipping entry {entry} as it is a retweet")
+                continue
+
+            if not group.send_replies and parsed.is_reply:
+                logger.info(f"Skipping entry {entry} as it is a reply")
+                continue
+
+            if group.only_send_if_media and not parsed.has_media:
+                logger.info(f"Skipping entry {entry} as it has no media attached")
                 continue
 
-            for feeds in group.rss_feeds:
-                if group.whitelist_enabled and not whitelisted(group, entry):
-                    logger.info(f"Skipping entry {entry} as it is not whitelisted")
-                    reader.mark_entry_as_read(entry)
-                    continue
-
-                if group.blacklist_enabled and blacklisted(group, entry):
-                    logger.info(f"Skipping entry {entry} as it is blacklisted")
-                    reader.mark_entry_as_read(entry)
-                    continue
-
-                if not group.send_retweets and entry.title.startswith("RT by "):
-                    logger.info(f"Skipping entry {entry} as it is a retweet")
-                    reader.mark_entry_as_read(entry)
-                    continue
-
-                if not group.send_replies and entry.title.startswith("R to "):
-                    logger.info(f"Skipping entry {entry} as it is a reply")
-                    reader.mark_entry_as_read(entry)
-                    continue
-
-                if group.only_send_if_media and not has_media(entry):
-                    logger.info(f"Skipping entry {entry} as it has no media attached")
-                    reader.mark_entry_as_read(entry)
-                    continue
-
-                if entry.feed_url == feeds:
-                    if group.send_as_link:
-                        send_link(entry=entry, group=group)
-                    if group.send_as_text:
-                        send_text(entry=entry, group=group)
-                    if group.send_as_embed:
-                        send_embed(entry=entry, group=group)
-
-                    # Mark the entry as read (sent)
-                    reader.mark_entry_as_read(entry)
+            if group.send_as_link:
+                send_link(entry=entry, group=group)
+            if group.send_as_text:
+                send_text(entry=entry, group=group)
+            if group.send_as_embed:
+                send_embed(entry=entry, group=group)
+
+        # Mark the entry as read (sent)
+        read_state.mark_as_read(entry)
+
+        # The watermark only moves forward, retweets of old tweets and late entries don't move it back
+        if watermark.is_newer(entry):
+            watermark = Watermark(
+                published=entry_published(entry).isoformat(),
+                entry_id=entry.id,
+                oldest=watermark.oldest,
+            )
+            watermarks[entry.feed_url] = watermark
+            read_state.set_watermark(entry.feed_url, watermark)
@@ -0,0 +1,307 @@
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from discord_twitter_webhooks.gif_encoder import encode_gif
+from discord_twitter_webhooks.media_cache import MediaCache, get_media_cache
+from discord_twitter_webhooks.media_download import MAX_MEDIA_BYTES, download_to_file, probe_size
+from discord_twitter_webhooks.media_workspace import MediaWorkspace, get_media_workspace
+from discord_twitter_webhooks.outbox import Outbox, get_outbox
+
+if TYPE_CHECKING:
+    from discord_twitter_webhooks._dataclasses import ApplicationSettings, MediaMode
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# How many videos we convert at the same time
+MAX_TRANSCODE_WORKERS: int = 2
+
+# How long a conversion can take before we give up and send the thumbnail instead
+TRANSCODE_TIMEOUT_SECONDS: int = 120
+
+# How much memory the process converting a video can use, only enforced on Unix
+TRANSCODE_MEMORY_LIMIT_BYTES: int = 2 * 1024 * 1024 * 1024
+
+# The biggest file we can attach to a message, Discord's limit for servers without boosts
+DEFAULT_UPLOAD_LIMIT_BYTES: int = 25 * 1024 * 1024
+
+# Names for the downloaded video and the GIF in the media cache. Change GIF_PARAMETERS when the GIFs change, the
+# upload limit is added to it since GIFs are made to fit it.
+SOURCE_PARAMETERS: str = "source"
+GIF_PARAMETERS: str = "gif-budget"
+
+
+def _convert_to_gif(video_file: str, gif_file: str, memory_limit: int, max_bytes: int) -> None:
+    """Convert a video to a GIF, this runs in its own process.
+
+    Args:
+        video_file: The video to convert.
+        gif_file: Where to save the GIF.
+        memory_limit: How much memory the process and ffmpeg can use, in bytes.
+        max_bytes: The biggest the GIF can be.
+    """
+    if hasattr(os, "setsid"):
+        # Start a process group, so ffmpeg is killed with us if we take too long
+        os.setsid()
+    if resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    if not encode_gif(Path(video_file), Path(gif_file), max_bytes):
+        sys.exit(1)
+
+
+def _kill(process: multiprocessing.process.BaseProcess) -> None:
+    """Kill the process converting a video and the ffmpeg it started."""
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)  # type: ignore  # noqa: PGH003
+        except ProcessLookupError:
+            return
+    else:
+        process.kill()
+
+
+class Transcoder:
+    """Get the video of a tweet ready to attach, without blocking checking for or sending tweets.
+
+    Depending on the media mode of the group we attach the original MP4 if it is small enough, or convert it to a
+    GIF. Converting is the slow part, so we only do it when the group wants a GIF or the MP4 is too big. Every
+    conversion gets its own process that is killed if it takes too long, and on Unix it can't use more than
+    TRANSCODE_MEMORY_LIMIT_BYTES of memory. If the same video is requested while it is being converted, we only
+    convert it once, and downloaded videos and GIFs are kept in the media cache for the next time.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: "Transcoder",
+        *,
+        workers: int = MAX_TRANSCODE_WORKERS,
+        timeout: int = TRANSCODE_TIMEOUT_SECONDS,
+        memory_limit: int = TRANSCODE_MEMORY_LIMIT_BYTES,
+        cache: MediaCache | None = None,
+        upload_limit: int = DEFAULT_UPLOAD_LIMIT_BYTES,
+        workspace: MediaWorkspace | None = None,
+    ) -> None:
+        """Create the transcoder.
+
+        Args:
+            workers: How many videos to convert at the same time.
+            timeout: How long a conversion can take, in seconds.
+            memory_limit: How much memory a conversion can use, in bytes.
+            cache: Where to keep downloaded videos and GIFs, or None to not keep them.
+            upload_limit: The biggest file we can attach, in bytes.
+            workspace: Where to download and convert videos, the shared media workspace if None.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcode")
+        self.timeout: int = timeout
+        self.memory_limit: int = memory_limit
+        self.cache: MediaCache | None = cache
+        self.upload_limit: int = upload_limit
+        self.workspace: MediaWorkspace = workspace or get_media_workspace()
+
+        # Jobs that are running or waiting, by video URL and media mode
+        self.jobs: dict[tuple[str, MediaMode], Future[tuple[str, bytes] | None]] = {}
+        self.lock = threading.Lock()
+
+        # Spawn instead of fork, forking a process with threads can deadlock
+        self.context = multiprocessing.get_context("spawn")
+
+    def submit(
+        self: "Transcoder",
+        video_url: str,
+        media_mode: "MediaMode",
+        callback: Callable[[tuple[str, bytes] | None], None],
+    ) -> None:
+        """Get the video ready to attach in the background.
+
+        Args:
+            video_url: The URL of the MP4.
+            media_mode: If we should attach the MP4, a GIF, or the MP4 if it is small enough and a GIF otherwise.
+            callback: Called with the filename and the file, or None if we can't attach the video.
+        """
+        key: tuple[str, MediaMode] = (video_url, media_mode)
+        with self.lock:
+            future: Future[tuple[str, bytes] | None] | None = self.jobs.get(key)
+            if future is None:
+                future = self.executor.submit(self.prepare, video_url, media_mode)
+                self.jobs[key] = future
+                future.add_done_callback(lambda done: self._forget(key, done))
+
+        future.add_done_callback(lambda done: callback(done.result() if done.exception() is None else None))
+
+    def _forget(self: "Transcoder", key: tuple[str, "MediaMode"], future: Future[tuple[str, bytes] | None]) -> None:
+        with self.lock:
+            self.jobs.pop(key, None)
+        if error := future.exception():
+            logger.error("Failed to get {} ready to attach: {}", key[0], error)
+
+    def prepare(self: "Transcoder", video_url: str, media_mode: "MediaMode") -> tuple[str, bytes] | None:
+        """Get the file to attach for a video.
+
+        Args:
+            video_url: The URL of the MP4.
+            media_mode: "mp4", "gif" or "auto" for the MP4 if it is small enough and a GIF otherwise.
+
+        Returns:
+            The filename and the file, or None if we can't attach the video.
+        """
+        if media_mode != "gif":
+            if (video := self.original(video_url)) is not None:
+                return "video.mp4", video
+            if media_mode == "mp4":
+                return None
+            logger.debug("{} is too big to attach, converting it to a GIF", video_url)
+
+        gif: bytes | None = self.transcode(video_url)
+        if gif is None:
+            return None
+        if len(gif) > self.upload_limit:
+            logger.error("The GIF for {} is {} bytes, too big to attach", video_url, len(gif))
+            return None
+        return "video.gif", gif
+
+    def original(self: "Transcoder", video_url: str) -> bytes | None:
+        """Get the MP4 if it is small enough to attach.
+
+        We check the size of the cached video or ask the server for it first, so videos that are too big are not read
+        or downloaded.
+
+        Args:
+            video_url: The URL of the MP4.
+
+        Returns:
+            The MP4, or None if it is too big or the download failed.
+        """
+        # The cached video is only read if it is small enough
+        if self.cache and (cached_size := self.cache.file_size(video_url, SOURCE_PARAMETERS)) is not None:
+            if cached_size > self.upload_limit:
+                return None
+            if (video := self.cache.get(video_url, SOURCE_PARAMETERS)) is not None:
+                return video
+
+        size: int | None = probe_size(video_url)
+        if size is not None and size > self.upload_limit:
+            return None
+
+        with self.workspace.job(reserve_bytes=self.upload_limit) as job_dir:
+            video_file: Path = job_dir / "video.mp4"
+            if not download_to_file(video_url, video_file, max_bytes=self.upload_limit):
+                return None
+            if self.cache:
+                self.cache.put_file(video_url, SOURCE_PARAMETERS, video_file)
+            return video_file.read_bytes()
+
+    def transcode(self: "Transcoder", video_url: str) -> bytes | None:
+        """Download a video and convert it to a GIF.
+
+        Args:
+            video_url: The URL of the MP4 to convert.
+
+        Returns:
+            The GIF, or None if the download or the conversion failed.
+        """
+        gif_parameters: str = f"{GIF_PARAMETERS}:{self.upload_limit}"
+        if self.cache and (gif := self.cache.get(video_url, gif_parameters)) is not None:
+            logger.debug("Using cached GIF for {}", video_url)
+            return gif
+
+        # The video, and the GIF which is at most the upload limit
+        with self.workspace.job(reserve_bytes=MAX_MEDIA_BYTES + self.upload_limit) as job_dir:
+            video_file: Path = job_dir / "video.mp4"
+            gif_file: Path = job_dir / "video.gif"
+
+            if not (self.cache and self.cache.copy_to(video_url, SOURCE_PARAMETERS, video_file)):
+                if not download_to_file(video_url, video_file):
+                    return None
+                if self.cache:
+                    self.cache.put_file(video_url, SOURCE_PARAMETERS, video_file)
+
+            gif = self.convert(video_url, video_file, gif_file)
+
+        if gif is not None and self.cache:
+            self.cache.put(video_url, gif_parameters, gif)
+        return gif
+
+    def convert(self: "Transcoder", video_url: str, video_file: Path, gif_file: Path) -> bytes | None:
+        """Convert a video to a GIF in a separate process.
+
+        Args:
+            video_url: The URL of the video, used for logging.
+            video_file: The MP4.
+            gif_file: Where to save the GIF.
+
+        Returns:
+            The GIF, or None if the conversion failed or took too long.
+        """
+        process = self.context.Process(
+            target=_convert_to_gif,
+            args=(str(video_file), str(gif_file), self.memory_limit, self.upload_limit),
+            name="transcode",
+            daemon=True,
+        )
+        process.start()
+        process.join(self.timeout)
+        if process.is_alive():
+            logger.error("Converting {} took more than {} seconds, giving up", video_url, self.timeout)
+            _kill(process)
+            process.join()
+            return None
+
+        if process.exitcode != 0 or not gif_file.exists():
+            logger.error("Failed to convert {} to a GIF, exit code {}", video_url, process.exitcode)
+            return None
+
+        logger.debug("Converted {} to a GIF", video_url)
+        return gif_file.read_bytes()
+
+
+@lru_cache(maxsize=1)
+def get_transcoder() -> Transcoder:
+    """Get the transcoder, it is created the first time we convert a video."""
+    return Transcoder(cache=get_media_cache())
+
+
+def configure_transcoder(app_settings: "ApplicationSettings") -> None:
+    """Use the upload limit from the settings."""
+    get_transcoder().upload_limit = app_settings.upload_limit * 1024 * 1024
+
+
+def attach_video(message_id: int, video_url: str, media_mode: "MediaMode", outbox: Outbox | None = None) -> None:
+    """Attach the video in a message as an MP4 or a GIF. The message is sent when the video is attached.
+
+    If the video can't be attached the message is sent with the thumbnail of the video instead.
+
+    Args:
+        message_id: The message in the outbox.
+        video_url: The URL of the MP4.
+        media_mode: "mp4", "gif" or "auto" for the MP4 if it is small enough and a GIF otherwise.
+        outbox: The outbox the message is in.
+    """
+    outbox = get_outbox() if outbox is None else outbox
+
+    def done(media: tuple[str, bytes] | None) -> None:
+        if media is None:
+            outbox.release_media(message_id)
+        else:
+            outbox.attach_media(message_id, *media)
+
+    get_transcoder().submit(video_url, media_mode, done)
+
+
+def resume_transcoding(outbox: Outbox | None = None) -> None:
+    """Get the videos again for messages that were waiting for them when the bot stopped."""
+    outbox = get_outbox() if outbox is None else outbox
+    for message_id, video_url, media_mode in outbox.waiting_for_media():
+        logger.info("Getting {} again after a restart", video_url)
+        attach_video(message_id, video_url, media_mode, outbox)
@@ -3,6 +3,7 @@ from loguru import logger
 
 from discord_twitter_webhooks._dataclasses import get_app_settings
 from discord_twitter_webhooks.reader_settings import get_reader
+from discord_twitter_webhooks.translation_cache import TranslationCache, get_translation_cache
 
 _languages = {
     "bg": "Bulgarian",
@@ -46,8 +47,22 @@ languages_to["pt-BR"] = "Portuguese (Brazilian)"
 languages_to["pt-PT"] = "Portuguese (European)"
 
 
-def translate_html(html: str, translate_from: str | None = "auto", translate_to: languages_to = "en") -> str:
-    """Translate HTML text to another language."""
+def translate_html(
+    html: str,
+    translate_from: str | None = "auto",
+    translate_to: languages_to = "en",
+    cache: TranslationCache | None = None,
+) -> str:
+    """Translate HTML text to another language.
+
+    Translations are cached, so the same text is only sent to DeepL once for every language.
+    """
+    cache = get_translation_cache() if cache is None else cache
+    source_lang: str = translate_from or "auto"
+    if (translation := cache.get(html, source_lang, translate_to)) is not None:
+        logger.debug("Using cached translation to {}", translate_to)
+        return translation
+
     if translate_from == "auto":
         logger.debug("Auto-detecting language when translating.")
         translate_from = None
@@ -69,4 +84,5 @@ def translate_html(html: str, translate_from: str | None = "auto", translate_to:
         logger.error("Error while translating: {}", e)
         return html
 
+    cache.put(html, source_lang, translate_to, result.text)
     return result.text
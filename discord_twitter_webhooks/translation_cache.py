@@ -0,0 +1,202 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+
+from discord_twitter_webhooks.reader_settings import get_data_location
+
+if TYPE_CHECKING:
+    from discord_twitter_webhooks._dataclasses import ApplicationSettings
+
+# How much space the translations can use before we remove the ones we haven't used for the longest, in megabytes
+DEFAULT_TRANSLATION_CACHE_MEGABYTES: int = 50
+
+# How long we keep a translation, DeepL gets better and tweets are rarely sent again after a while
+TRANSLATION_TTL_SECONDS: int = 30 * 24 * 60 * 60
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS translations (
+    source_hash TEXT NOT NULL,
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (source_hash, source_lang, target_lang)
+);
+CREATE INDEX IF NOT EXISTS translations_by_use ON translations(used_at);
+"""
+
+
+def source_hash(html: str) -> str:
+    """Get the SHA-256 of the HTML we translate, the cache is keyed by it instead of the HTML itself."""
+    return hashlib.sha256(html.encode()).hexdigest()
+
+
+class TranslationCache:
+    """Translations from DeepL stored in SQLite, so the same tweet is only translated once for every language.
+
+    Translations are keyed by the SHA-256 of the HTML and the languages, so groups that translate the same tweet
+    share it and it survives a restart. Translations older than the TTL are not used, and when the translations use
+    more than max_bytes the ones we haven't used for the longest are removed.
+    """
+
+    def __init__(self: "TranslationCache", db_file: Path, max_bytes: int, ttl_seconds: int) -> None:
+        """Open the database and create the table if it doesn't exist.
+
+        Args:
+            db_file: Where to store the database.
+            max_bytes: How much space the translations can use.
+            ttl_seconds: How long a translation is used.
+        """
+        self.lock = threading.Lock()
+        self.db: sqlite3.Connection = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(_SCHEMA)
+        self.max_bytes: int = max_bytes
+        self.ttl_seconds: int = ttl_seconds
+        self.size: int = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM translations").fetchone()[0]
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.expired: int = 0
+
+        # How many characters we didn't have to send to DeepL, they count against the quota
+        self.saved_characters: int = 0
+
+    def get(self: "TranslationCache", html: str, source_lang: str, target_lang: str) -> str | None:
+        """Get a translation.
+
+        Args:
+            html: The HTML that was translated.
+            source_lang: The language it was translated from, "auto" if DeepL detected it.
+            target_lang: The language it was translated to.
+
+        Returns:
+            The translation, or None if we don't have it.
+        """
+        key: tuple[str, str, str] = (source_hash(html), source_lang, target_lang)
+        now: float = time.time()
+        with self.lock:
+            row: tuple[str, int, float] | None = self.db.execute(
+                "SELECT translation, size, created_at FROM translations"
+                " WHERE source_hash = ? AND source_lang = ? AND target_lang = ?",
+                key,
+            ).fetchone()
+            if row is not None and row[2] < now - self.ttl_seconds:
+                self._delete([key], row[1])
+                self.expired += 1
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.db.execute(
+                "UPDATE translations SET used_at = ? WHERE source_hash = ? AND source_lang = ? AND target_lang = ?",
+                (now, *key),
+            )
+            self.hits += 1
+            self.saved_characters += len(html)
+            return row[0]
+
+    def put(self: "TranslationCache", html: str, source_lang: str, target_lang: str, translation: str) -> None:
+        """Store a translation.
+
+        Args:
+            html: The HTML that was translated.
+            source_lang: The language it was translated from, "auto" if DeepL detected it.
+            target_lang: The language it was translated to.
+            translation: The translated HTML.
+        """
+        key: tuple[str, str, str] = (source_hash(html), source_lang, target_lang)
+        size: int = len(translation.encode()) + len(key[0])
+        now: float = time.time()
+        with self.lock:
+            old: tuple[int] | None = self.db.execute(
+                "SELECT size FROM translations WHERE source_hash = ? AND source_lang = ? AND target_lang = ?",
+                key,
+            ).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, translation, size, now, now),
+            )
+            self.size += size - (old[0] if old else 0)
+            self._evict()
+
+    def resize(self: "TranslationCache", max_bytes: int) -> None:
+        """Change how much space the translations can use, and remove translations if they use more."""
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _delete(self: "TranslationCache", keys: list[tuple[str, str, str]], size: int) -> None:
+        self.db.executemany(
+            "DELETE FROM translations WHERE source_hash = ? AND source_lang = ? AND target_lang = ?",
+            keys,
+        )
+        self.size -= size
+
+    def _evict(self: "TranslationCache") -> None:
+        if self.size <= self.max_bytes:
+            return
+
+        # Translations that are too old to be used go first
+        expired: list[tuple[str, str, str, int]] = self.db.execute(
+            "SELECT source_hash, source_lang, target_lang, size FROM translations WHERE created_at < ?",
+            (time.time() - self.ttl_seconds,),
+        ).fetchall()
+        self._delete([row[:3] for row in expired], sum(row[3] for row in expired))
+        self.expired += len(expired)
+
+        keys: list[tuple[str, str, str]] = []
+        freed: int = 0
+        rows = self.db.execute(
+            "SELECT source_hash, source_lang, target_lang, size FROM translations ORDER BY used_at, rowid",
+        )
+        for *key, size in rows:
+            if self.size - freed <= self.max_bytes:
+                break
+            keys.append(tuple(key))
+            freed += size
+
+        if keys:
+            self._delete(keys, freed)
+            self.evictions += len(keys)
+            logger.debug("Removed {} translations from the cache to free {} bytes", len(keys), freed)
+
+    def stats(self: "TranslationCache") -> dict[str, Any]:
+        """Get how full the cache is, how often it was used and how many characters we didn't send to DeepL."""
+        with self.lock:
+            return {
+                "translations": self.db.execute("SELECT COUNT(*) FROM translations").fetchone()[0],
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "saved_characters": self.saved_characters,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_translation_cache() -> TranslationCache:
+    """Get the translation cache, it is stored next to the reader database."""
+    return TranslationCache(
+        get_data_location() / "translations.db",
+        DEFAULT_TRANSLATION_CACHE_MEGABYTES * 1024 * 1024,
+        TRANSLATION_TTL_SECONDS,
+    )
+
+
+def configure_translation_cache(app_settings: "ApplicationSettings") -> None:
+    """Use the size of the translation cache from the settings."""
+    get_translation_cache().resize(app_settings.translation_cache_size * 1024 * 1024)
@@ -1,12 +1,20 @@
 from html import unescape
 
-from bs4 import BeautifulSoup
+import lxml.html
 from reader import Entry
 
-from discord_twitter_webhooks._dataclasses import Group, get_app_settings
-from discord_twitter_webhooks.reader_settings import get_reader
+from discord_twitter_webhooks._dataclasses import Group
+from discord_twitter_webhooks.link_rewriter import get_link_rewriter
+from discord_twitter_webhooks.parsed_entry import parse_entry, parse_html
 from discord_twitter_webhooks.translate import translate_html
 
+# Text in these tags is not part of the tweet
+HIDDEN_TAGS: frozenset[str] = frozenset({"script", "style", "template", "rt", "rp"})
+
+# Whitespace in these tags is kept as is, in other tags text that is only whitespace becomes a newline or space
+PRESERVE_WHITESPACE_TAGS: frozenset[str] = frozenset({"pre", "textarea"})
+ASCII_WHITESPACE: str = " \n\t\f\r"
+
 
 def convert_html_to_md(html: str, group: Group) -> str:
     """Convert HTML to markdown.
@@ -18,36 +26,111 @@ def convert_html_to_md(html: str, group: Group) -> str:
     Returns:
         Our markdown.
     """
-    soup: BeautifulSoup = BeautifulSoup(html, features="lxml")
+    tree: lxml.html.HtmlElement | None = parse_html(html)
+    return convert_tree_to_md(tree, group) if tree is not None else ""
 
-    # Used for photos, videos, gifs and tweet cards
-    for image in soup.find_all("img"):
-        image.decompose()
 
-    for link in soup.find_all("a") + soup.find_all("link"):
-        if not link.get_text().strip():
-            link.decompose()
-        else:
-            # TODO: This breaks for https://nitter.lovinator.space/Steam/status/1679694708761669634#m
-            #  and https://nitter.lovinator.space/SteamDB/status/1677217359487021056#m
+def convert_tree_to_md(tree: lxml.html.HtmlElement, group: Group) -> str:
+    """Convert parsed HTML to markdown, without changing the tree.
 
-            # Replace Nitter links with Twitter links
-            if group.link_destination == "Twitter":
-                if link.text.startswith("#") and hasattr(link, "href"):
-                    link["href"] = f"https://twitter.com/hashtag/{link.text[1:]}"
-                elif link.text.startswith("@") and hasattr(link, "href"):
-                    link["href"] = f"https://twitter.com/{link.text[1:]}"
+    Images are removed, links become markdown links, every paragraph ends with a newline and all other tags are
+    replaced with their text. Text that is only whitespace becomes a single newline or space, like BeautifulSoup
+    did before.
 
+    Args:
+        tree: The HTML to convert, from parse_html().
+        group: The group to get settings from.
+
+    Returns:
+        Our markdown.
+    """
+    # The text between tags, and True or False where there is a tag. The bool says if whitespace is kept after it.
+    parts: list[str | bool] = [_collapse_whitespace(tree.text)]
+    _append_md(tree, group, parts, preserve_whitespace=False)
+    parts.append(False)
+
+    markdown: list[str] = []
+    run: list[str] = []
+    preserve_whitespace: bool = False
+    for part in parts:
+        if isinstance(part, str):
+            run.append(part)
+            continue
+
+        text: str = "".join(run)
+        markdown.append(text if preserve_whitespace else _collapse_whitespace(text))
+        run.clear()
+        preserve_whitespace = part
+
+    return "".join(markdown).strip()
+
+
+def _append_md(
+    element: lxml.html.HtmlElement,
+    group: Group,
+    parts: list[str | bool],
+    *,
+    preserve_whitespace: bool,
+) -> None:
+    for child in element:
+        # Comments and processing instructions have no text we want, but the text after them is part of the tweet
+        if not isinstance(child.tag, str):
+            parts.append(preserve_whitespace)
+
+        # Used for photos, videos, gifs and tweet cards
+        elif child.tag == "img":
+            pass
+
+        elif child.tag in {"a", "link"}:
+            text: str = _text_content(child, preserve_whitespace=preserve_whitespace)
             # Remove the link preview
-            link.replace_with(f"[{link.text}](<{link.get('href')}>)")
+            if text.strip():
+                parts.append(f"[{text}](<{_link_destination(child, text, group)}>)")
 
-    clean_soup: BeautifulSoup = BeautifulSoup(str(soup).replace("</p>", "</p>\n"), features="lxml")
+        elif child.tag in HIDDEN_TAGS:
+            parts.extend((preserve_whitespace, preserve_whitespace))
+
+        else:
+            keep: bool = preserve_whitespace or child.tag in PRESERVE_WHITESPACE_TAGS
+            parts.append(keep)
+            parts.append((child.text or "") if keep else _collapse_whitespace(child.text))
+            _append_md(child, group, parts, preserve_whitespace=keep)
+            parts.append(preserve_whitespace)
+            if child.tag == "p":
+                parts.append("\n")
+
+        parts.append((child.tail or "") if preserve_whitespace else _collapse_whitespace(child.tail))
+
+
+def _text_content(element: lxml.html.HtmlElement, *, preserve_whitespace: bool) -> str:
+    parts: list[str] = [(element.text or "") if preserve_whitespace else _collapse_whitespace(element.text)]
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in HIDDEN_TAGS:
+            keep: bool = preserve_whitespace or child.tag in PRESERVE_WHITESPACE_TAGS
+            parts.append(_text_content(child, preserve_whitespace=keep))
+        parts.append((child.tail or "") if preserve_whitespace else _collapse_whitespace(child.tail))
+    return "".join(parts)
 
-    # Remove all other tags
-    for tag in clean_soup.find_all(True):
-        tag.replace_with(tag.text)
 
-    return clean_soup.text.strip()
+def _collapse_whitespace(text: str | None) -> str:
+    if not text:
+        return ""
+    if text.strip(ASCII_WHITESPACE):
+        return text
+    return "\n" if "\n" in text else " "
+
+
+def _link_destination(link: lxml.html.HtmlElement, text: str, group: Group) -> str | None:
+    # TODO: This breaks for https://nitter.lovinator.space/Steam/status/1679694708761669634#m
+    #  and https://nitter.lovinator.space/SteamDB/status/1677217359487021056#m
+
+    # Replace Nitter links with Twitter links
+    if group.link_destination == "Twitter":
+        if text.startswith("#"):
+            return f"https://twitter.com/hashtag/{text[1:]}"
+        if text.startswith("@"):
+            return f"https://twitter.com/{text[1:]}"
+    return link.get("href")
 
 
 def get_tweet_text(entry: Entry, group: Group) -> str:
@@ -70,32 +153,16 @@ def get_tweet_text(entry: Entry, group: Group) -> str:
     if group.translate:
         # TODO: Maybe send the original text as a field or something?
         tweet_text = translate_html(tweet_text, group.translate_from, group.translate_to)
-
-    tweet_text = convert_html_to_md(tweet_text, group)
-
-    # Teddit/Libreddit
-    teddit_instance = get_app_settings(get_reader()).teddit_instance
-    if not group.replace_reddit:
-        tweet_text = tweet_text.replace("https://teddit.net", "https://reddit.com")
-        tweet_text = tweet_text.replace("[teddit.net", "[reddit.com")
-    if group.replace_reddit:
-        tweet_text = tweet_text.replace("https://reddit.com", teddit_instance)
-        tweet_text = tweet_text.replace("https://teddit.net", teddit_instance)
-
-    # Piped/Invidious
-    piped_instance = get_app_settings(get_reader()).piped_instance
-    if not group.replace_youtube:
-        tweet_text = tweet_text.replace("https://piped.video", "https://youtube.com")
-        tweet_text = tweet_text.replace("[piped.video", "[youtube.com")
-    if group.replace_youtube:
-        tweet_text = tweet_text.replace("https://youtube.com", piped_instance)
-        tweet_text = tweet_text.replace("https://piped.video", piped_instance)
-
-    # Copyright symbols are bloat and adds nothing.
-    if group.remove_copyright:
-        tweet_text = tweet_text.replace("©", "")
-        tweet_text = tweet_text.replace("®", "")
-        tweet_text = tweet_text.replace("™", "")
+        tweet_text = convert_html_to_md(tweet_text, group)
+    elif entry.summary:
+        # Use the HTML that was already parsed for the entry
+        tree: lxml.html.HtmlElement | None = parse_entry(entry).tree
+        tweet_text = convert_tree_to_md(tree, group) if tree is not None else ""
+    else:
+        tweet_text = convert_html_to_md(tweet_text, group)
+
+    # Teddit, Piped and copyright symbols
+    tweet_text = get_link_rewriter(group).rewrite_text(tweet_text)
 
     # Convert HTML entities to their corresponding characters. For example, "&amp;" becomes "&".
     if group.unescape_html:
@@ -1,4 +1,11 @@
 import re
+from collections import deque
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+from discord_twitter_webhooks._dataclasses import Group
 
 
 def check_word_in_string(input_string: str, word: str) -> bool:
@@ -33,3 +40,187 @@ def check_word_in_string_regex(input_string: str, regex_pattern: str) -> bool:
 
     # If the pattern is found, return True, otherwise, return False
     return match is not None
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton that checks if any of the keywords exists in a string.
+
+    The string is only scanned once, no matter how many keywords there are.
+    """
+
+    def __init__(self: "KeywordAutomaton", keywords: Iterable[str]) -> None:
+        """Build the automaton from the keywords.
+
+        Args:
+            keywords: The keywords to search for.
+        """
+        self.transitions: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[bool] = [False]
+
+        # Add every keyword to the trie
+        for keyword in keywords:
+            state = 0
+            for char in keyword:
+                next_state: int | None = self.transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self.transitions)
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.output.append(False)
+                    self.transitions[state][char] = next_state
+                state = next_state
+            self.output[state] = True
+
+        # Add the failure links, breadth first so the state we fall back to is always done before us
+        queue: deque[int] = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback: int = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.transitions[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] or self.output[self.fail[next_state]]
+
+    def search(self: "KeywordAutomaton", input_string: str) -> bool:
+        """Check if any of the keywords exists in the input string.
+
+        Args:
+            input_string: The string to search.
+
+        Returns:
+            True if a keyword is found, False otherwise.
+        """
+        # An empty keyword is in every string
+        if self.output[0]:
+            return True
+
+        transitions: list[dict[str, int]] = self.transitions
+        fail: list[int] = self.fail
+        output: list[bool] = self.output
+        state = 0
+        for char in input_string:
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
+
+
+@dataclass
+class KeywordMatcher:
+    """Words and regex patterns compiled once so we only have to scan the text once for each."""
+
+    words: KeywordAutomaton | None = None
+    patterns: list[re.Pattern[str]] = field(default_factory=list)
+
+    def matches(self: "KeywordMatcher", input_string: str) -> bool:
+        """Check if any word or regex pattern is found in the input string.
+
+        Args:
+            input_string: The input string to search.
+
+        Returns:
+            True if a word or pattern is found, False otherwise.
+        """
+        if self.words and self.words.search(input_string.lower()):
+            return True
+        return any(pattern.search(input_string) for pattern in self.patterns)
+
+
+def compile_keyword_matcher(words: list[str], regex_patterns: list[str]) -> KeywordMatcher:
+    """Compile the words into an automaton and the regex patterns without groups into one regex.
+
+    Words are case-insensitive, just like the regex patterns.
+
+    Args:
+        words: The words to search for.
+        regex_patterns: The regular expression patterns to search for.
+
+    Returns:
+        The compiled matcher.
+    """
+    # Patterns with groups are compiled on their own, joining them would renumber the groups their backreferences
+    # use and named groups can only be used once in a regex.
+    patterns: list[re.Pattern[str]] = []
+    combinable: list[str] = []
+    for regex_pattern in regex_patterns:
+        try:
+            compiled: re.Pattern[str] = re.compile(regex_pattern, flags=re.IGNORECASE)
+        except re.error as e:
+            logger.error("Invalid regex pattern {}: {}", regex_pattern, e)
+            continue
+
+        if compiled.groups:
+            patterns.append(compiled)
+        else:
+            combinable.append(regex_pattern)
+
+    if combinable:
+        try:
+            patterns.append(re.compile("|".join(f"(?:{pattern})" for pattern in combinable), flags=re.IGNORECASE))
+        except re.error:
+            # Patterns with global flags, like (?i), can't be combined.
+            patterns.extend(re.compile(pattern, flags=re.IGNORECASE) for pattern in combinable)
+
+    return KeywordMatcher(
+        words=KeywordAutomaton(word.lower() for word in words) if words else None,
+        patterns=patterns,
+    )
+
+
+@dataclass
+class GroupMatchers:
+    """The compiled whitelist and blacklist for a group."""
+
+    revision: int
+    whitelist: KeywordMatcher
+    blacklist: KeywordMatcher
+
+
+# The compiled matchers for every group, with the group UUID as key
+_group_matchers: dict[str, GroupMatchers] = {}
+
+
+def group_revision(group: Group) -> int:
+    """Get a hash of the whitelist and blacklist of the group, this changes when the lists are changed."""
+    return hash(
+        (
+            tuple(group.whitelist),
+            tuple(group.whitelist_regex),
+            tuple(group.blacklist),
+            tuple(group.blacklist_regex),
+        ),
+    )
+
+
+def get_group_matchers(group: Group) -> GroupMatchers:
+    """Get the compiled whitelist and blacklist for the group.
+
+    They are compiled the first time and then cached until the group is changed.
+
+    Args:
+        group: The group to get the matchers for.
+
+    Returns:
+        The compiled matchers.
+    """
+    revision: int = group_revision(group)
+    group_matchers: GroupMatchers | None = _group_matchers.get(group.uuid)
+    if group_matchers is None or group_matchers.revision != revision:
+        logger.debug("Compiling whitelist and blacklist for group {}", group.uuid)
+        group_matchers = GroupMatchers(
+            revision=revision,
+            whitelist=compile_keyword_matcher(group.whitelist, group.whitelist_regex),
+            blacklist=compile_keyword_matcher(group.blacklist, group.blacklist_regex),
+        )
+        _group_matchers[group.uuid] = group_matchers
+    return group_matchers
+
+
+def invalidate_group_matchers(uuid: str) -> None:
+    """Remove the compiled whitelist and blacklist for the group, this is done when the group is saved or removed."""
+    _group_matchers.pop(uuid, None)
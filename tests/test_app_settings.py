@@ -0,0 +1,39 @@
+import dataclasses
+from typing import TYPE_CHECKING
+
+import pytest
+from reader import make_reader
+
+from discord_twitter_webhooks._dataclasses import ApplicationSettings, get_app_settings, set_app_settings
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from reader import Reader
+
+
+def test_app_settings_are_kept_in_memory(tmp_path: "Path") -> None:
+    """Test that the settings are only read from the database once and replaced when they are saved."""
+    reader: Reader = make_reader(str(tmp_path / "db.sqlite"))
+    app_settings: ApplicationSettings = get_app_settings(reader)
+    assert app_settings == ApplicationSettings()
+    assert get_app_settings(reader) is app_settings
+
+    # Changing the tag behind our back doesn't change the settings in memory
+    reader.set_tag((), "app_settings", {"delay": 5})
+    assert get_app_settings(reader).delay == ApplicationSettings.delay
+
+    new_settings = ApplicationSettings(nitter_instances=["https://nitter.example/", " "], delay=30)
+    set_app_settings(reader, new_settings)
+    assert get_app_settings(reader) is new_settings
+    assert new_settings.nitter_instances == ("https://nitter.example",)
+
+    # The settings are saved, a new reader for the same database reads them
+    other_reader: Reader = make_reader(str(tmp_path / "db.sqlite"))
+    assert get_app_settings(other_reader) == new_settings
+
+
+def test_app_settings_are_immutable() -> None:
+    """Test that the settings can't be changed, they are shared by everything that reads them."""
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        ApplicationSettings().delay = 5  # type: ignore[misc]
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+from reader import make_reader
+
+from discord_twitter_webhooks.avatars import Avatar, find_avatar, get_avatar, set_stored_avatar
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from reader import Reader
+
+feed: bytes = b"""<rss version="2.0"><channel><title>alice / @alice</title>
+<image><title>alice</title><url>https://nitter.example.com/pic/avatar.jpg</url></image>
+<item><title>Tweet</title><description><![CDATA[<img src="https://nitter.example.com/pic/media.jpg">]]></description>
+<image><url>https://nitter.example.com/pic/not_the_avatar.jpg</url></image></item>
+</channel></rss>"""
+
+
+def test_find_avatar() -> None:
+    """Test that we find the avatar of the channel and not an image in a tweet."""
+    assert find_avatar(feed) == "https://nitter.example.com/pic/avatar.jpg"
+    assert find_avatar(feed.replace(b"<image><title>alice</title>", b"<no_image>")) is None
+
+
+def test_stored_avatar(tmp_path: "Path") -> None:
+    """Test that the stored avatar is used without fetching the feed, even when it is old."""
+    (tmp_path / "alice.xml").write_bytes(feed)
+    reader: Reader = make_reader(str(tmp_path / "db.sqlite"), feed_root=str(tmp_path))
+    reader.add_feed("alice.xml")
+
+    set_stored_avatar(reader, "alice.xml", "https://nitter.example.com/pic/avatar.jpg")
+    assert get_avatar(reader, "alice.xml") == "https://nitter.example.com/pic/avatar.jpg"
+
+    old: str = (datetime.now(tz=timezone.utc) - timedelta(days=2)).isoformat()
+    reader.set_tag("alice.xml", "avatar", Avatar(url="https://nitter.example.com/pic/old.jpg", fetched_at=old).__dict__)
+    assert get_avatar(reader, "alice.xml") == "https://nitter.example.com/pic/old.jpg"
@@ -0,0 +1,26 @@
+from discord_twitter_webhooks.concurrency import ConcurrencyController
+
+
+def test_additive_increase_multiplicative_decrease() -> None:
+    """Test that we fetch more feeds at the same time while Nitter is healthy, and back off when it isn't."""
+    controller = ConcurrencyController(level=4)
+
+    # A healthy window makes the concurrency go up by one
+    for _ in range(4):
+        controller.record(0.5, overloaded=False)
+    assert controller.level == 5  # noqa: PLR2004
+
+    # Rate limits halve it
+    for _ in range(5):
+        controller.record(0.5, overloaded=True)
+    assert controller.level == 2  # noqa: PLR2004
+    assert "rate limited" in controller.stats()["reason"]
+
+    # Getting much slower reduces it by a quarter
+    controller = ConcurrencyController(level=8)
+    for _ in range(8):
+        controller.record(0.5, overloaded=False)
+    for _ in range(9):
+        controller.record(5, overloaded=False)
+    assert controller.level == 6  # noqa: PLR2004
+    assert "latency" in controller.stats()["reason"]
@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+import httpx
+
+from discord_twitter_webhooks.delivery import (
+    MAX_RATE_LIMIT_RETRIES,
+    DeliveryEngine,
+    close_delivery_engine,
+    get_delivery_engine,
+)
+
+webhook_a: str = "https://discord.com/api/webhooks/1/a"
+webhook_b: str = "https://discord.com/api/webhooks/2/b"
+
+
+def test_messages_to_a_webhook_are_sent_in_order() -> None:
+    """Test that messages to the same webhook are sent one after another, and different webhooks at the same time."""
+    received: list[tuple[str, str]] = []
+    in_flight: set[str] = set()
+    most_in_flight: int = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal most_in_flight
+        url: str = str(request.url.copy_with(query=None))
+        assert url not in in_flight, "Two messages were sent to the same webhook at the same time"
+        in_flight.add(url)
+        most_in_flight = max(most_in_flight, len(in_flight))
+
+        # The first message takes the longest, so it would arrive last if they were sent at the same time
+        content: str = json.loads(request.content)["content"]
+        await asyncio.sleep(0.1 if content == "1" else 0.01)
+
+        in_flight.remove(url)
+        received.append((url, content))
+        return httpx.Response(200, json={})
+
+    engine = DeliveryEngine(transport=httpx.MockTransport(handler))
+    try:
+        responses = engine.post_batch(
+            [
+                (webhook_a, {"content": "1"}, {}),
+                (webhook_b, {"content": "1"}, {}),
+                (webhook_a, {"content": "2"}, {}),
+                (webhook_a, {"content": "3"}, {}),
+            ],
+        )
+    finally:
+        engine.close()
+
+    assert all(isinstance(response, httpx.Response) and response.is_success for response in responses)
+    assert [content for url, content in received if url == webhook_a] == ["1", "2", "3"]
+    assert most_in_flight == 2  # noqa: PLR2004
+
+
+def rate_limited(retry_after: float = 0.01) -> httpx.Response:
+    """Get the response Discord sends when we are rate limited."""
+    return httpx.Response(429, json={"message": "You are being rate limited.", "retry_after": retry_after})
+
+
+def test_rate_limited_messages_are_retried() -> None:
+    """Test that a message is sent again after a 429, until Discord accepts it."""
+    attempts: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(json.loads(request.content)["content"])
+        return rate_limited() if len(attempts) < 3 else httpx.Response(200, json={})  # noqa: PLR2004
+
+    engine = DeliveryEngine(transport=httpx.MockTransport(handler))
+    try:
+        responses = engine.post_batch([(webhook_a, {"content": "1"}, {})])
+    finally:
+        engine.close()
+
+    assert attempts == ["1", "1", "1"]
+    assert isinstance(responses[0], httpx.Response)
+    assert responses[0].status_code == 200  # noqa: PLR2004
+
+
+def test_rate_limit_retries_are_limited() -> None:
+    """Test that we give up after MAX_RATE_LIMIT_RETRIES and return the 429 so the outbox can try again later."""
+    attempts: int = 0
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        nonlocal attempts
+        attempts += 1
+        return rate_limited()
+
+    engine = DeliveryEngine(transport=httpx.MockTransport(handler))
+    try:
+        responses = engine.post_batch([(webhook_a, {"content": "1"}, {})])
+    finally:
+        engine.close()
+
+    assert attempts == MAX_RATE_LIMIT_RETRIES + 1
+    assert isinstance(responses[0], httpx.Response)
+    assert responses[0].status_code == 429  # noqa: PLR2004
+
+
+def test_close_stops_the_event_loop() -> None:
+    """Test that closing the delivery engine closes the HTTP client and stops the background thread."""
+    engine: DeliveryEngine = get_delivery_engine()
+    assert engine.thread.is_alive()
+
+    close_delivery_engine()
+    assert not engine.thread.is_alive()
+    assert not engine.loop.is_running()
+    assert engine.client.is_closed
+
+    # The next message starts a new engine
+    assert get_delivery_engine() is not engine
+    close_delivery_engine()
@@ -0,0 +1,65 @@
+from typing import TYPE_CHECKING
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+from reader import make_reader
+
+from discord_twitter_webhooks import main
+from discord_twitter_webhooks._dataclasses import Group, get_app_settings
+from discord_twitter_webhooks.dispatch_plan import get_dispatch_plan, invalidate_dispatch_plan
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from httpx import Response
+    from reader import Reader
+
+
+def test_dispatch_plan(tmp_path: "Path") -> None:
+    """Test that every feed is mapped to the groups that follow it, and that the plan is kept until invalidated."""
+    reader: Reader = make_reader(str(tmp_path / "db.sqlite"))
+    alice: str = "https://nitter.example.com/alice/rss"
+    bob: str = "https://nitter.example.com/bob/rss"
+    reader.set_tag((), "first", Group(uuid="first", rss_feeds=[alice, bob, alice]).__dict__)
+    reader.set_tag((), "second", Group(uuid="second", rss_feeds=[bob]).__dict__)
+    reader.set_tag((), "groups", ["first", "second", "missing"])
+
+    invalidate_dispatch_plan()
+    dispatch_plan: dict[str, list[Group]] = get_dispatch_plan(reader)
+    assert {feed: [group.uuid for group in groups] for feed, groups in dispatch_plan.items()} == {
+        alice: ["first"],
+        bob: ["first", "second"],
+    }
+
+    # Changing the tags doesn't change the plan until it is invalidated
+    reader.set_tag((), "groups", ["second"])
+    assert get_dispatch_plan(reader) is dispatch_plan
+
+    invalidate_dispatch_plan()
+    assert list(get_dispatch_plan(reader)) == [bob]
+
+
+def test_dispatch_plan_is_rebuilt_when_a_group_is_saved_or_removed() -> None:
+    """Test that saving and removing a group on the website changes where feeds are sent."""
+    client = TestClient(main.app)
+    uuid: str = str(uuid4())
+    feed_url: str = f"{get_app_settings(main.reader).nitter_instance}/dispatchplantest/rss"
+
+    # Build the plan before the group exists, so we know it is rebuilt
+    assert uuid not in [group.uuid for group in get_dispatch_plan(main.reader).get(feed_url, [])]
+
+    response: Response = client.post(
+        "/feed",
+        data={
+            "name": "Dispatch plan",
+            "uuid": uuid,
+            "webhooks": "https://example.com/1",
+            "usernames": "dispatchplantest",
+        },
+    )
+    assert response.is_success
+    assert uuid in [group.uuid for group in get_dispatch_plan(main.reader)[feed_url]]
+
+    response = client.post("/remove_group", data={"uuid": uuid})
+    assert response.is_success
+    assert uuid not in [group.uuid for group in get_dispatch_plan(main.reader).get(feed_url, [])]
@@ -0,0 +1,20 @@
+from discord_twitter_webhooks.gif_encoder import MAX_GIF_FPS, MAX_GIF_WIDTH, MIN_GIF_FPS, GifPlan, plan_gif
+
+
+def test_short_video_keeps_quality() -> None:
+    """Test that a short video is only limited to the most frames and the widest GIF we make."""
+    plan: GifPlan = plan_gif(duration=2, width=1280, height=720, source_fps=30, max_bytes=25 * 1024 * 1024)
+    assert plan == GifPlan(fps=MAX_GIF_FPS, width=MAX_GIF_WIDTH, height=270, colors=256)
+
+
+def test_long_video_fits_budget() -> None:
+    """Test that the frame rate, size and colors are lowered until the estimate fits the budget."""
+    max_bytes: int = 8 * 1024 * 1024
+    plan: GifPlan = plan_gif(duration=60, width=1280, height=720, source_fps=30, max_bytes=max_bytes)
+    assert plan.fps == MIN_GIF_FPS
+    assert plan.width < MAX_GIF_WIDTH
+    assert plan.estimate(60, 0.3) <= max_bytes
+
+    # If the first GIF was bigger than we thought, the next plan is smaller
+    smaller_plan: GifPlan = plan_gif(60, 1280, 720, 30, max_bytes=max_bytes, bytes_per_pixel=0.6)
+    assert smaller_plan.estimate(60, 0.6) < plan.estimate(60, 0.6)
@@ -0,0 +1,52 @@
+from discord_twitter_webhooks._dataclasses import ApplicationSettings, Group
+from discord_twitter_webhooks.link_rewriter import LinkRewriter, compile_link_rewriter
+
+APP_SETTINGS = ApplicationSettings(
+    nitter_instance="https://nitter.example",
+    piped_instance="https://piped.example",
+    teddit_instance="https://teddit.example",
+)
+
+TEXT: str = (
+    "[teddit.net/r/python](<https://teddit.net/r/python>) [reddit](<https://reddit.com/r/python>)"
+    " [piped.video/watch?v=1](<https://piped.video/watch?v=1>) [yt](<https://youtube.com/watch?v=2>) Tesla™ ©2023"
+)
+
+
+def test_rewrite_text() -> None:
+    """Test that the links are replaced the way the group wants and copyright symbols are removed."""
+    rewriter: LinkRewriter = compile_link_rewriter(APP_SETTINGS, Group())
+    assert (
+        rewriter.rewrite_text(TEXT)
+        == "[reddit.com/r/python](<https://reddit.com/r/python>) [reddit](<https://reddit.com/r/python>)"
+        " [youtube.com/watch?v=1](<https://youtube.com/watch?v=1>) [yt](<https://youtube.com/watch?v=2>) Tesla 2023"
+    )
+
+    group = Group(replace_reddit=True, replace_youtube=True, remove_copyright=False)
+    rewriter = compile_link_rewriter(APP_SETTINGS, group)
+    assert (
+        rewriter.rewrite_text(TEXT)
+        == "[teddit.net/r/python](<https://teddit.example/r/python>) [reddit](<https://teddit.example/r/python>)"
+        " [piped.video/watch?v=1](<https://piped.example/watch?v=1>) [yt](<https://piped.example/watch?v=2>)"
+        " Tesla™ ©2023"
+    )
+
+
+def test_replaced_text_is_not_replaced_again() -> None:
+    """Test that an instance that starts with the default instance is not replaced twice."""
+    app_settings = ApplicationSettings(teddit_instance="https://teddit.net.example")
+    rewriter: LinkRewriter = compile_link_rewriter(app_settings, Group(replace_reddit=True))
+    assert (
+        rewriter.rewrite_text("https://reddit.com/r/a https://teddit.net/r/b")
+        == "https://teddit.net.example/r/a https://teddit.net.example/r/b"
+    )
+
+
+def test_rewrite_entry_link() -> None:
+    """Test that links to the tweet go to Twitter or Nitter."""
+    link: str = "https://nitter.example/elonmusk/status/1234#m"
+    twitter: LinkRewriter = compile_link_rewriter(APP_SETTINGS, Group(link_destination="Twitter"))
+    nitter: LinkRewriter = compile_link_rewriter(APP_SETTINGS, Group(link_destination="Nitter"))
+
+    assert twitter.rewrite_entry_link(link) == "https://twitter.com/elonmusk/status/1234"
+    assert nitter.rewrite_entry_link(link) == link
@@ -80,6 +80,18 @@ def test_settings_page() -> None:
     assert "p-2 border border-dark" in response.text
 
 
+def test_stats() -> None:
+    """Test that the stats endpoint returns the numbers used for monitoring."""
+    response: Response = client.get("/stats")
+
+    # Check that the page loaded successfully.
+    assert response.status_code == 200  # noqa: PLR2004
+
+    # Check that every part of the bot is included.
+    assert set(response.json()) == {"outbox", "nitter", "update_concurrency", "media_cache", "translation_cache"}
+    assert response.json()["update_concurrency"]["level"] >= 1
+
+
 def test_add_new_group() -> None:
     """Test if we can add a new group."""
     # Get the old index page.
@@ -0,0 +1,38 @@
+from typing import TYPE_CHECKING
+
+from discord_twitter_webhooks.media_cache import MediaCache
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_media_cache(tmp_path: "Path") -> None:
+    """Test that files are cached by URL and parameters, and the least recently used are removed when it is full."""
+    cache = MediaCache(tmp_path, max_bytes=10)
+    assert cache.get("https://example.com/1.mp4", "gif") is None
+
+    cache.put("https://example.com/1.mp4", "gif", b"1234")
+    cache.put("https://example.com/2.mp4", "gif", b"5678")
+    assert cache.get("https://example.com/1.mp4", "gif") == b"1234"
+    assert cache.get("https://example.com/1.mp4", "source") is None
+    assert cache.file_size("https://example.com/1.mp4", "gif") == 4  # noqa: PLR2004
+    assert cache.file_size("https://example.com/1.mp4", "source") is None
+
+    # 2.mp4 was used the longest ago, so it is removed to make room
+    cache.put("https://example.com/3.mp4", "gif", b"9012")
+    assert cache.get("https://example.com/2.mp4", "gif") is None
+    assert cache.stats() == {"files": 2, "bytes": 8, "max_bytes": 10, "hits": 1, "misses": 3, "evictions": 1}
+
+    # Files that are bigger than the whole cache are not stored
+    cache.put("https://example.com/4.mp4", "gif", b"12345678901")
+    assert cache.get("https://example.com/4.mp4", "gif") is None
+
+    # Use 1.mp4 again so 3.mp4 is now the oldest
+    assert cache.get("https://example.com/1.mp4", "gif") == b"1234"
+
+    # The files are still there after a restart, and making the cache smaller removes the oldest
+    restarted_cache = MediaCache(tmp_path, max_bytes=10)
+    assert restarted_cache.stats()["files"] == 2  # noqa: PLR2004
+    restarted_cache.resize(4)
+    assert restarted_cache.get("https://example.com/3.mp4", "gif") is None
+    assert restarted_cache.get("https://example.com/1.mp4", "gif") == b"1234"
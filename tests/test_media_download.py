@@ -0,0 +1,69 @@
+import threading
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING
+
+import pytest
+
+from discord_twitter_webhooks.media_download import download_to_file, probe_size
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+class VideoHandler(BaseHTTPRequestHandler):
+    """Serve 1000 bytes, with a Content-Length header except for /no-length."""
+
+    def do_HEAD(self: "VideoHandler") -> None:
+        """Send the headers of the video."""
+        self.send_response(200)
+        if self.path != "/no-length":
+            self.send_header("Content-Length", "1000")
+        self.end_headers()
+
+    def do_GET(self: "VideoHandler") -> None:
+        """Send the video, or the first byte of it."""
+        if self.headers.get("Range") == "bytes=0-0":
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes 0-0/1000")
+            self.end_headers()
+            self.wfile.write(b"x")
+            return
+
+        self.do_HEAD()
+        for _ in range(10):
+            self.wfile.write(b"x" * 100)
+
+    def log_message(self: "VideoHandler", *args: object) -> None:
+        """Don't print every request."""
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    """Start a server that serves videos."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), VideoHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_download_to_file(server: str, tmp_path: "Path") -> None:
+    """Test that files are downloaded to disk, and files that are too big are stopped and removed."""
+    destination: Path = tmp_path / "video.mp4"
+    assert download_to_file(f"{server}/video.mp4", destination, max_bytes=1000)
+    assert destination.read_bytes() == b"x" * 1000
+
+    # Too big according to Content-Length
+    assert not download_to_file(f"{server}/video.mp4", destination, max_bytes=999)
+    assert not destination.exists()
+
+    # Too big while downloading
+    assert not download_to_file(f"{server}/no-length", destination, max_bytes=999)
+    assert not destination.exists()
+
+
+def test_probe_size(server: str) -> None:
+    """Test that we get the size from a HEAD request, or a request for the first byte if HEAD doesn't have it."""
+    assert probe_size(f"{server}/video.mp4") == 1000  # noqa: PLR2004
+    assert probe_size(f"{server}/no-length") == 1000  # noqa: PLR2004
+    assert probe_size("http://127.0.0.1:1/video.mp4") is None
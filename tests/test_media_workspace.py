@@ -0,0 +1,69 @@
+import threading
+from typing import TYPE_CHECKING
+
+import pytest
+
+from discord_twitter_webhooks import media_workspace
+from discord_twitter_webhooks.media_workspace import MediaWorkspace, WorkspaceFullError
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_job_is_removed(tmp_path: "Path") -> None:
+    """Test that the directory of a job is removed when it is done, also when it fails."""
+    workspace = MediaWorkspace(tmp_path, quota_bytes=100)
+    with workspace.job(reserve_bytes=10) as job_dir:
+        (job_dir / "video.mp4").write_bytes(b"video")
+    assert not job_dir.exists()
+
+    job_dirs: list[Path] = []
+
+    def failing_job() -> None:
+        with workspace.job(reserve_bytes=10) as job_dir:
+            job_dirs.append(job_dir)
+            (job_dir / "video.gif").write_bytes(b"GIF89a")
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        failing_job()
+    assert not job_dirs[0].exists()
+    assert workspace.reserved_bytes == 0
+
+
+def test_quota(tmp_path: "Path", monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a job waits for space, and gives up if it doesn't get it."""
+    monkeypatch.setattr(media_workspace, "WORKSPACE_WAIT_SECONDS", 0.1)
+    workspace = MediaWorkspace(tmp_path, quota_bytes=100)
+    with workspace.job(reserve_bytes=60):
+        with pytest.raises(WorkspaceFullError), workspace.job(reserve_bytes=60):
+            pass
+
+        # A job that fits doesn't have to wait
+        with workspace.job(reserve_bytes=40):
+            pass
+
+    # The space is given to a waiting job when a job is done
+    done = threading.Event()
+    with workspace.job(reserve_bytes=60):
+        monkeypatch.setattr(media_workspace, "WORKSPACE_WAIT_SECONDS", 5)
+
+        def wait_for_space() -> None:
+            with workspace.job(reserve_bytes=60):
+                done.set()
+
+        thread = threading.Thread(target=wait_for_space)
+        thread.start()
+        assert not done.wait(0.1)
+    thread.join()
+    assert done.is_set()
+
+
+def test_sweep(tmp_path: "Path") -> None:
+    """Test that directories left by jobs that didn't finish are removed, and nothing else."""
+    (tmp_path / "job-1234").mkdir()
+    (tmp_path / "job-1234" / "video.gif").write_bytes(b"GIF89a")
+    (tmp_path / "other").mkdir()
+
+    MediaWorkspace(tmp_path, quota_bytes=100).sweep()
+    assert [path.name for path in tmp_path.iterdir()] == ["other"]
@@ -0,0 +1,119 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from discord_twitter_webhooks.nitter_pool import NitterPool, NitterPoolAdapter, rewrite_instance
+
+
+def test_failing_instances_are_not_used() -> None:
+    """Test that an instance that fails or rate limits us is not used until it has cooled down."""
+    pool = NitterPool(["https://nitter.example.com/", "https://nitter.example.org", "https://nitter.example.net"])
+    assert pool.owns("https://nitter.example.com/alice/rss") == "https://nitter.example.com"
+    assert pool.owns("https://twitter.com/alice") is None
+
+    pool.record_failure("https://nitter.example.com")
+    pool.record_failure("https://nitter.example.org", retry_after=60)
+    assert {pool.choose(set()) for _ in range(20)} == {"https://nitter.example.net"}
+
+    # If every instance is cooling down we still try the one that will be back first
+    assert pool.choose({"https://nitter.example.net"}) == "https://nitter.example.com"
+    assert (
+        pool.choose({"https://nitter.example.com", "https://nitter.example.org", "https://nitter.example.net"}) is None
+    )
+
+
+def test_rewrite_instance() -> None:
+    """Test that links from the instance that answered are changed to the instance the feed is stored with."""
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Encoding"] = "gzip"
+    response.raw = io.BytesIO(b'<guid>https://nitter.example.org/a/1</guid><a href="http://nitter.example.org/">')
+
+    rewrite_instance(response, "https://nitter.example.org", "https://nitter.example.com")
+    assert response.raw.read() == b'<guid>https://nitter.example.com/a/1</guid><a href="https://nitter.example.com/">'
+    assert "Content-Encoding" not in response.headers
+
+
+def test_hedge_budget() -> None:
+    """Test that slow requests are hedged after the p95 latency, and that hedging can't add too many requests."""
+    pool = NitterPool(["https://nitter.example.com", "https://nitter.example.org"])
+    pool.hedging = True
+    assert pool.hedge_delay() is None
+
+    for latency in range(100):
+        pool.record_success("https://nitter.example.com", latency / 100)
+    assert pool.hedge_delay() == 0.94  # noqa: PLR2004
+
+    hedges: int = sum(pool.take_hedge() for _ in range(100))
+    assert hedges == 5  # noqa: PLR2004
+
+    for _ in range(100):
+        pool.hedge_delay()
+    assert sum(pool.take_hedge() for _ in range(100)) == 5  # noqa: PLR2004
+
+
+def test_hedge_delay_starts_when_the_request_is_sent(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that waiting for a thread doesn't count as the instance being slow."""
+    pool = NitterPool(["https://nitter.example.com", "https://nitter.example.org"])
+    pool.hedging = True
+    for _ in range(100):
+        pool.record_success("https://nitter.example.com", 0.01)
+
+    def send(*_args: Any, **_kwargs: Any) -> requests.Response:  # noqa: ANN401
+        time.sleep(0.05)
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(b"<rss/>")
+        return response
+
+    monkeypatch.setattr(HTTPAdapter, "send", send)
+
+    # Keep the only thread busy for longer than the hedge delay
+    pool.executor = ThreadPoolExecutor(max_workers=1)
+    pool.executor.submit(time.sleep, 0.5)
+
+    request: requests.PreparedRequest = requests.Request("GET", "https://nitter.example.com/alice/rss").prepare()
+    instance, response = NitterPoolAdapter(pool).send_hedged(
+        request,
+        "/alice/rss",
+        "https://nitter.example.com",
+        {"https://nitter.example.com"},
+        {},
+    )
+    assert instance == "https://nitter.example.com"
+    assert response.status_code == 200  # noqa: PLR2004
+    assert pool.stats()["hedged_requests"] == 0
+
+
+def test_failed_answer_is_returned_open(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the last answer we got is returned unclosed when the other instances fail."""
+
+    def send(
+        _adapter: HTTPAdapter,
+        request: requests.PreparedRequest,
+        **_kwargs: Any,  # noqa: ANN401
+    ) -> requests.Response:
+        if request.url.startswith("https://nitter.example.org"):
+            msg = "Connection refused"
+            raise requests.ConnectionError(msg)
+        response = requests.Response()
+        response.status_code = 503
+        response.raw = io.BytesIO(b"Service unavailable")
+        return response
+
+    monkeypatch.setattr(HTTPAdapter, "send", send)
+    pool = NitterPool(["https://nitter.example.com", "https://nitter.example.org"])
+
+    # Both orders: the 503 first and the connection error second, and the other way around
+    for _ in range(10):
+        pool.set_instances([])
+        pool.set_instances(["https://nitter.example.com", "https://nitter.example.org"])
+        request: requests.PreparedRequest = requests.Request("GET", "https://nitter.example.com/alice/rss").prepare()
+        response: requests.Response = NitterPoolAdapter(pool).send(request)
+        assert response.status_code == 503  # noqa: PLR2004
+        assert response.raw.read() == b"Service unavailable"
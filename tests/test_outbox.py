@@ -0,0 +1,208 @@
+from typing import TYPE_CHECKING
+
+import pytest
+from discord_webhook import DiscordEmbed, DiscordWebhook
+
+from discord_twitter_webhooks import outbox as outbox_module
+from discord_twitter_webhooks.outbox import MAX_ATTEMPTS, Outbox, deliver_outbox, pack_deliveries, pack_payload
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from discord_twitter_webhooks.outbox import Delivery
+
+
+def test_enqueue_and_claim(tmp_path: "Path") -> None:
+    """Test that a message is delivered once to every webhook, with its files."""
+    outbox = Outbox(tmp_path / "outbox.db")
+
+    webhook = DiscordWebhook(url="", content="Hello")
+    webhook.add_embed(DiscordEmbed(description="World"))
+    webhook.add_file(file=b"GIF89a", filename="video.gif")
+    outbox.enqueue(webhook, ["https://example.com/1", "https://example.com/2"], "https://twitter.com/a/status/1")
+
+    deliveries: list[Delivery] = outbox.claim()
+    assert [delivery.webhook_url for delivery in deliveries] == ["https://example.com/1", "https://example.com/2"]
+    assert deliveries[0].payload["content"] == "Hello"
+    assert deliveries[0].payload["embeds"][0]["description"] == "World"
+    assert deliveries[0].files == {"_video.gif": ("video.gif", b"GIF89a")}
+
+    # They are being sent, so we should not get them again
+    assert not outbox.claim()
+
+    outbox.delivered(deliveries[0])
+    outbox.fail(deliveries[1], "Got 404")
+    assert outbox.stats() == {"delivered": 1, "failed": 1}
+
+
+def test_retry_and_recover(tmp_path: "Path") -> None:
+    """Test that failed deliveries are retried later, and that unfinished deliveries are sent after a restart."""
+    outbox = Outbox(tmp_path / "outbox.db")
+    outbox.enqueue(DiscordWebhook(url="", content="Hello"), ["https://example.com/1"], "https://twitter.com/a/1")
+
+    delivery: Delivery = outbox.claim()[0]
+    outbox.retry(delivery, "Got 500")
+
+    # The retry is in the future
+    assert not outbox.claim()
+    assert outbox.stats() == {"pending": 1}
+
+    delivery.attempts = MAX_ATTEMPTS - 1
+    outbox.retry(delivery, "Got 500")
+    assert outbox.stats() == {"failed": 1}
+
+    # Simulate a crash while sending
+    outbox.enqueue(DiscordWebhook(url="", content="Again"), ["https://example.com/1"], "https://twitter.com/a/2")
+    assert outbox.claim()
+
+    restarted_outbox = Outbox(tmp_path / "outbox.db")
+    restarted_outbox.recover()
+    assert restarted_outbox.claim()[0].payload["content"] == "Again"
+
+
+def test_wait_for_media(tmp_path: "Path") -> None:
+    """Test that messages with a video are sent after the video is attached, or without it if that failed."""
+    outbox = Outbox(tmp_path / "outbox.db")
+    for number in range(3):
+        webhook = DiscordWebhook(url="")
+        webhook.add_embed(DiscordEmbed(description=f"Tweet {number}", image={"url": "https://example.com/poster.jpg"}))
+        outbox.enqueue(
+            webhook,
+            ["https://example.com/1"],
+            f"https://twitter.com/a/{number}",
+            media_url=f"https://example.com/{number}.mp4",
+            media_mode="mp4" if number == 2 else "gif",  # noqa: PLR2004
+        )
+
+    assert not outbox.claim()
+    assert outbox.stats() == {"waiting": 3}
+    assert outbox.waiting_for_media() == [
+        (1, "https://example.com/0.mp4", "gif"),
+        (2, "https://example.com/1.mp4", "gif"),
+        (3, "https://example.com/2.mp4", "mp4"),
+    ]
+
+    # Still waiting after a restart
+    Outbox(tmp_path / "outbox.db").recover()
+    assert not outbox.claim()
+
+    outbox.attach_media(1, "video.gif", b"GIF89a")
+    delivery: Delivery = outbox.claim()[0]
+    assert delivery.files == {"_video.gif": ("video.gif", b"GIF89a")}
+    assert delivery.payload["embeds"][0]["image"] == {"url": "attachment://video.gif"}
+
+    outbox.release_media(2)
+    delivery = outbox.claim()[0]
+    assert not delivery.files
+    assert delivery.payload["embeds"][0]["description"] == "Tweet 1"
+
+    # Videos can't be shown in embeds, so the thumbnail stays
+    outbox.attach_media(3, "video.mp4", b"MP4")
+    delivery = outbox.claim()[0]
+    assert delivery.files == {"_video.mp4": ("video.mp4", b"MP4")}
+    assert delivery.payload["embeds"][0]["image"] == {"url": "https://example.com/poster.jpg"}
+    assert not outbox.waiting_for_media()
+
+
+def test_pack_embeds(tmp_path: "Path") -> None:
+    """Test that packable embeds to the same webhook are sent together, in order and within Discord's limits."""
+    outbox = Outbox(tmp_path / "outbox.db")
+    for number in range(12):
+        webhook = DiscordWebhook(url="")
+        webhook.add_embed(DiscordEmbed(description=f"Tweet {number}"))
+        outbox.enqueue(
+            webhook,
+            ["https://example.com/1", "https://example.com/2"],
+            f"https://twitter.com/a/{number}",
+            packable=True,
+        )
+
+    # Text can't be packed, and the embeds after it have to wait for it
+    outbox.enqueue(DiscordWebhook(url="", content="Text"), ["https://example.com/1"], "https://twitter.com/a/12")
+    webhook = DiscordWebhook(url="")
+    webhook.add_embed(DiscordEmbed(description="Tweet 13"))
+    outbox.enqueue(webhook, ["https://example.com/1"], "https://twitter.com/a/13", packable=True)
+
+    packs: list[list[Delivery]] = pack_deliveries(outbox.claim())
+    assert [(pack[0].webhook_url, len(pack)) for pack in packs] == [
+        ("https://example.com/1", 10),
+        ("https://example.com/2", 10),
+        ("https://example.com/1", 2),
+        ("https://example.com/2", 2),
+        ("https://example.com/1", 1),
+        ("https://example.com/1", 1),
+    ]
+    assert [embed["description"] for embed in pack_payload(packs[0])["embeds"]] == [f"Tweet {n}" for n in range(10)]
+
+
+def test_enqueue_with_dedupe_key(tmp_path: "Path") -> None:
+    """Test that a message with the same dedupe key is only stored once, and messages without a key every time."""
+    outbox = Outbox(tmp_path / "outbox.db")
+    webhook = DiscordWebhook(url="", content="Hello")
+
+    assert outbox.enqueue(webhook, ["https://example.com/1"], "https://twitter.com/a/1", dedupe_key="a") is not None
+    assert outbox.enqueue(webhook, ["https://example.com/1"], "https://twitter.com/a/1", dedupe_key="a") is None
+    assert outbox.enqueue(webhook, ["https://example.com/1"], "https://twitter.com/a/1") is not None
+    assert outbox.enqueue(webhook, ["https://example.com/1"], "https://twitter.com/a/1") is not None
+    assert len(outbox.claim()) == 3  # noqa: PLR2004
+
+
+def test_media_is_stored_once(tmp_path: "Path") -> None:
+    """Test that a video is stored once for a message and read once for all the webhooks it is sent to."""
+    outbox = Outbox(tmp_path / "outbox.db")
+    webhook_urls: list[str] = [f"https://example.com/{number}" for number in range(20)]
+    message_id: int | None = outbox.enqueue(
+        DiscordWebhook(url="", content="Tweet"),
+        webhook_urls,
+        "https://twitter.com/a/1",
+        media_url="https://example.com/video.mp4",
+        media_mode="mp4",
+    )
+    assert message_id is not None
+    outbox.attach_media(message_id, "video.mp4", b"MP4")
+    assert [path.name for path in outbox.media_dir.iterdir()] == [f"{message_id}_video.mp4"]
+
+    deliveries: list[Delivery] = outbox.claim()
+    assert [delivery.webhook_url for delivery in deliveries] == webhook_urls
+    assert all(delivery.files == {"_video.mp4": ("video.mp4", b"MP4")} for delivery in deliveries)
+    assert len({id(delivery.files["_video.mp4"][1]) for delivery in deliveries}) == 1
+
+    # The file is removed with the message
+    for delivery in deliveries:
+        outbox.delivered(delivery)
+    outbox.purge(keep_delivered_seconds=-1)
+    assert not list(outbox.media_dir.iterdir())
+
+
+def test_deliveries_are_retried_when_sending_fails(tmp_path: "Path", monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that deliveries go back to pending when the batch can't be sent, instead of waiting for a restart."""
+    outbox = Outbox(tmp_path / "outbox.db")
+    outbox.enqueue(DiscordWebhook(url="", content="Hello"), ["https://example.com/1"], "https://twitter.com/a/1")
+
+    class BrokenEngine:
+        def post_batch(self: "BrokenEngine", _requests: list) -> list:
+            msg = "The event loop is closed"
+            raise RuntimeError(msg)
+
+    monkeypatch.setattr(outbox_module, "get_delivery_engine", BrokenEngine)
+    deliver_outbox(outbox)
+    assert outbox.stats() == {"pending": 1}
+    assert outbox.db.execute("SELECT attempts, last_error FROM deliveries").fetchone() == (
+        1,
+        "RuntimeError('The event loop is closed')",
+    )
+
+
+def test_purge_removes_messages_without_deliveries(tmp_path: "Path") -> None:
+    """Test that purging only removes messages that have been delivered long enough ago."""
+    outbox = Outbox(tmp_path / "outbox.db")
+    outbox.enqueue(DiscordWebhook(url="", content="Sent"), ["https://example.com/1"], "https://twitter.com/a/1")
+    outbox.enqueue(DiscordWebhook(url="", content="Waiting"), ["https://example.com/1"], "https://twitter.com/a/2")
+    outbox.delivered(outbox.claim(limit=1)[0])
+
+    outbox.purge()
+    assert outbox.stats() == {"delivered": 1, "pending": 1}
+
+    outbox.purge(keep_delivered_seconds=-1)
+    assert outbox.stats() == {"pending": 1}
+    assert [row[0] for row in outbox.db.execute("SELECT entry_link FROM messages")] == ["https://twitter.com/a/2"]
@@ -0,0 +1,47 @@
+from datetime import UTC, datetime
+
+from reader import Entry, Feed
+
+from discord_twitter_webhooks.parsed_entry import ParsedEntry, parse_entry
+
+FEED: Feed = Feed(url="https://nitter.example/elonmusk/rss", title="Elon Musk / @elonmusk")
+
+SUMMARY: str = (
+    '<p>Look at <a href="https://nitter.example/search?q=%23Mars">#Mars</a> '
+    '<a href="https://example.com/">example.com</a></p>'
+    '<img src="https://nitter.example/pic/media%2Fimage.jpg" alt="" />'
+    '<video poster="https://nitter.example/pic/thumb.jpg">'
+    '<source src="https://video.twimg.com/tweet_video/clip.mp4" type="video/mp4" /></video>'
+)
+
+
+def test_parse_entry() -> None:
+    """Test that the text, media, links and kind of tweet are found."""
+    entry = Entry(id="1", title="Look at #Mars", summary=SUMMARY, feed=FEED)
+    parsed: ParsedEntry = parse_entry(entry)
+
+    assert parsed.text == "Look at #Mars example.com"
+    assert parsed.images == ("https://nitter.example/pic/media%2Fimage.jpg",)
+    assert parsed.videos == ("https://video.twimg.com/tweet_video/clip.mp4",)
+    assert parsed.poster == "https://nitter.example/pic/thumb.jpg"
+    assert parsed.links == ("https://nitter.example/search?q=%23Mars", "https://example.com/")
+    assert parsed.has_media
+    assert parsed.kind == "tweet"
+
+    retweet: ParsedEntry = parse_entry(Entry(id="2", title="RT by @elonmusk: Hello", summary="<p>Hello</p>", feed=FEED))
+    assert retweet.is_retweet
+    assert not retweet.has_media
+
+    reply: ParsedEntry = parse_entry(Entry(id="3", title="R to @jack: Hello", summary="", feed=FEED))
+    assert reply.is_reply
+    assert reply.replied_to == "jack"
+    assert reply.text == "R to @jack: Hello"
+
+
+def test_parse_entry_is_cached_until_updated() -> None:
+    """Test that an entry is parsed once, and again when it is updated."""
+    entry = Entry(id="4", title="Hello", summary="<p>Hello</p>", feed=FEED)
+    assert parse_entry(entry) is parse_entry(Entry(id="4", title="Hello", summary="<p>Hello</p>", feed=FEED))
+
+    updated = Entry(id="4", updated=datetime(2023, 1, 1, tzinfo=UTC), summary="<p>Edited</p>", feed=FEED)
+    assert parse_entry(updated).text == "Edited"
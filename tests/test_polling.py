@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import TYPE_CHECKING
+
+from reader import make_reader
+
+from discord_twitter_webhooks._dataclasses import ApplicationSettings
+from discord_twitter_webhooks.polling import get_due_feeds, get_schedule, polling_interval, update_due_feeds
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    import pytest
+    from reader import Reader
+
+
+def make_feed(tmp_path: "Path", name: str, tweet_every: timedelta) -> str:
+    """Write a feed with five tweets, one every tweet_every."""
+    now: datetime = datetime.now(tz=timezone.utc)
+    items: str = "".join(
+        f"<item><title>Tweet {number}</title><link>https://nitter.net/{name}/status/{number}</link>"
+        f"<guid>{number}</guid><pubDate>{format_datetime(now - tweet_every * number)}</pubDate></item>"
+        for number in range(5)
+    )
+    (tmp_path / f"{name}.xml").write_text(f'<rss version="2.0"><channel><title>{name}</title>{items}</channel></rss>')
+    return f"{name}.xml"
+
+
+def test_polling_interval(tmp_path: "Path") -> None:
+    """Test that accounts that tweet often are checked often, and accounts that don't are checked less often."""
+    reader: Reader = make_reader(str(tmp_path / "db.sqlite"), feed_root=str(tmp_path))
+    busy_feed: str = make_feed(tmp_path, "busy", timedelta(seconds=30))
+    quiet_feed: str = make_feed(tmp_path, "quiet", timedelta(days=90))
+    normal_feed: str = make_feed(tmp_path, "normal", timedelta(hours=2))
+    for feed_url in (busy_feed, quiet_feed, normal_feed):
+        reader.add_feed(feed_url)
+
+    # New feeds are checked right away
+    assert len(get_due_feeds(reader, datetime.now(tz=timezone.utc))) == 3  # noqa: PLR2004
+    update_due_feeds(reader)
+    assert not get_due_feeds(reader, datetime.now(tz=timezone.utc))
+
+    app_settings = ApplicationSettings(delay=10, max_delay=6 * 60)
+    assert polling_interval(reader, busy_feed, app_settings, got_new=False) == timedelta(minutes=10)
+    assert polling_interval(reader, quiet_feed, app_settings, got_new=False) == timedelta(hours=6)
+    assert polling_interval(reader, normal_feed, app_settings, got_new=False) == timedelta(hours=1)
+
+    # Accounts often tweet several times in a row, so check again soon after new tweets
+    assert polling_interval(reader, quiet_feed, app_settings, got_new=True) == timedelta(minutes=10)
+
+
+def test_schedule_is_read_in_one_query(tmp_path: "Path", monkeypatch: "pytest.MonkeyPatch") -> None:
+    """Test that finding the due feeds doesn't read a tag for every feed, and removed feeds leave the schedule."""
+    reader: Reader = make_reader(str(tmp_path / "db.sqlite"), feed_root=str(tmp_path))
+    feed_urls: list[str] = [make_feed(tmp_path, f"account{number}", timedelta(hours=1)) for number in range(5)]
+    for feed_url in feed_urls:
+        reader.add_feed(feed_url)
+    update_due_feeds(reader)
+    assert set(get_schedule(reader)) == set(feed_urls)
+
+    tag_reads: list[object] = []
+    get_tag = reader.get_tag
+
+    def counting_get_tag(resource: object, *args: object) -> object:
+        tag_reads.append(resource)
+        return get_tag(resource, *args)  # type: ignore  # noqa: PGH003
+
+    monkeypatch.setattr(reader, "get_tag", counting_get_tag)
+    assert not get_due_feeds(reader, datetime.now(tz=timezone.utc))
+    assert tag_reads == [()]
+
+    # The schedule is written when feeds are checked, the new feed is due right away
+    reader.delete_feed(feed_urls[0])
+    new_feed: str = make_feed(tmp_path, "new", timedelta(hours=1))
+    reader.add_feed(new_feed)
+    update_due_feeds(reader)
+    assert set(get_schedule(reader)) == {*feed_urls[1:], new_feed}
@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from discord_twitter_webhooks.ratelimit import RateLimiter
+
+webhook_url: str = "https://discord.com/api/webhooks/1234/abcd"
+
+
+def test_waits_for_bucket_reset() -> None:
+    """Test that we wait for the bucket to reset instead of sending when there are no requests left."""
+
+    async def send_three() -> float:
+        rate_limiter = RateLimiter()
+        start: float = time.monotonic()
+
+        await rate_limiter.acquire(webhook_url)
+        rate_limiter.update(
+            webhook_url,
+            200,
+            {"X-RateLimit-Limit": "2", "X-RateLimit-Remaining": "1", "X-RateLimit-Reset-After": "0.3"},
+        )
+
+        # We have one request left, so this one should not wait
+        await rate_limiter.acquire(webhook_url)
+        assert time.monotonic() - start < 0.1  # noqa: PLR2004
+        rate_limiter.update(
+            webhook_url,
+            200,
+            {"X-RateLimit-Limit": "2", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "0.3"},
+        )
+
+        # The bucket is empty, so this one has to wait for the reset
+        await rate_limiter.acquire(webhook_url)
+        return time.monotonic() - start
+
+    assert asyncio.run(send_three()) >= 0.3  # noqa: PLR2004
+
+
+def test_global_rate_limit() -> None:
+    """Test that a global 429 pauses every webhook."""
+
+    async def send_after_global_429() -> float:
+        rate_limiter = RateLimiter()
+
+        await rate_limiter.acquire(webhook_url)
+        retry_after: float = rate_limiter.update(webhook_url, 429, {}, {"retry_after": 0.2, "global": True})
+        assert retry_after == 0.2  # noqa: PLR2004
+
+        start: float = time.monotonic()
+        await rate_limiter.acquire("https://discord.com/api/webhooks/5678/efgh")
+        return time.monotonic() - start
+
+    assert asyncio.run(send_after_global_429()) >= 0.15  # noqa: PLR2004
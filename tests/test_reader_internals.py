@@ -0,0 +1,32 @@
+import functools
+import sqlite3
+
+from reader import Reader, make_reader
+
+from discord_twitter_webhooks.avatars import _capture_avatar, avatar_plugin
+from discord_twitter_webhooks.nitter_pool import _mount_nitter_pool, nitter_pool_plugin
+
+
+def test_reader_internals_we_use_exist() -> None:
+    """Test the parts of reader that aren't public but that we use, so a reader upgrade can't break them silently.
+
+    If this fails after upgrading reader, the plugins in avatars.py and nitter_pool.py and ReadStateBatch.flush() in
+    send_to_discord.py have to be changed, and the version of reader in pyproject.toml updated.
+    """
+    reader: Reader = make_reader(":memory:", plugins=[nitter_pool_plugin, avatar_plugin])
+
+    # The plugins add hooks to the session reader fetches feeds with
+    session_factory = reader._parser.session_factory  # noqa: SLF001
+    assert _mount_nitter_pool in session_factory.request_hooks
+    assert any(
+        isinstance(hook, functools.partial) and hook.func is _capture_avatar for hook in session_factory.response_hooks
+    )
+    with session_factory.transient() as session:
+        assert callable(session.get)
+
+    # ReadStateBatch writes the read state and watermarks with reader's connection
+    db: sqlite3.Connection = reader._storage.get_db()  # noqa: SLF001
+    assert isinstance(db, sqlite3.Connection)
+    entry_columns: set[str] = {row[1] for row in db.execute("PRAGMA table_info(entries)")}
+    assert {"feed", "id", "read", "read_modified"} <= entry_columns
+    assert [row[1] for row in db.execute("PRAGMA table_info(feed_tags)")] == ["feed", "key", "value"]
@@ -0,0 +1,39 @@
+from dataclasses import replace
+
+import pytest
+from discord_webhook import DiscordWebhook
+from reader import Entry, Feed
+
+from discord_twitter_webhooks import send_to_discord
+from discord_twitter_webhooks._dataclasses import Group
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [{"link_destination": "Nitter"}, {"translate": True}, {"unescape_html": False}],
+)
+def test_render_cache_key_changes_with_settings(monkeypatch: pytest.MonkeyPatch, changes: dict) -> None:
+    """Test that groups with different render settings don't share the rendered message, and the same ones do."""
+    rendered: list[Group] = []
+
+    def render(_entry: Entry, group: Group) -> DiscordWebhook:
+        rendered.append(group)
+        return DiscordWebhook(url="")
+
+    monkeypatch.setitem(send_to_discord._renderers, "text", render)  # noqa: SLF001
+    send_to_discord.invalidate_render_cache()
+
+    entry = Entry(id="1", link="https://nitter.net/alice/status/1", feed=Feed(url="https://nitter.net/alice/rss"))
+    group = Group(uuid="first", link_destination="Twitter", translate=False, unescape_html=True)
+    same_settings: Group = replace(group, uuid="second")
+    other_settings: Group = replace(group, uuid="third", **changes)
+
+    webhook: DiscordWebhook = send_to_discord.get_rendered_webhook(entry, group, "text")
+    assert send_to_discord.get_rendered_webhook(entry, same_settings, "text") is webhook
+    assert send_to_discord.get_rendered_webhook(entry, other_settings, "text") is not webhook
+    assert [group.uuid for group in rendered] == ["first", "third"]
+
+    assert send_to_discord.render_fingerprint(group, "text") != send_to_discord.render_fingerprint(
+        other_settings,
+        "text",
+    )
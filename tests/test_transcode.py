@@ -0,0 +1,94 @@
+import os
+import subprocess
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+from discord_webhook import DiscordEmbed, DiscordWebhook
+
+from discord_twitter_webhooks import transcode
+from discord_twitter_webhooks.media_cache import MediaCache
+from discord_twitter_webhooks.media_workspace import MediaWorkspace
+from discord_twitter_webhooks.outbox import Outbox
+from discord_twitter_webhooks.transcode import SOURCE_PARAMETERS, Transcoder, attach_video
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from discord_twitter_webhooks.outbox import Delivery
+
+
+def _hang(video_file: str, gif_file: str, memory_limit: int, max_bytes: int) -> None:  # noqa: ARG001
+    """Start a process that runs forever like a stuck ffmpeg, and wait for it. Runs instead of _convert_to_gif()."""
+    os.setsid()
+    sleeper = subprocess.Popen(["sleep", "60"])  # noqa: S607
+    Path(os.environ["HANG_PID_FILE"]).write_text(str(sleeper.pid))
+    sleeper.wait()
+
+
+def running(pid: int) -> bool:
+    """Check if a process is running, a killed process nobody has waited for yet doesn't count."""
+    try:
+        return Path(f"/proc/{pid}/stat").read_text().split(") ")[1][0] != "Z"
+    except (FileNotFoundError, IndexError):
+        return False
+
+
+def test_cached_videos_that_are_too_big_are_not_read(tmp_path: "Path", monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the size of a cached video is checked before it is read."""
+    cache = MediaCache(tmp_path / "media", max_bytes=100)
+    cache.put("https://example.com/small.mp4", SOURCE_PARAMETERS, b"MP4")
+    cache.put("https://example.com/big.mp4", SOURCE_PARAMETERS, b"MP4" * 10)
+    transcoder = Transcoder(cache=cache, upload_limit=10, workspace=MediaWorkspace(tmp_path / "workspace", 100))
+
+    assert transcoder.original("https://example.com/small.mp4") == b"MP4"
+
+    def read(*_args: object) -> bytes:
+        pytest.fail("The video should not be read")
+
+    monkeypatch.setattr(MediaCache, "get", read)
+    assert transcoder.original("https://example.com/big.mp4") is None
+
+
+@pytest.mark.skipif(not Path("/proc/self").exists(), reason="Needs process groups and /proc")
+def test_stuck_conversions_are_killed(tmp_path: "Path", monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a conversion that takes too long is killed with what it started, and the message is still sent."""
+    monkeypatch.setenv("HANG_PID_FILE", str(tmp_path / "sleep.pid"))
+    monkeypatch.setattr(transcode, "_convert_to_gif", _hang)
+
+    cache = MediaCache(tmp_path / "media", max_bytes=100)
+    cache.put("https://example.com/stuck.mp4", SOURCE_PARAMETERS, b"MP4")
+    cache.put("https://example.com/small.mp4", SOURCE_PARAMETERS, b"MP4")
+    transcoder = Transcoder(workers=1, timeout=1, cache=cache, workspace=MediaWorkspace(tmp_path / "workspace", 100))
+    monkeypatch.setattr(transcode, "get_transcoder", lambda: transcoder)
+
+    outbox = Outbox(tmp_path / "outbox.db")
+    webhook = DiscordWebhook(url="")
+    webhook.add_embed(DiscordEmbed(description="Tweet", image={"url": "https://example.com/poster.jpg"}))
+    message_ids: list[int | None] = [
+        outbox.enqueue(webhook, ["https://example.com/1"], f"https://twitter.com/a/{number}", media_url=video_url)
+        for number, video_url in enumerate(["https://example.com/stuck.mp4", "https://example.com/small.mp4"])
+    ]
+
+    # Attaching doesn't wait for the conversion
+    start: float = time.monotonic()
+    attach_video(message_ids[0], "https://example.com/stuck.mp4", "gif", outbox)  # type: ignore  # noqa: PGH003
+    assert time.monotonic() - start < 0.5  # noqa: PLR2004
+    stuck: Future = transcoder.jobs["https://example.com/stuck.mp4", "gif"]
+
+    # The only worker is free again after the timeout, so the next video is attached
+    attach_video(message_ids[1], "https://example.com/small.mp4", "mp4", outbox)  # type: ignore  # noqa: PGH003
+    assert stuck.result(timeout=30) is None
+    assert not running(int((tmp_path / "sleep.pid").read_text()))
+
+    deadline: float = time.monotonic() + 10
+    deliveries: list[Delivery] = []
+    while len(deliveries) < 2 and time.monotonic() < deadline:  # noqa: PLR2004
+        deliveries += outbox.claim()
+        time.sleep(0.05)
+
+    # The stuck video is sent with the thumbnail, the other one as an MP4
+    files: dict[str, dict] = {delivery.entry_link: delivery.files for delivery in deliveries}
+    assert files == {"https://twitter.com/a/0": {}, "https://twitter.com/a/1": {"_video.mp4": ("video.mp4", b"MP4")}}
+    assert deliveries[0].payload["embeds"][0]["image"] == {"url": "https://example.com/poster.jpg"}
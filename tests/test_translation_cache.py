@@ -0,0 +1,63 @@
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+
+from discord_twitter_webhooks import translate
+from discord_twitter_webhooks.translate import translate_html
+from discord_twitter_webhooks.translation_cache import TranslationCache
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_translation_cache(tmp_path: "Path") -> None:
+    """Test that translations are kept for every language pair and survive a restart."""
+    cache = TranslationCache(tmp_path / "translations.db", max_bytes=1024 * 1024, ttl_seconds=60)
+    assert cache.get("<p>Hallo</p>", "auto", "en-US") is None
+
+    cache.put("<p>Hallo</p>", "auto", "en-US", "<p>Hello</p>")
+    assert cache.get("<p>Hallo</p>", "auto", "en-US") == "<p>Hello</p>"
+    assert cache.get("<p>Hallo</p>", "DE", "en-US") is None
+    assert cache.get("<p>Hallo</p>", "auto", "fr") is None
+
+    reopened = TranslationCache(tmp_path / "translations.db", max_bytes=1024 * 1024, ttl_seconds=60)
+    assert reopened.get("<p>Hallo</p>", "auto", "en-US") == "<p>Hello</p>"
+    assert reopened.size == cache.size
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3  # noqa: PLR2004
+    assert cache.stats()["saved_characters"] == len("<p>Hallo</p>")
+
+
+def test_translation_cache_eviction(tmp_path: "Path") -> None:
+    """Test that the translations we haven't used for the longest are removed, and old translations are not used."""
+    cache = TranslationCache(tmp_path / "translations.db", max_bytes=1024 * 1024, ttl_seconds=60)
+    for number in range(3):
+        cache.put(f"<p>{number}</p>", "auto", "en-US", "x" * 100)
+    cache.get("<p>0</p>", "auto", "en-US")
+
+    # Room for two translations, the second one was used the longest ago
+    cache.resize(cache.size * 2 // 3)
+    assert cache.get("<p>1</p>", "auto", "en-US") is None
+    assert cache.get("<p>0</p>", "auto", "en-US") is not None
+    assert cache.get("<p>2</p>", "auto", "en-US") is not None
+    assert cache.stats()["evictions"] == 1
+
+    cache.ttl_seconds = 0
+    time.sleep(0.01)
+    assert cache.get("<p>0</p>", "auto", "en-US") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_translate_html_uses_cache(tmp_path: "Path", monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that text that was already translated is not sent to DeepL again."""
+    cache = TranslationCache(tmp_path / "translations.db", max_bytes=1024 * 1024, ttl_seconds=60)
+    cache.put("<p>Hallo</p>", "auto", "en-US", "<p>Hello</p>")
+
+    def fail(*_args: object, **_kwargs: object) -> None:
+        msg = "DeepL should not be called"
+        raise AssertionError(msg)
+
+    monkeypatch.setattr(translate.deepl, "Translator", fail)
+    assert translate_html("<p>Hallo</p>", "auto", "en-US", cache=cache) == "<p>Hello</p>"
@@ -0,0 +1,43 @@
+import pytest
+
+from discord_twitter_webhooks._dataclasses import Group
+from discord_twitter_webhooks.tweet_text import convert_html_to_md
+
+# Nitter summaries and what the BeautifulSoup converter made of them
+SUMMARIES: list[tuple[str, str, str]] = [
+    (
+        (
+            '<p>Hello <a href="https://nitter.example/search?q=%23tag">#tag</a> from'
+            ' <a href="https://nitter.example/jack">@jack</a></p><img src="https://nitter.example/pic/a.jpg" />'
+        ),
+        "Hello [#tag](<https://twitter.com/hashtag/tag>) from [@jack](<https://twitter.com/jack>)",
+        "Hello [#tag](<https://nitter.example/search?q=%23tag>) from [@jack](<https://nitter.example/jack>)",
+    ),
+    (
+        (
+            '<p>Line one\nLine two &amp; three &lt;b&gt;</p>\n<p><a href="https://nitter.example/x/status/1#m">'
+            "nitter.example/x/status/1#m</a></p>"
+        ),
+        "Line one\nLine two & three <b>\n[nitter.example/x/status/1#m](<https://nitter.example/x/status/1#m>)",
+        "Line one\nLine two & three <b>\n[nitter.example/x/status/1#m](<https://nitter.example/x/status/1#m>)",
+    ),
+    (
+        (
+            '<p>Video</p><video poster="https://nitter.example/pic/t.jpg" controls="controls">'
+            '<source src="https://video.twimg.com/a.mp4" type="video/mp4"></video>'
+        ),
+        "Video",
+        "Video",
+    ),
+    ("<p>a<br>b</p><!-- comment -->after", "ab\nafter", "ab\nafter"),
+    ('<p><a href="x"><img src="y"></a> <a href="z"><span>in</span> span</a></p>', "[in span](<z>)", "[in span](<z>)"),
+    ("<p>a</p>\n\n<p>  </p>\n<pre> keep\n  this </pre>", "a\n \n keep\n  this", "a\n \n keep\n  this"),
+    ("", "", ""),
+]
+
+
+@pytest.mark.parametrize(("html", "twitter", "nitter"), SUMMARIES)
+def test_convert_html_to_md(html: str, twitter: str, nitter: str) -> None:
+    """Test that links, paragraphs and whitespace are converted like before."""
+    assert convert_html_to_md(html, Group(link_destination="Twitter")) == twitter
+    assert convert_html_to_md(html, Group(link_destination="Nitter")) == nitter
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import TYPE_CHECKING
+
+import pytest
+from reader import make_reader
+
+from discord_twitter_webhooks import send_to_discord
+from discord_twitter_webhooks._dataclasses import Group, Watermark, entry_published, get_watermark
+from discord_twitter_webhooks.outbox import Outbox
+
+if TYPE_CHECKING:
+    import sqlite3
+    from pathlib import Path
+
+    from reader import Entry, Reader
+
+    from discord_twitter_webhooks.outbox import Delivery
+
+NOW: datetime = datetime.now(tz=timezone.utc)
+
+
+def write_feed(tmp_path: "Path", items: dict[str, tuple[str, timedelta]]) -> str:
+    """Write a feed with the items, by ID, with their title and how long ago they were published."""
+    xml: str = "".join(
+        f"<item><title>{title}</title><link>https://nitter.net/alice/status/{entry_id}</link>"
+        f"<guid>{entry_id}</guid><pubDate>{format_datetime(NOW - age)}</pubDate></item>"
+        for entry_id, (title, age) in items.items()
+    )
+    (tmp_path / "alice.xml").write_text(f'<rss version="2.0"><channel><title>alice</title>{xml}</channel></rss>')
+    return "alice.xml"
+
+
+def send_unread(reader: "Reader") -> None:
+    """Send the unread entries like send_to_discord() does, without checking the feeds."""
+    read_state = send_to_discord.ReadStateBatch(reader)
+    try:
+        send_to_discord._send_entries(  # noqa: SLF001
+            reader,
+            sorted(reader.get_entries(read=False), key=entry_published),
+            read_state,
+        )
+    finally:
+        read_state.flush()
+
+
+def test_old_retweets_and_late_entries_are_sent(tmp_path: "Path", monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that only history from before we followed the feed is skipped, not retweets of old tweets."""
+    reader: Reader = make_reader(str(tmp_path / "db.sqlite"), feed_root=str(tmp_path))
+    sent: list[str] = []
+    monkeypatch.setattr(send_to_discord, "send_link", lambda entry, group: sent.append(entry.id))  # noqa: ARG005
+
+    feed_url: str = write_feed(
+        tmp_path,
+        {"1": ("First", timedelta(hours=3)), "2": ("Second", timedelta(hours=2)), "3": ("Third", timedelta(hours=1))},
+    )
+    reader.add_feed(feed_url)
+    reader.set_tag((), "groups", ["test_watermark"])
+    reader.set_tag(
+        (),
+        "test_watermark",
+        Group(uuid="test_watermark", rss_feeds=[feed_url], send_as_link=True, send_as_embed=False).__dict__,
+    )
+    reader.update_feeds()
+
+    # The first time we check the feed everything is history
+    send_unread(reader)
+    assert not sent
+
+    write_feed(
+        tmp_path,
+        {
+            "0": ("Ancient", timedelta(hours=10)),
+            "2": ("Second", timedelta(hours=2)),
+            "3": ("Third", timedelta(hours=1)),
+            # A retweet has the date of the tweet it retweets
+            "4": ("RT by @alice: Old tweet", timedelta(minutes=90)),
+            # A Nitter instance that was behind the others
+            "5": ("Late", timedelta(minutes=150)),
+            "6": ("New", timedelta(minutes=1)),
+        },
+    )
+    reader.update_feeds()
+    send_unread(reader)
+    assert sorted(sent) == ["4", "5", "6"]
+
+    # Old entries don't move the watermark back
+    entry: Entry = reader.get_entry((feed_url, "6"))
+    assert get_watermark(reader, feed_url).entry_id == entry.id
+    assert not list(reader.get_entries(read=False))
+
+
+def test_entries_are_not_sent_twice_after_a_crash(tmp_path: "Path", monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that entries that were put in the outbox before we crashed aren't put in it again."""
+    reader: Reader = make_reader(str(tmp_path / "db.sqlite"), feed_root=str(tmp_path))
+    outbox = Outbox(tmp_path / "outbox.db")
+    monkeypatch.setattr(send_to_discord, "get_outbox", lambda: outbox)
+
+    feed_url: str = write_feed(tmp_path, {"1": ("First", timedelta(hours=1))})
+    reader.add_feed(feed_url)
+    reader.set_tag((), "groups", ["test_crash"])
+    reader.set_tag(
+        (),
+        "test_crash",
+        Group(
+            uuid="test_crash",
+            rss_feeds=[feed_url],
+            webhooks=["https://example.com/1"],
+            send_as_link=True,
+            send_as_embed=False,
+        ).__dict__,
+    )
+    reader.update_feeds()
+    send_unread(reader)
+
+    write_feed(tmp_path, {"1": ("First", timedelta(hours=1)), "2": ("Second", timedelta(minutes=1))})
+    reader.update_feeds()
+
+    # We crash before the entries are marked as read, so the next check sends them again
+    send_to_discord._send_entries(  # noqa: SLF001
+        reader,
+        list(reader.get_entries(read=False)),
+        send_to_discord.ReadStateBatch(reader),
+    )
+    assert [entry.id for entry in reader.get_entries(read=False)] == ["2"]
+    send_unread(reader)
+
+    deliveries: list[Delivery] = outbox.claim()
+    assert [delivery.entry_link for delivery in deliveries] == ["https://nitter.net/alice/status/2"]
+    assert not list(reader.get_entries(read=False))
+
+
+def test_read_state_is_written_in_one_transaction(tmp_path: "Path") -> None:
+    """Test that flushing a batch commits once, however many entries and watermarks it has."""
+    reader: Reader = make_reader(str(tmp_path / "db.sqlite"), feed_root=str(tmp_path))
+    feed_url: str = write_feed(tmp_path, {str(number): ("Tweet", timedelta(minutes=number)) for number in range(50)})
+    reader.add_feed(feed_url)
+    reader.update_feeds()
+
+    read_state = send_to_discord.ReadStateBatch(reader)
+    for entry in reader.get_entries():
+        read_state.mark_as_read(entry)
+    read_state.set_watermark(feed_url, Watermark(published=NOW.isoformat(), entry_id="0", oldest=NOW.isoformat()))
+    read_state.set_watermark("https://nitter.example.com/removed/rss", Watermark())
+
+    statements: list[str] = []
+    db: sqlite3.Connection = reader._storage.get_db()  # noqa: SLF001
+    db.set_trace_callback(statements.append)
+    try:
+        read_state.flush()
+    finally:
+        db.set_trace_callback(None)
+
+    transactions: list[str] = [
+        statement.strip() for statement in statements if statement.strip() in {"BEGIN", "COMMIT"}
+    ]
+    assert transactions == ["BEGIN", "COMMIT"]
+    assert not list(reader.get_entries(read=False))
+    assert all(entry.read_modified is not None for entry in reader.get_entries())
+    assert get_watermark(reader, feed_url).entry_id == "0"
+    assert reader.get_tag(feed_url, "watermark")["oldest"] == NOW.isoformat()
@@ -0,0 +1,62 @@
+from discord_twitter_webhooks._dataclasses import Group
+from discord_twitter_webhooks.whitelist import (
+    KeywordAutomaton,
+    compile_keyword_matcher,
+    get_group_matchers,
+    invalidate_group_matchers,
+)
+
+
+def test_keyword_automaton() -> None:
+    """Test that the automaton finds the same words as the in operator."""
+    keywords: list[str] = ["he", "she", "his", "hers", "usher", "ushers", "a"]
+    automaton = KeywordAutomaton(keywords)
+
+    for text in ["ushers", "she sells", "hi", "HERS", "this is", "", "xyz", "uh", "ahishers"]:
+        assert automaton.search(text) == any(keyword in text for keyword in keywords), text
+
+    # Overlapping keywords where the match is only found by following a failure link
+    assert KeywordAutomaton(["abcd", "bc"]).search("abce")
+    assert not KeywordAutomaton(["abcd", "bcf"]).search("abcxbc")
+
+    # An empty keyword is in every string, just like with the in operator
+    assert KeywordAutomaton([""]).search("anything")
+
+
+def test_keyword_matcher() -> None:
+    """Test that words and regex patterns are case-insensitive and invalid patterns are ignored."""
+    matcher = compile_keyword_matcher(["Elon"], [r"\bspace\s?x\b", "(?i)tesla", "[invalid"])
+
+    assert matcher.matches("elon musk")
+    assert matcher.matches("Launching SpaceX")
+    assert matcher.matches("TESLA")
+    assert not matcher.matches("Nothing to see here")
+
+    assert not compile_keyword_matcher([], []).matches("Nothing to see here")
+
+
+def test_keyword_matcher_with_groups() -> None:
+    """Test that patterns with backreferences and named groups work when there are other patterns."""
+    assert compile_keyword_matcher([], [r"(a)\1", r"(b)\1"]).matches("bb")
+
+    matcher = compile_keyword_matcher([], [r"(?P<word>moon)\s(?P=word)", r"(?P<word>mars)", "spacex"])
+    assert len(matcher.patterns) == 3  # noqa: PLR2004
+    assert matcher.matches("To the moon moon")
+    assert matcher.matches("Mars")
+    assert matcher.matches("SpaceX")
+    assert not matcher.matches("To the moon")
+
+
+def test_group_matchers_are_recompiled_when_changed() -> None:
+    """Test that the cached matchers are only used while the lists are unchanged."""
+    group = Group(uuid="test_group_matchers", blacklist=["spam"])
+    matchers = get_group_matchers(group)
+
+    assert get_group_matchers(group) is matchers
+    assert matchers.blacklist.matches("This is SPAM")
+
+    group.blacklist = ["ham"]
+    assert not get_group_matchers(group).blacklist.matches("This is SPAM")
+
+    invalidate_group_matchers(group.uuid)
+    assert get_group_matchers(group) is not matchers